@@ -1,24 +1,42 @@
 from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-import requests
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, ValidationError
 import logging
 from typing import Optional, Dict, List, Union
-from contextlib import contextmanager
-from fuzzywuzzy import fuzz
-from db_config import get_db_connection
+from contextlib import contextmanager, asynccontextmanager
+from contextvars import ContextVar
+import asyncio
+from db_config import db_pool
+from llm_client import GeminiClient, LLMError
+from llm_gateway import CircuitBreaker, LLMGateway
 import os
-from data.sinonimos import CARRERAS_SINONIMOS
-from data.variaciones import CARRERAS_VARIACIONES
-from data.carreras import LISTA_COMPLETA_CARRERAS
-from data.horario import HORARIO_CARRERA
-from datetime import datetime
+from catalogo_snapshot import CatalogoCompartido
+from catalogo_cache import CatalogoCache, IdsCarreras
+from catalogo_indice import IndiceCatalogo, Recurso
+from documentos_indice import DocumentosCompartidos
+from response_cache import ResponseCache
+from intenciones import INTENCIONES_ACTIVAS, RouterIntenciones
+from history_writer import HistoryWriter
+from history_cache import HistoryCache
+from history_partitions import HistoryPartitions
+from history_summary import HistorySummaries, Resumen
+from migrations import DB_MIGRAR_AL_INICIAR, migrar
+from prompt_builder import PromptBuilder
+from single_flight import SingleFlight
+from readiness import Readiness
+from metrics import registro
+from http_cache import RangoNoSatisfacible, fecha_http, no_modificado, parsear_rango
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
 from fastapi import APIRouter
 import uuid
-import base64
-
-app = FastAPI()
-router = APIRouter()
+import io
+import csv
+import json
+import time
+import random
+import threading
 
 logging.basicConfig(
     level=logging.INFO,
@@ -26,6 +44,218 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Carreras, horarios y detector desde el snapshot binario compartido por los workers
+catalogo_compartido = CatalogoCompartido()
+catalogo_cache = CatalogoCache()
+ids_carreras = IdsCarreras(catalogo_cache)
+# Respuestas de /carreras por id_carrera, ya serializadas
+indice_catalogo = IndiceCatalogo(catalogo_cache, catalogo_compartido)
+response_cache = ResponseCache()
+history_writer = HistoryWriter()
+history_cache = HistoryCache()
+history_summaries = HistorySummaries()
+# Índice BM25 de los PDF de las carreras que publica documentos_indice.py
+documentos_compartidos = DocumentosCompartidos()
+history_partitions = HistoryPartitions()
+prompt_builder = PromptBuilder()
+# Consultas idénticas simultáneas comparten una sola ejecución
+catalogo_flight = SingleFlight("catalogo")
+indice_flight = SingleFlight("indice_catalogo")
+gemini_flight = SingleFlight("gemini")
+gemini_stream_flight = SingleFlight("gemini_stream")
+router_intenciones = RouterIntenciones.desde_configuracion() if INTENCIONES_ACTIVAS else None
+# Plantillas para responder con el catálogo cuando Gemini no está disponible
+plantillas_respaldo = router_intenciones or RouterIntenciones()
+readiness = Readiness()
+
+# Solo se lee el historial de los últimos días: con chat_history particionada, las particiones viejas no se tocan
+HISTORIAL_VENTANA_DIAS = float(os.getenv("HISTORIAL_VENTANA_DIAS", "30"))
+# Fracción de prompts que se registran completos en el log (0 los desactiva, 1 los registra todos)
+PROMPT_LOG_MUESTREO = float(os.getenv("PROMPT_LOG_MUESTREO", "0.01"))
+
+HTTP_PETICIONES = registro.contador(
+    "chatbot_http_peticiones_total", "Peticiones HTTP por método, ruta y código de estado", ("metodo", "ruta", "estado")
+)
+HTTP_DURACION = registro.histograma(
+    "chatbot_http_duracion_segundos", "Duración de las peticiones HTTP, incluido el envío del cuerpo", ("metodo", "ruta")
+)
+ETAPAS = registro.histograma(
+    "chatbot_etapa_duracion_segundos", "Duración de cada etapa del procesamiento de una petición", ("etapa",)
+)
+RESPUESTAS = registro.contador(
+    "chatbot_respuestas_total", "Respuestas del chat por origen", ("origen",)
+)
+PROMPT_TOKENS = registro.histograma(
+    "chatbot_prompt_tokens_estimados", "Tamaño estimado de los prompts enviados a Gemini",
+    buckets=(250, 500, 1000, 1500, 2000, 3000, 4000, 8000)
+)
+
+# Tamaño de cada lectura del contenido de un documento
+DOCUMENTO_CHUNK = int(os.getenv("DOCUMENTO_CHUNK", str(256 * 1024)))
+DOCUMENTO_CACHE_CONTROL = os.getenv("DOCUMENTO_CACHE_CONTROL", "public, max-age=3600")
+# El ETag permite revalidar barato; stale-while-revalidate deja a la CDN responder mientras revalida
+CATALOGO_CACHE_CONTROL = os.getenv("CATALOGO_CACHE_CONTROL", "public, max-age=300, stale-while-revalidate=86400")
+# Máximo de registros por petición en /pre-registro/batch
+PRE_REGISTRO_LOTE_MAX = int(os.getenv("PRE_REGISTRO_LOTE_MAX", "20000"))
+# Hilos para las consultas bloqueantes. Deben sobrar respecto del pool: si todos esperan una conexión,
+# no queda ninguno para devolver la que tiene reservada una petición (db_request_scope)
+API_HILOS = int(os.getenv("API_HILOS", str(max(32, 2 * db_pool.maxconn))))
+# Con Gemini caído se responde con el catálogo, así que por defecto no impide recibir tráfico
+LLM_REQUERIDO = os.getenv("LLM_REQUERIDO", "0") == "1"
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Crea los clientes y arranca las tareas de fondo; las dependencias se preparan sin demorar el inicio.
+
+    Mientras la preparación no termina, /readyz responde 503 y el balanceador
+    no envía tráfico a este worker.
+    """
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=API_HILOS, thread_name_prefix="api")
+    )
+    app.state.gemini = GeminiClient()
+    app.state.llm = LLMGateway(app.state.gemini)
+    readiness.registrar("db", lambda: run_db(precalentar_db), verificar=db_disponible)
+    readiness.registrar("catalogo", lambda: asyncio.to_thread(precalentar_catalogo))
+    readiness.registrar("gemini", app.state.gemini.precalentar, verificar=gemini_disponible, requerida=LLM_REQUERIDO)
+    catalogo_cache.iniciar_escucha()
+    history_writer.iniciar()
+    # Las actualizaciones de los resúmenes ceden el gateway a las peticiones que esperan
+    history_summaries.iniciar(app.state.llm.generar, ocupado=lambda: app.state.llm.en_cola > 0)
+    tareas = [asyncio.create_task(readiness.preparar())]
+    if catalogo_compartido.intervalo > 0:
+        # Los datos en caché incluyen horarios del snapshot anterior
+        tareas.append(asyncio.create_task(catalogo_compartido.vigilar(al_cambiar=catalogo_cache.invalidar)))
+    if history_partitions.intervalo > 0:
+        tareas.append(asyncio.create_task(history_partitions.vigilar()))
+    if documentos_compartidos.intervalo > 0:
+        tareas.append(asyncio.create_task(documentos_compartidos.vigilar()))
+    yield
+    for tarea in tareas:
+        tarea.cancel()
+    await history_summaries.detener()
+    await history_writer.detener()
+    await app.state.gemini.cerrar()
+    await asyncio.to_thread(catalogo_cache.detener_escucha)
+    response_cache.cerrar()
+    await asyncio.to_thread(db_pool.cerrar)
+
+class MedicionHTTP:
+    """Middleware ASGI que cuenta las peticiones y mide su duración hasta el último byte del cuerpo"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        inicio = time.perf_counter()
+        estado = 500
+
+        async def enviar(mensaje):
+            nonlocal estado
+            if mensaje["type"] == "http.response.start":
+                estado = mensaje["status"]
+            await send(mensaje)
+
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            # La plantilla de la ruta evita una serie por cada id; lo que no coincide con ninguna se agrupa
+            ruta = scope.get("route")
+            ruta = getattr(ruta, "path", "sin_ruta")
+            HTTP_PETICIONES.inc(metodo=scope["method"], ruta=ruta, estado=estado)
+            HTTP_DURACION.observar(time.perf_counter() - inicio, metodo=scope["method"], ruta=ruta)
+
+@registro.recolector
+def metricas_de_estado():
+    """Estado del pool de base de datos, de las cachés y de la escritura del historial"""
+    pool = db_pool.estadisticas()
+    yield (
+        "chatbot_db_pool_conexiones", "gauge", "Conexiones del pool de base de datos",
+        [({"estado": "en_uso"}, pool["en_uso"]), ({"estado": "max"}, pool["max"])]
+    )
+    caches = {
+        "catalogo": catalogo_cache.estadisticas(),
+        "respuestas": response_cache.estadisticas(),
+        "historial": history_cache.estadisticas()
+    }
+    yield (
+        "chatbot_cache_consultas_total", "counter", "Consultas a las cachés en memoria por resultado",
+        [
+            ({"cache": nombre, "resultado": resultado}, stats[resultado])
+            for nombre, stats in caches.items()
+            for resultado in ("hits", "misses")
+        ]
+    )
+    yield (
+        "chatbot_cache_entradas", "gauge", "Entradas (o sesiones) guardadas en cada caché",
+        [
+            ({"cache": "catalogo"}, caches["catalogo"]["entradas"]),
+            ({"cache": "respuestas"}, caches["respuestas"]["entradas"]),
+            ({"cache": "historial"}, caches["historial"]["sesiones"])
+        ]
+    )
+    resumenes = history_summaries.estadisticas()
+    yield (
+        "chatbot_resumen_sesiones_pendientes", "gauge", "Sesiones con intercambios aún no incorporados al resumen",
+        [({}, resumenes["sesiones_pendientes"])]
+    )
+    historial = history_writer.estadisticas()
+    yield (
+        "chatbot_historial_pendientes", "gauge", "Mensajes de chat_history aún no escritos",
+        [({}, historial["pendientes"])]
+    )
+    yield (
+        "chatbot_historial_escritura_errores_total", "counter", "Lotes de chat_history que fallaron al escribirse",
+        [({}, historial["errores"])]
+    )
+    yield (
+        "chatbot_historial_descartados_total", "counter", "Mensajes de chat_history descartados por no poder escribirse",
+        [({}, historial["descartados"])]
+    )
+    particiones = history_partitions.estadisticas()
+    yield (
+        "chatbot_historial_particiones_total", "counter", "Particiones de chat_history creadas y archivadas",
+        [({"accion": "creadas"}, particiones["creadas"]), ({"accion": "archivadas"}, particiones["archivadas"])]
+    )
+    yield (
+        "chatbot_historial_particion_default_filas", "gauge", "Mensajes que cayeron en la partición default",
+        [({}, particiones["en_default"])]
+    )
+    snapshot = catalogo_compartido.estadisticas()
+    yield (
+        "chatbot_catalogo_snapshot", "gauge", "Snapshot de catálogo en uso (la versión va en la etiqueta)",
+        [({"version": snapshot["version"]}, 1)]
+    )
+    yield (
+        "chatbot_catalogo_snapshot_recargas_total", "counter", "Recargas del snapshot de catálogo sin reiniciar",
+        [({}, snapshot["recargas"])]
+    )
+    preparacion = readiness.estadisticas()
+    yield (
+        "chatbot_dependencia_lista", "gauge", "1 si la dependencia terminó de prepararse al iniciar",
+        [({"dependencia": nombre}, int(lista)) for nombre, lista in preparacion["dependencias"].items()]
+    )
+    llm = getattr(app.state, "llm", None)
+    if llm is not None:
+        gateway = llm.estadisticas()
+        yield (
+            "chatbot_llm_llamadas", "gauge", "Llamadas a Gemini en vuelo y en espera en el gateway",
+            [({"estado": "en_vuelo"}, gateway["en_vuelo"]), ({"estado": "en_cola"}, gateway["en_cola"])]
+        )
+        yield (
+            "chatbot_llm_circuito_abierto", "gauge", "1 si el circuito de Gemini está abierto o semiabierto",
+            [({}, int(gateway["circuito"] != "cerrado"))]
+        )
+
+app = FastAPI(lifespan=lifespan)
+router = APIRouter()
+
+app.add_middleware(MedicionHTTP)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://192.168.0.93:3000", "http://localhost:3000"],
@@ -34,15 +264,42 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# API GEMINI
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY", "tu_api_key_de_gemini")
-GEMINI_API_URL = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent?key={GEMINI_API_KEY}"
-
-class DocumentoCarrera(BaseModel):
+class DocumentoMetadata(BaseModel):
+    """Datos de un documento sin su contenido; es lo que viaja en /chat y en la caché"""
     id: int
     nombre: str
-    contenido: str  
-    fecha_upload: datetime
+    fecha_upload: Optional[datetime] = None
+    tamano: Optional[int] = None
+
+class DocumentoModificado(Exception):
+    """El documento cambió o se borró mientras se enviaba"""
+
+class DocumentoContenido(DocumentoMetadata):
+    """Documento descargable: el contenido se lee por fragmentos solo cuando se pide"""
+    tamano: int
+
+    async def fragmentos(self, inicio: int, fin: int):
+        """Envía el contenido por fragmentos; cada lectura toma y devuelve una conexión del pool.
+
+        Cada lectura exige el mismo tamaño y fecha que se anunciaron en las
+        cabeceras. Si el documento cambió, la excepción corta la conexión en
+        lugar de terminar la respuesta con menos bytes que Content-Length.
+        """
+        posicion = inicio
+        while posicion <= fin:
+            longitud = min(DOCUMENTO_CHUNK, fin - posicion + 1)
+            with ETAPAS.medir(etapa="documento_fragmento"):
+                fragmento = await run_db(
+                    leer_fragmento_documento, self.id, posicion, longitud, self.tamano, self.fecha_upload
+                )
+            if len(fragmento) != longitud:
+                logger.error(
+                    f"El documento {self.id} cambió durante la descarga: "
+                    f"{posicion - inicio + len(fragmento)} de {fin - inicio + 1} bytes enviados"
+                )
+                raise DocumentoModificado(self.id)
+            yield fragmento
+            posicion += len(fragmento)
 
 class Message(BaseModel):
     message: str
@@ -52,7 +309,7 @@ class ChatMessage(BaseModel):
     role: str 
     content: str
     carrera_referencia: Optional[str] = None
-    documentos: Optional[List[DocumentoCarrera]] = None
+    documentos: Optional[List[DocumentoMetadata]] = None
 
 class ChatSession(BaseModel):
     session_id: str
@@ -64,13 +321,71 @@ class PreUsuarioCreate(BaseModel):
     celular: str
     carrera: str
 
+class PreRegistroLote(BaseModel):
+    """Leads de ferias o campañas; cada registro se valida por separado"""
+    registros: List[dict]
+    origen: Optional[str] = None
+
+class ReservaConexion:
+    """Conexión compartida por las consultas de un db_request_scope.
+
+    Las consultas corren en hilos que pueden seguir vivos cuando el ámbito
+    termina (el cliente se desconectó o se canceló la tarea). La conexión
+    vuelve al pool cuando el ámbito se cerró y ningún hilo la está usando,
+    así que nunca está a la vez en el pool y en uso. Una consulta que empieza
+    con el ámbito ya cerrado usa una conexión propia.
+    """
+
+    def __init__(self):
+        self.conn = None
+        self.en_uso = 0
+        self.cerrada = False
+        self._lock = threading.Lock()
+
+    def tomar(self):
+        """La conexión reservada (la obtiene en la primera consulta) o None si el ámbito ya terminó"""
+        with self._lock:
+            if self.cerrada:
+                return None
+            if self.conn is None:
+                self.conn = db_pool.obtener()
+            self.en_uso += 1
+            return self.conn
+
+    def soltar(self):
+        with self._lock:
+            self.en_uso -= 1
+            conn = self._para_liberar()
+        if conn is not None:
+            db_pool.liberar(conn)
+
+    def cerrar(self):
+        with self._lock:
+            self.cerrada = True
+            conn = self._para_liberar()
+        if conn is not None:
+            db_pool.liberar(conn)
+
+    def _para_liberar(self):
+        if not self.cerrada or self.en_uso or self.conn is None:
+            return None
+        conn, self.conn = self.conn, None
+        return conn
+
+# Conexión reservada para el ámbito de la petición actual (ver db_request_scope)
+_conexion_request: ContextVar = ContextVar("conexion_request", default=None)
+
 @contextmanager
 def get_db_cursor():
     """Manejador de contexto para cursores de base de datos"""
+    reserva = _conexion_request.get()
+    conn_request = None
     conn = None
     cursor = None
     try:
-        conn = get_db_connection()
+        if reserva is not None:
+            conn_request = reserva.tomar()
+        conn = conn_request or db_pool.obtener()
         cursor = conn.cursor()
         yield cursor
         conn.commit()
@@ -85,114 +400,106 @@ def get_db_cursor():
     finally:
         if cursor:
             cursor.close()
-        if conn:
-            conn.close()
+        if conn_request is not None:
+            reserva.soltar()
+        elif conn:
+            db_pool.liberar(conn)
 
-def obtener_documentos_carrera(cursor, nombre_carrera: str) -> List[DocumentoCarrera]:
-    """Obtiene todos los documentos asociados a una carrera por nombre"""
+@asynccontextmanager
+async def db_request_scope():
+    """Comparte una sola conexión del pool entre todas las consultas del bloque.
+
+    La conexión se toma en la primera consulta, así que un bloque resuelto
+    solo con cachés no ocupa ninguna. No debe envolver la llamada a Gemini:
+    la conexión quedaría ocupada mientras se espera al modelo.
+    """
+    reserva = ReservaConexion()
+    token = _conexion_request.set(reserva)
     try:
-        # Primero obtenemos el ID de la carrera
-        cursor.execute("""
-            SELECT id_carrera FROM carrera 
-            WHERE LOWER(nombre) LIKE LOWER(%s)
-            LIMIT 1
-        """, (f"%{nombre_carrera}%",))
-        carrera_result = cursor.fetchone()
-        
-        if not carrera_result:
-            return []
+        yield
+    finally:
+        _conexion_request.reset(token)
+        # Si un hilo sigue usando la conexión, la devuelve él al terminar
+        await asyncio.to_thread(reserva.cerrar)
 
-        id_carrera = carrera_result['id_carrera']
+async def run_db(func, *args, **kwargs):
+    """Ejecuta una función bloqueante de base de datos fuera del event loop"""
+    return await asyncio.to_thread(func, *args, **kwargs)
 
-        # Luego obtenemos los documentos asociados
+def obtener_documentos_carrera(cursor, id_carrera: int) -> List[DocumentoMetadata]:
+    """Obtiene los metadatos de los documentos asociados a una carrera"""
+    try:
+        # octet_length no lee el contenido
         cursor.execute("""
-            SELECT id, nombre, contenido, fecha_upload
+            SELECT id, nombre, fecha_upload, octet_length(contenido) AS tamano
             FROM documentos
-            WHERE id = %s
-            ORDER BY fecha_upload DESC
+            WHERE id_carrera = %s
+            ORDER BY fecha_upload DESC NULLS LAST
         """, (id_carrera,))
         
-        documentos = []
-        for row in cursor.fetchall():
-            # Asegurarnos de que el contenido existe antes de convertirlo
-            contenido_base64 = base64.b64encode(row['contenido']).decode('utf-8') if row['contenido'] else None
-            documentos.append(
-                DocumentoCarrera(
-                    id=row['id'],
-                    nombre=row['nombre'],
-                    contenido=contenido_base64,
-                    fecha_upload=row['fecha_upload']
-                )
-            )
-        return documentos
+        return [DocumentoMetadata(**row) for row in cursor.fetchall()]
         
     except Exception as e:
         logger.error(f"Error al obtener documentos: {str(e)}")
         return []
 
-def query_carrera(nombre_carrera: str) -> Optional[dict]:
+def cargar_ids_carreras():
+    """Resuelve una vez los nombres de las carreras a id_carrera"""
+    with get_db_cursor() as cursor:
+        ids_carreras.cargar(cursor)
+
+def consultar_carrera_db(nombre_carrera: str) -> Optional[dict]:
     """Consulta información de carrera en la base de datos incluyendo documentos y horarios"""
     with get_db_cursor() as cursor:
-        try:
-            # Consulta información básica de la carrera
-            cursor.execute("""
-                SELECT c.*, p.descripcion
-                FROM carrera c
-                LEFT JOIN perfil_profesional p ON c.id_carrera = p.id_carrera
-                WHERE LOWER(c.Nombre) LIKE LOWER(%s)
-                LIMIT 1
-            """, (f"%{nombre_carrera}%",))
-            
-            results = cursor.fetchall()
-            if not results:
-                return None
-                
-            carrera_data = results[0]
-            
-            # Obtiene documentos asociados
-            documentos = obtener_documentos_carrera(cursor, nombre_carrera)
-            
-            # Obtiene horarios de la carrera
-            horarios = HORARIO_CARRERA.get(carrera_data['nombre'].upper(), {})
-            
-            return {
-                **carrera_data,
-                "documentos": documentos,
-                "horarios": horarios
-            }
-            
-        except Exception as e:
-            logger.error(f"Error en consulta de carrera: {str(e)}")
+        id_carrera = ids_carreras.resolver(cursor, nombre_carrera)
+        if id_carrera is None:
             return None
 
+        # Consulta información básica de la carrera por clave primaria
+        cursor.execute("""
+            SELECT c.*, p.descripcion
+            FROM carrera c
+            LEFT JOIN perfil_profesional p ON c.id_carrera = p.id_carrera
+            WHERE c.id_carrera = %s
+            LIMIT 1
+        """, (id_carrera,))
+        
+        carrera_data = cursor.fetchone()
+        if not carrera_data:
+            return None
+        
+        # Obtiene documentos asociados
+        documentos = obtener_documentos_carrera(cursor, id_carrera)
+        
+        # Obtiene horarios de la carrera (el snapshot los indexa por nombre normalizado)
+        horarios = catalogo_compartido.horarios_de(carrera_data['nombre'])
+        
+        return {
+            **carrera_data,
+            "documentos": documentos,
+            "horarios": horarios
+        }
+
+def query_carrera(nombre_carrera: str) -> Optional[dict]:
+    """Información de la carrera desde la caché del catálogo o, si no está, desde la base de datos"""
+    try:
+        return catalogo_cache.obtener(nombre_carrera, lambda: consultar_carrera_db(nombre_carrera))
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error en consulta de carrera: {str(e)}")
+        return None
+
+async def obtener_carrera(nombre_carrera: str) -> Optional[dict]:
+    """Como query_carrera, sin salir del event loop si está en caché y con una sola consulta por carrera en curso"""
+    encontrado, db_data = catalogo_cache.consultar(nombre_carrera)
+    if encontrado:
+        return db_data
+    return await catalogo_flight.ejecutar(nombre_carrera, lambda: run_db(query_carrera, nombre_carrera))
+
 def detectar_carrera_solicitada(texto: str) -> Optional[str]:
     """Detecta carreras con variaciones y sinónimos"""
-    texto = texto.lower()
-    
-    if any(palabra in texto for palabra in ["carreras", "disponibles", "ofrecen", "tienen", "qué estudiar", "qué carreras"]):
-        return "LISTA_CARRERAS"
-    
-    for sinonimo, carrera in CARRERAS_SINONIMOS.items():
-        if sinonimo in texto:
-            return carrera
-    
-    for carrera, variaciones in CARRERAS_VARIACIONES.items():
-        if carrera in texto:
-            return carrera
-        for variacion in variaciones:
-            if variacion in texto:
-                return carrera
-    
-    best_match = None
-    highest_score = 0
-    
-    for carrera in CARRERAS_VARIACIONES.keys():
-        score = fuzz.token_set_ratio(texto, carrera)
-        if score > highest_score and score > 60:
-            highest_score = score
-            best_match = carrera
-    
-    return best_match
+    return catalogo_compartido.detector.detectar(texto).carrera
 
 def generar_sugerencia(texto: str) -> str:
     texto = texto.lower()
@@ -223,104 +530,267 @@ def save_chat_message(session_id: str, message: ChatMessage):
             (session_id, message.role, message.content, message.carrera_referencia)
         )
 
-def get_chat_history(session_id: str, limit: int = 5) -> List[ChatMessage]:
-    """Obtiene el historial de chat para una sesión"""
+def leer_historial_db(session_id: str, limit: int) -> List[ChatMessage]:
+    """Lee el historial de la base de datos, incluidos los mensajes aún no escritos"""
+    # La fecha va como literal en la consulta, así Postgres descarta las particiones viejas al planificarla
+    desde = datetime.now() - timedelta(days=HISTORIAL_VENTANA_DIAS) if HISTORIAL_VENTANA_DIAS > 0 else datetime.min
     with get_db_cursor() as cursor:
         cursor.execute(
             """
-            SELECT role, content, carrera_referencia
+            SELECT role, content, carrera_referencia, timestamp
             FROM chat_history
-            WHERE session_id = %s
+            WHERE session_id = %s AND timestamp >= %s
             ORDER BY timestamp DESC
             LIMIT %s
             """,
-            (session_id, limit)
+            (session_id, desde, limit)
         )
-        return [
-            ChatMessage(
-                role=row['role'],
-                content=row['content'],
-                carrera_referencia=row['carrera_referencia']
-            )
-            for row in cursor.fetchall()
-        ]
+        filas = cursor.fetchall()
 
-def generate_prompt(user_message: str, db_data: Optional[dict], chat_history: List[ChatMessage] = None) -> str:
-    """Genera el prompt contextualizado para Gemini con historial de chat"""
-    base_context = """
-Eres Sara, la asesora virtual de la Universidad Bolivariana del Ecuador. Tu estilo es profesional, cálido y detallado, brindando respuestas claras, precisas y acogedoras para que los usuarios se sientan escuchados y bien atendidos.
+    # Un lote recién escrito puede aparecer en ambas fuentes mientras se quita de pendientes.
+    # Se compara por epoch para no mezclar fechas con y sin zona horaria.
+    vistos = {(row['timestamp'].timestamp(), row['role'], row['content']) for row in filas}
+    pendientes = [
+        {"role": m.role, "content": m.content, "carrera_referencia": m.carrera_referencia, "timestamp": m.timestamp}
+        for m in history_writer.pendientes(session_id)
+        if (m.timestamp.timestamp(), m.role, m.content) not in vistos
+    ]
+    if pendientes:
+        filas = sorted(
+            [*filas, *pendientes],
+            key=lambda row: row['timestamp'].timestamp(),
+            reverse=True
+        )[:limit]
 
-Tu misión:
-
-Guiarlos con información relevante sobre carreras, beneficios y procesos de la universidad.
-
-Destacar las ventajas de estudiar en la UBE:
-
-Excelencia académica con profesores especializados.
+    return [
+        ChatMessage(
+            role=row['role'],
+            content=row['content'],
+            carrera_referencia=row['carrera_referencia']
+        )
+        for row in filas
+    ]
 
-Infraestructura moderna y ambientes de aprendizaje óptimos.
+def cargar_historial(session_id: str, limit: int) -> List[ChatMessage]:
+    """Lee el historial de la base de datos y deja cargado el buffer en memoria de la sesión"""
+    if limit > history_cache.capacidad:
+        return leer_historial_db(session_id, limit)
+    generacion = history_cache.iniciar_carga(session_id)
+    try:
+        mensajes = leer_historial_db(session_id, history_cache.capacidad)
+    except Exception:
+        history_cache.cancelar_carga(session_id)
+        raise
+    history_cache.completar_carga(session_id, generacion, mensajes)
+    return mensajes[:limit]
 
-Oportunidades de prácticas y vinculación laboral.
+def get_chat_history(session_id: str, limit: int = 5) -> List[ChatMessage]:
+    """Obtiene el historial de chat para una sesión, desde el buffer en memoria si está cargado"""
+    en_memoria = history_cache.leer(session_id, limit)
+    if en_memoria is not None:
+        return en_memoria
+    return cargar_historial(session_id, limit)
 
-Formación integral con valores sociales y compromiso comunitario.
+async def guardar_mensaje(session_id: str, message: ChatMessage):
+    """Encola el mensaje para escritura por lotes; si la cola no está activa lo inserta directamente"""
+    if history_writer.activo:
+        await history_writer.encolar(session_id, message.role, message.content, message.carrera_referencia)
+    else:
+        await run_db(save_chat_message, session_id, message)
+    history_cache.agregar(session_id, message)
 
-Cuando pregunten por carreras:
+async def guardar_respuesta(contexto: dict, contenido: str):
+    """Guarda la respuesta del asistente y programa la actualización del resumen de la sesión"""
+    await guardar_mensaje(contexto["session_id"], mensaje_asistente(contexto, contenido))
+    history_summaries.programar(contexto["session_id"], contexto["mensaje"], contenido)
 
-Proporciona un listado organizado (por áreas o facultades).
+def leer_resumen(session_id: str) -> Resumen:
+    with get_db_cursor() as cursor:
+        return history_summaries.leer(cursor, session_id)
 
-Pregunta amablemente: "¿Te gustaría más detalles sobre alguna carrera en particular? Estoy aquí para ayudarte".
+async def obtener_resumen(session_id: str) -> Optional[Resumen]:
+    """Resumen de la sesión, o None si los resúmenes no están habilitados"""
+    if not history_summaries.habilitado:
+        return None
+    resumen = history_summaries.en_cache(session_id)
+    if resumen is None:
+        resumen = await run_db(leer_resumen, session_id)
+    return resumen
 
-Recuerda:
+def generate_prompt(user_message: str, db_data: Optional[dict], chat_history: List[ChatMessage] = None) -> str:
+    """Genera el prompt contextualizado para Gemini con historial de chat"""
+    return prompt_builder.construir(user_message, db_data, chat_history).texto
 
-Usa emojis para dar calidez y dinamismo (pero sin exceso).
+def documentos_respuesta(db_data: Optional[dict]) -> Optional[List[dict]]:
+    """Metadatos de los documentos que se envían al frontend"""
+    if not db_data:
+        return None
+    return [
+        {
+            "id": doc.id,
+            "nombre": doc.nombre,
+            "fecha_upload": doc.fecha_upload.isoformat() if doc.fecha_upload else None
+        }
+        for doc in db_data.get('documentos', [])
+    ]
 
-Evita presentarte a menos que sea necesario (ya conocen tu nombre y rol).
+async def preparar_chat(message: Message) -> dict:
+    """Guarda el mensaje del usuario y decide la respuesta.
 
-Siempre agradece y motiva a seguir explorando la UBE.
-Recuerda siempre basate en información de Ecuador.
-Y finalle comentas los veneficios de la UBE.
-"""
+    Devuelve la respuesta directa en "respuesta" cuando no hace falta Gemini
+    (listado de carreras, consulta no entendida o pregunta factual resuelta
+    por el router de intenciones); en otro caso, el prompt.
+    """
+    session_id = message.session_id if message.session_id else str(uuid.uuid4())
+    if not message.session_id:
+        history_cache.crear(session_id)
+        history_summaries.crear(session_id)
     
-    history_context = ""
-    if chat_history:
-        history_context = "\n\nHistorial reciente de la conversación:\n"
-        for msg in reversed(chat_history):  
-            role = "Usuario" if msg.role == "user" else "Sara"
-            history_context += f"{role}: {msg.content}\n"
+    with ETAPAS.medir(etapa="detectar"):
+        carrera_detectada = detectar_carrera_solicitada(message.message)
+    user_msg = ChatMessage(
+        role="user",
+        content=message.message,
+        carrera_referencia=carrera_detectada if carrera_detectada != "LISTA_CARRERAS" else None
+    )
+    contexto = {
+        "session_id": session_id,
+        "mensaje": message.message,
+        "carrera": None,
+        "db_data": None,
+        "prompt": None,
+        "cache_key": None,
+        "respuesta": None,
+        "origen": None
+    }
+
+    async with db_request_scope():
+        with ETAPAS.medir(etapa="guardar_mensaje"):
+            await guardar_mensaje(session_id, user_msg)
     
-    if db_data is None:
-        return f"""{base_context}{history_context}
-        
-Usuario: {user_message}
-Sara:"""
+        with ETAPAS.medir(etapa="historial"):
+            chat_history = history_cache.leer(session_id, 5)
+            if chat_history is None:
+                chat_history = await run_db(cargar_historial, session_id, 5)
+            resumen = await obtener_resumen(session_id)
     
-    # Sección para horarios
-    horarios_info = ""
-    if db_data.get('horarios'):
-        horarios_info = "\n\nHorarios disponibles:\n"
-        for nivel, info_horario in db_data['horarios'].items():
-            horarios_info += f"- {nivel}: {info_horario.get('dias', '')} de {info_horario.get('horario', '')}\n"
+        if carrera_detectada == "LISTA_CARRERAS":
+            carreras_formateadas = "\n- ".join(catalogo_compartido.carreras)
+            contexto["respuesta"] = f"¡Estas son las carreras que ofrecemos:\n\n- {carreras_formateadas}\n\n¿Te gustaría que te brinde más información sobre alguna en particular?"
+            contexto["origen"] = "lista"
+            return contexto
     
-    documentos_info = ""
-    if db_data.get('documentos'):
-        doc_names = [doc.nombre for doc in db_data['documentos']]
-        documentos_info = f"\n\nDocumentos disponibles: {', '.join(doc_names)}. Puedes hacer clic para descargarlos."
+        if not carrera_detectada:
+            sugerencia = generar_sugerencia(message.message)
+            carreras_lista = "\n- ".join(catalogo_compartido.carreras)
+            contexto["respuesta"] = (
+                f"Lo siento, no entendí completamente tu consulta.{sugerencia}\n\n"
+                f"Estas son las carreras sobre las que puedo brindarte información:\n- {carreras_lista}\n\n"
+                f"¿Sobre cuál te gustaría conocer más?"
+            )
+            contexto["origen"] = "no_entendido"
+            return contexto
     
-    carrera_info = f"""
-Información de la carrera {db_data.get('nombre', '')}:
-- Modalidad: {db_data.get('modalidad', '')}
-- Duración: {db_data.get('semestre', '')} semestres
-- Costos:
-  * Inscripción: ${db_data.get('inscripción', '')}
-  * PRE: ${db_data.get('pre', '')}
-  * Matrícula: ${db_data.get('matrícula', '')}
-  * Cuotas mensuales: ${db_data.get('cuotas_mensuales', '')}
-- Perfil profesional: {db_data.get('descripcion', '')}
-{horarios_info}
-{documentos_info}
-"""
+        with ETAPAS.medir(etapa="catalogo"):
+            db_data = await obtener_carrera(carrera_detectada)
+
+    contexto.update(carrera=carrera_detectada, db_data=db_data)
+
+    if router_intenciones:
+        with ETAPAS.medir(etapa="intenciones"):
+            respuesta_directa = router_intenciones.responder(message.message, db_data)
+        if respuesta_directa is not None:
+            contexto["respuesta"] = respuesta_directa
+            contexto["origen"] = "plantilla"
+            return contexto
     
-    return f"{base_context}{history_context}\n\n{carrera_info}\n\nUsuario: {user_message}\nSara:"
+    # El historial ya incluye el mensaje actual (el más reciente); el prompt y la clave usan solo los turnos previos
+    turnos_previos = chat_history[1:] if chat_history and chat_history[0].content == message.message else chat_history
+    texto_resumen = resumen.texto if resumen else None
+    if texto_resumen:
+        # Lo anterior ya está en el resumen
+        turnos_previos = resumen.recientes(turnos_previos)
+    with ETAPAS.medir(etapa="documentos"):
+        fragmentos = documentos_compartidos.buscar(db_data.get("id_carrera") if db_data else None, message.message)
+    with ETAPAS.medir(etapa="prompt"):
+        prompt = prompt_builder.construir(
+            message.message, db_data, turnos_previos, resumen=texto_resumen, fragmentos=fragmentos
+        )
+    registrar_prompt(session_id, carrera_detectada, prompt)
+
+    historial_clave = [(msg.role, msg.content) for msg in turnos_previos]
+    if texto_resumen:
+        historial_clave.insert(0, ("resumen", texto_resumen))
+    contexto.update(
+        prompt=prompt,
+        cache_key=response_cache.clave(
+            message.message, carrera_detectada, db_data, historial_clave, [f.texto for f in fragmentos]
+        )
+    )
+    return contexto
+
+def registrar_prompt(session_id: str, carrera: Optional[str], prompt):
+    """Registra el tamaño de cada prompt y, para una muestra, el texto completo como JSON"""
+    PROMPT_TOKENS.observar(prompt.tokens)
+    muestreado = random.random() < PROMPT_LOG_MUESTREO
+    if not muestreado and not logger.isEnabledFor(logging.DEBUG):
+        return
+    datos = {
+        "evento": "prompt",
+        "session_id": session_id,
+        "carrera": carrera,
+        "tokens_estimados": prompt.tokens,
+        "caracteres": len(prompt.texto)
+    }
+    if muestreado:
+        datos["prompt"] = prompt.texto
+        logger.info(json.dumps(datos, ensure_ascii=False))
+    else:
+        logger.debug(json.dumps(datos, ensure_ascii=False))
+
+async def generar_respuesta(contexto: dict) -> str:
+    """Llama a Gemini y guarda la respuesta en la caché; la ejecuta una sola vez por clave en curso"""
+    inicio = time.perf_counter()
+    texto = await app.state.llm.generar(contexto["prompt"].contenido, prefijo=contexto["prompt"].prefijo)
+    await asyncio.to_thread(response_cache.guardar, contexto["cache_key"], texto, time.perf_counter() - inicio)
+    return texto
+
+async def generar_respuesta_stream(contexto: dict):
+    """Versión por fragmentos de generar_respuesta; guarda la respuesta completa al terminar"""
+    inicio = time.perf_counter()
+    fragmentos = []
+    async for texto in app.state.llm.generar_stream(contexto["prompt"].contenido, prefijo=contexto["prompt"].prefijo):
+        fragmentos.append(texto)
+        yield texto
+    await asyncio.to_thread(
+        response_cache.guardar, contexto["cache_key"], "".join(fragmentos), time.perf_counter() - inicio
+    )
+
+def respuesta_degradada(contexto: dict, texto: str, error: LLMError) -> str:
+    """Respuesta con los datos del catálogo cuando Gemini falla o el gateway no lo llama"""
+    RESPUESTAS.inc(origen="degradada")
+    logger.warning(f"Respuesta sin Gemini para {contexto['carrera']}: {str(error)}")
+    resumen = plantillas_respaldo.resumen(contexto["db_data"])
+    if resumen:
+        return (
+            "En este momento no puedo elaborar una respuesta más completa, "
+            f"pero esta es la información principal de la carrera:\n\n{resumen}"
+        )
+    carreras_lista = "\n- ".join(catalogo_compartido.carreras)
+    return (
+        f"En este momento no puedo responder tu consulta.{generar_sugerencia(texto)}\n\n"
+        f"Estas son las carreras sobre las que puedo brindarte información:\n- {carreras_lista}\n\n"
+        f"Por favor, intenta de nuevo en unos minutos."
+    )
+
+def mensaje_asistente(contexto: dict, contenido: str) -> ChatMessage:
+    db_data = contexto["db_data"]
+    return ChatMessage(
+        role="assistant",
+        content=contenido,
+        carrera_referencia=contexto["carrera"],
+        documentos=db_data.get('documentos') if db_data else None
+    )
 
 @app.post("/chat")
 async def chat(message: Message):
@@ -328,112 +798,69 @@ async def chat(message: Message):
     try:
         logger.info(f"Mensaje recibido: {message.message}")
         
-        session_id = message.session_id if message.session_id else str(uuid.uuid4())
-        
-        carrera_detectada = detectar_carrera_solicitada(message.message)
-        user_msg = ChatMessage(
-            role="user",
-            content=message.message,
-            carrera_referencia=carrera_detectada if carrera_detectada != "LISTA_CARRERAS" else None
-        )
-        save_chat_message(session_id, user_msg)
-        
-        chat_history = get_chat_history(session_id)
-        
-        if carrera_detectada == "LISTA_CARRERAS":
-            carreras_formateadas = "\n- ".join(LISTA_COMPLETA_CARRERAS)
-            response = {
-                "response": f"¡Estas son las carreras que ofrecemos:\n\n- {carreras_formateadas}\n\n¿Te gustaría que te brinde más información sobre alguna en particular?",
-                "session_id": session_id,
-                "documentos": None
-            }
+        contexto = await preparar_chat(message)
+        session_id = contexto["session_id"]
 
-            assistant_msg = ChatMessage(
-                role="assistant",
-                content=response["response"],
-                carrera_referencia=None,
-                documentos=None
-            )
-            save_chat_message(session_id, assistant_msg)
-            return response
-        
-        if not carrera_detectada:
-            sugerencia = generar_sugerencia(message.message)
-            carreras_lista = "\n- ".join(LISTA_COMPLETA_CARRERAS)
-            response = {
-                "response": f"Lo siento, no entendí completamente tu consulta.{sugerencia}\n\n"
-                          f"Estas son las carreras sobre las que puedo brindarte información:\n- {carreras_lista}\n\n"
-                          f"¿Sobre cuál te gustaría conocer más?",
+        db_data = contexto["db_data"]
+
+        if contexto["respuesta"] is not None:
+            RESPUESTAS.inc(origen=contexto["origen"])
+            with ETAPAS.medir(etapa="guardar_respuesta"):
+                await guardar_respuesta(contexto, contexto["respuesta"])
+            return {
+                "response": contexto["respuesta"],
                 "session_id": session_id,
-                "documentos": None
+                "documentos": documentos_respuesta(db_data),
+                "horarios": db_data.get('horarios') if db_data else None
             }
-       
-            assistant_msg = ChatMessage(
-                role="assistant",
-                content=response["response"],
-                carrera_referencia=None,
-                documentos=None
-            )
-            save_chat_message(session_id, assistant_msg)
-            return response
-        
-        db_data = query_carrera(carrera_detectada)
-        
-        prompt = generate_prompt(message.message, db_data, chat_history)
-        logger.info(f"Prompt generado: {prompt}")
-        
-        payload = {
-            "contents": [{
-                "parts": [{"text": prompt}]
-            }],
-            "generationConfig": {
-                "temperature": 0.7,
-                "topP": 0.9,
-                "maxOutputTokens": 1024
-            }
-        }
-        
-        response = requests.post(
-            GEMINI_API_URL,
-            json=payload,
-            headers={"Content-Type": "application/json"},
-            timeout=30
-        )
-        response.raise_for_status()
-      
-        data = response.json()
-        bot_response = data["candidates"][0]["content"]["parts"][0]["text"]
+
+        with ETAPAS.medir(etapa="cache_respuestas"):
+            bot_response = response_cache.obtener(contexto["cache_key"])
+        if bot_response is None:
+            try:
+                with ETAPAS.medir(etapa="gemini"):
+                    bot_response = await gemini_flight.ejecutar(
+                        contexto["cache_key"], lambda: generar_respuesta(contexto)
+                    )
+            except LLMError as e:
+                bot_response = respuesta_degradada(contexto, message.message, e)
+            else:
+                RESPUESTAS.inc(origen="gemini")
+        else:
+            RESPUESTAS.inc(origen="cache")
         
         response_data = {
             "response": bot_response,
             "session_id": session_id,
-            "documentos": [
-                {
-                    "id": doc.id,
-                    "nombre": doc.nombre,
-                    "fecha_upload": doc.fecha_upload.isoformat()
-                }
-                for doc in db_data.get('documentos', [])
-            ] if db_data else None,
+            "documentos": documentos_respuesta(db_data),
             "horarios": db_data.get('horarios') if db_data else None
         }
 
-        assistant_msg = ChatMessage(
-            role="assistant",
-            content=bot_response,
-            carrera_referencia=carrera_detectada if carrera_detectada != "LISTA_CARRERAS" else None,
-            documentos=db_data.get('documentos') if db_data else None
-        )
-        save_chat_message(session_id, assistant_msg)
+        with ETAPAS.medir(etapa="guardar_respuesta"):
+            await guardar_respuesta(contexto, bot_response)
         
         return response_data
         
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Error en Gemini API: {str(e)}")
+    except Exception as e:
+        logger.error(f"Error inesperado: {str(e)}", exc_info=True)
         raise HTTPException(
-            status_code=502,
-            detail="Error al comunicarse con el servicio de IA"
+            status_code=500,
+            detail="Ocurrió un error al procesar tu mensaje"
         )
+
+def evento_sse(evento: str, data: dict) -> str:
+    return f"event: {evento}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+@app.post("/chat/stream")
+async def chat_stream(message: Message):
+    """Igual que /chat, pero envía la respuesta de Gemini por fragmentos (Server-Sent Events).
+
+    Eventos: "meta" (session_id, documentos, horarios), "token" (texto parcial),
+    "error" y "done". El mensaje del asistente se guarda al terminar el stream.
+    """
+    try:
+        logger.info(f"Mensaje recibido (stream): {message.message}")
+        contexto = await preparar_chat(message)
     except Exception as e:
         logger.error(f"Error inesperado: {str(e)}", exc_info=True)
         raise HTTPException(
@@ -441,35 +868,307 @@ async def chat(message: Message):
             detail="Ocurrió un error al procesar tu mensaje"
         )
 
+    session_id = contexto["session_id"]
+    db_data = contexto["db_data"]
+
+    async def eventos():
+        yield evento_sse("meta", {
+            "session_id": session_id,
+            "documentos": documentos_respuesta(db_data),
+            "horarios": db_data.get('horarios') if db_data else None
+        })
+
+        if contexto["respuesta"] is not None:
+            RESPUESTAS.inc(origen=contexto["origen"])
+            yield evento_sse("token", {"text": contexto["respuesta"]})
+            await guardar_respuesta(contexto, contexto["respuesta"])
+            yield evento_sse("done", {"session_id": session_id})
+            return
+
+        with ETAPAS.medir(etapa="cache_respuestas"):
+            en_cache = response_cache.obtener(contexto["cache_key"])
+        if en_cache is not None:
+            RESPUESTAS.inc(origen="cache")
+            yield evento_sse("token", {"text": en_cache})
+            await guardar_respuesta(contexto, en_cache)
+            yield evento_sse("done", {"session_id": session_id})
+            return
+
+        fragmentos = []
+        inicio = time.perf_counter()
+        try:
+            async for texto in gemini_stream_flight.transmitir(
+                contexto["cache_key"], lambda: generar_respuesta_stream(contexto)
+            ):
+                if not fragmentos:
+                    ETAPAS.observar(time.perf_counter() - inicio, etapa="gemini_primer_token")
+                fragmentos.append(texto)
+                yield evento_sse("token", {"text": texto})
+            ETAPAS.observar(time.perf_counter() - inicio, etapa="gemini_stream")
+            RESPUESTAS.inc(origen="gemini")
+        except LLMError as e:
+            if fragmentos:
+                # La respuesta ya empezó; no se mezcla con la del catálogo
+                RESPUESTAS.inc(origen="error_gemini")
+                logger.error(f"Error en Gemini API (stream): {str(e)}")
+                yield evento_sse("error", {"detail": "Error al comunicarse con el servicio de IA"})
+            else:
+                fragmentos.append(respuesta_degradada(contexto, message.message, e))
+                yield evento_sse("token", {"text": fragmentos[0]})
+        finally:
+            # Se guarda lo recibido aunque el cliente se desconecte a mitad del stream
+            if fragmentos:
+                try:
+                    await guardar_respuesta(contexto, "".join(fragmentos))
+                except Exception as e:
+                    logger.error(f"Error al guardar respuesta en streaming: {str(e)}")
+        yield evento_sse("done", {"session_id": session_id})
+
+    return StreamingResponse(
+        eventos(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def leer_metadatos_documento(id_documento: int) -> Optional[DocumentoContenido]:
+    """Nombre, tamaño y fecha de un documento, sin leer su contenido"""
+    with get_db_cursor() as cursor:
+        cursor.execute("""
+            SELECT id, nombre, octet_length(contenido) AS tamano, fecha_upload
+            FROM documentos
+            WHERE id = %s
+            LIMIT 1
+        """, (id_documento,))
+        fila = cursor.fetchone()
+    if not fila or not fila['tamano']:
+        return None
+    return DocumentoContenido(**{**fila, "nombre": fila['nombre'] or 'documento'})
+
+def leer_fragmento_documento(
+    id_documento: int, inicio: int, longitud: int, tamano: int, fecha_upload: Optional[datetime]
+) -> bytes:
+    """Lee `longitud` bytes del contenido a partir de `inicio` (base 0), solo si el documento sigue siendo la misma versión"""
+    with get_db_cursor() as cursor:
+        cursor.execute("""
+            SELECT substring(contenido FROM %s FOR %s) AS fragmento
+            FROM documentos
+            WHERE id = %s
+              AND octet_length(contenido) = %s
+              AND fecha_upload IS NOT DISTINCT FROM %s
+        """, (inicio + 1, longitud, id_documento, tamano, fecha_upload))
+        fila = cursor.fetchone()
+        return bytes(fila['fragmento']) if fila and fila['fragmento'] else b""
+
 @app.get("/documentos/{id_documento}")
-async def obtener_documento(id_documento: int):
-    """Devuelve el documento directamente desde la base de datos"""
+async def obtener_documento(id_documento: int, request: Request):
+    """Devuelve el documento desde la base de datos por fragmentos, con soporte de caché HTTP y Range"""
+    try:
+        with ETAPAS.medir(etapa="documento_metadatos"):
+            doc = await run_db(leer_metadatos_documento, id_documento)
+    except Exception as e:
+        logger.error(f"Error al obtener documento: {str(e)}")
+        raise HTTPException(
+            status_code=500, 
+            detail="Error al procesar documento"
+        )
+    if not doc:
+        raise HTTPException(status_code=404, detail="Documento no encontrado o vacío")
+
+    tamano = doc.tamano
+    fecha = doc.fecha_upload
+    marca = int(fecha.timestamp()) if fecha else 0
+    etag = f'"doc-{id_documento}-{tamano}-{marca}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": DOCUMENTO_CACHE_CONTROL,
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": f"inline; filename={doc.nombre}.pdf"
+    }
+    if fecha:
+        headers["Last-Modified"] = fecha_http(fecha)
+
+    if no_modificado(request, etag, fecha):
+        return Response(status_code=304, headers=headers)
+
+    try:
+        rango = parsear_rango(request, tamano, etag)
+    except RangoNoSatisfacible:
+        return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{tamano}"})
+
+    if rango:
+        inicio, fin = rango
+        headers["Content-Range"] = f"bytes {inicio}-{fin}/{tamano}"
+        status_code = 206
+    else:
+        inicio, fin = 0, tamano - 1
+        status_code = 200
+    headers["Content-Length"] = str(fin - inicio + 1)
+
+    return StreamingResponse(
+        doc.fragmentos(inicio, fin),
+        status_code=status_code,
+        media_type="application/pdf",
+        headers=headers
+    )
+
+def construir_indice_catalogo():
     with get_db_cursor() as cursor:
-        try:
-            cursor.execute("""
-                SELECT nombre, contenido
-                FROM documentos
-                WHERE id = %s
-                LIMIT 1
-            """, (id_documento,))
-            
-            doc = cursor.fetchone()
-            if not doc or not doc['contenido']:
-                raise HTTPException(status_code=404, detail="Documento no encontrado o vacío")
-
-            return Response(
-                content=doc['contenido'],
-                media_type="application/pdf",
-                headers={
-                    "Content-Disposition": f"inline; filename={doc['nombre'] or 'documento'}.pdf"
-                }
+        indice_catalogo.construir(cursor)
+
+async def obtener_indice_catalogo() -> IndiceCatalogo:
+    """El índice del catálogo, reconstruido si cambió la base o el snapshot (una sola vez aunque lleguen varias peticiones)"""
+    if not indice_catalogo.vigente():
+        await indice_flight.ejecutar("indice", lambda: run_db(construir_indice_catalogo))
+    return indice_catalogo
+
+def respuesta_catalogo(request: Request, recurso: Optional[Recurso]) -> Response:
+    if recurso is None:
+        raise HTTPException(status_code=404, detail="Carrera no encontrada")
+    headers = {"ETag": recurso.etag, "Cache-Control": CATALOGO_CACHE_CONTROL}
+    if no_modificado(request, recurso.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(recurso.cuerpo, media_type="application/json", headers=headers)
+
+@app.get("/carreras")
+async def listar_carreras(request: Request):
+    """Carreras con modalidad, duración y costos"""
+    indice = await obtener_indice_catalogo()
+    return respuesta_catalogo(request, indice.lista())
+
+@app.get("/carreras/{id_carrera}")
+async def obtener_carrera_catalogo(id_carrera: int, request: Request):
+    """Datos de una carrera con perfil, horarios y documentos (sin su contenido)"""
+    indice = await obtener_indice_catalogo()
+    return respuesta_catalogo(request, indice.carrera(id_carrera))
+
+@app.get("/carreras/{id_carrera}/horarios")
+async def obtener_horarios_carrera(id_carrera: int, request: Request):
+    indice = await obtener_indice_catalogo()
+    return respuesta_catalogo(request, indice.horarios(id_carrera))
+
+def perfil_carrera(nombre_carrera: str) -> str:
+    """Perfil profesional de la carrera desde la caché del catálogo"""
+    carrera = detectar_carrera_solicitada(nombre_carrera)
+    if not carrera or carrera == "LISTA_CARRERAS":
+        return "No disponible"
+    db_data = query_carrera(carrera)
+    return (db_data or {}).get("descripcion") or "No disponible"
+
+def registrar_pre_usuario(usuario: PreUsuarioCreate, registro_data: dict) -> dict:
+    """Inserta el pre-registro, o devuelve el existente si la cédula ya está registrada, con el perfil de la carrera"""
+    with get_db_cursor() as cursor:
+        # Un solo viaje: inserta si la cédula es nueva y, si no, devuelve la fila existente
+        cursor.execute(
+            """
+            WITH nuevo AS (
+                INSERT INTO pre_usuario (
+                    nombre, cedula, correo, celular, carrera,
+                    fecha_registro, origen, procesado
+                ) VALUES (%(nombre)s, %(cedula)s, %(correo)s, %(celular)s, %(carrera)s,
+                          %(fecha_registro)s, %(origen)s, %(procesado)s)
+                ON CONFLICT (cedula) DO NOTHING
+                RETURNING id, fecha_registro, carrera
             )
-        except Exception as e:
-            logger.error(f"Error al obtener documento: {str(e)}")
+            SELECT id, fecha_registro, carrera, true AS insertado FROM nuevo
+            UNION ALL
+            SELECT id, fecha_registro, carrera, false AS insertado
+            FROM pre_usuario
+            WHERE cedula = %(cedula)s AND NOT EXISTS (SELECT 1 FROM nuevo)
+            LIMIT 1
+            """,
+            {**registro_data, **usuario.model_dump()}
+        )
+        result = cursor.fetchone()
+
+    if not result:
+        # Otra transacción insertó la misma cédula después de tomar la instantánea de esta consulta
+        logger.warning(f"Pre-registro concurrente para la cédula {usuario.cedula}, se reintenta")
+        with get_db_cursor() as cursor:
+            cursor.execute(
+                "SELECT id, fecha_registro, carrera, false AS insertado FROM pre_usuario WHERE cedula = %s",
+                (usuario.cedula,)
+            )
+            result = cursor.fetchone()
+        if not result:
             raise HTTPException(
-                status_code=500, 
-                detail="Error al procesar documento"
+                status_code=400,
+                detail="Error al procesar el registro. Por favor intente nuevamente."
+            )
+
+    registro = {
+        "id": result["id"],
+        "fecha": result["fecha_registro"].isoformat(),
+        "carrera": result["carrera"],
+        "perfil_profesional": perfil_carrera(result["carrera"])
+    }
+    if not result["insertado"]:
+        return {
+            "mensaje": "Ya existe un registro con esta cédula",
+            "registro": registro,
+            "warning": "Se encontró un registro previo con esta cédula"
+        }
+    return {
+        "mensaje": "Pre-registro exitoso",
+        "registro": registro,
+        "next_steps": "Un asesor se pondrá en contacto contigo pronto"
+    }
+
+COLUMNAS_PRE_USUARIO = ("nombre", "cedula", "correo", "celular", "carrera", "fecha_registro", "origen")
+
+def cargar_pre_usuarios(filas: List[tuple]) -> Dict[str, str]:
+    """Carga las filas con COPY en una tabla temporal y las inserta de una vez.
+
+    `filas` son tuplas (número de fila, *COLUMNAS_PRE_USUARIO). Devuelve el
+    estado de cada número de fila: "insertado", "duplicado" (la cédula ya
+    estaba registrada) o "repetido" (la cédula aparece antes en el mismo lote).
+    """
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(filas)
+    buffer.seek(0)
+
+    with get_db_cursor() as cursor:
+        cursor.execute("""
+            CREATE TEMP TABLE pre_usuario_carga (
+                fila INTEGER, nombre TEXT, cedula TEXT, correo TEXT, celular TEXT,
+                carrera TEXT, fecha_registro TIMESTAMP, origen TEXT
+            ) ON COMMIT DROP
+        """)
+        cursor.copy_expert("COPY pre_usuario_carga FROM STDIN WITH (FORMAT csv)", buffer)
+        cursor.execute("""
+            WITH primeras AS (
+                SELECT DISTINCT ON (cedula) *
+                FROM pre_usuario_carga
+                ORDER BY cedula, fila
+            ), insertadas AS (
+                INSERT INTO pre_usuario (nombre, cedula, correo, celular, carrera, fecha_registro, origen, procesado)
+                SELECT nombre, cedula, correo, celular, carrera, fecha_registro, origen, false
+                FROM primeras
+                ON CONFLICT (cedula) DO NOTHING
+                RETURNING cedula
             )
+            SELECT c.fila,
+                   CASE
+                       WHEN c.fila <> p.fila THEN 'repetido'
+                       WHEN i.cedula IS NOT NULL THEN 'insertado'
+                       ELSE 'duplicado'
+                   END AS estado
+            FROM pre_usuario_carga c
+            JOIN primeras p ON p.cedula = c.cedula
+            LEFT JOIN insertadas i ON i.cedula = c.cedula
+        """)
+        return {fila["fila"]: fila["estado"] for fila in cursor.fetchall()}
+
+@app.get("/cache")
+async def estadisticas_cache():
+    """Contadores de la caché del catálogo, de respuestas y del historial en memoria"""
+    return {
+        "catalogo": catalogo_cache.estadisticas(),
+        "indice_catalogo": indice_catalogo.estadisticas(),
+        "documentos": documentos_compartidos.estadisticas(),
+        "respuestas": response_cache.estadisticas(),
+        "historial": history_cache.estadisticas(),
+        "resumenes": history_summaries.estadisticas()
+    }
 
 @router.post("/pre-registro")
 async def crear_pre_registro(
@@ -484,75 +1183,8 @@ async def crear_pre_registro(
             "procesado": False
         }
 
-        with get_db_cursor() as cursor:
-            try:
-                cursor.execute(
-                    """
-                    INSERT INTO pre_usuario (
-                        nombre, cedula, correo, celular, carrera,
-                        fecha_registro, origen, procesado
-                    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                    RETURNING id, fecha_registro, carrera
-                    """,
-                    (
-                        usuario.nombre,
-                        usuario.cedula,
-                        usuario.correo,
-                        usuario.celular,
-                        usuario.carrera,
-                        registro_data["fecha_registro"],
-                        registro_data["origen"],
-                        registro_data["procesado"]
-                    )
-                )
-                result = cursor.fetchone()
-
-            except Exception as db_error:
-                logger.error(f"Error al insertar registro: {str(db_error)}")
-                if "duplicada" in str(db_error).lower():
-                    cursor.execute(
-                        "SELECT id, fecha_registro, carrera FROM pre_usuario WHERE cedula = %s LIMIT 1",
-                        (usuario.cedula,)
-                    )
-                    result = cursor.fetchone()
-                    if result:
-                        return {
-                            "mensaje": "Ya existe un registro con esta cédula",
-                            "registro": {
-                                "id": result["id"],
-                                "fecha": result["fecha_registro"].isoformat(),
-                                "carrera": result["carrera"]
-                            },
-                            "warning": "Se encontró un registro previo con esta cédula"
-                        }
-                raise HTTPException(
-                    status_code=400,
-                    detail="Error al procesar el registro. Por favor intente nuevamente."
-                )
-
-            perfil = None
-            cursor.execute(
-                """
-                SELECT p.descripcion
-                FROM carrera c
-                JOIN perfil_profesional p ON c.id_carrera = p.id_carrera
-                WHERE LOWER(c.nombre) = LOWER(%s)
-                LIMIT 1
-                """,
-                (usuario.carrera,)
-            )
-            perfil = cursor.fetchone()
-
-        return {
-            "mensaje": "Pre-registro exitoso",
-            "registro": {
-                "id": result["id"],
-                "fecha": result["fecha_registro"].isoformat(),
-                "carrera": result["carrera"],
-                "perfil_profesional": perfil["descripcion"] if perfil else "No disponible"
-            },
-            "next_steps": "Un asesor se pondrá en contacto contigo pronto"
-        }
+        with ETAPAS.medir(etapa="pre_registro_db"):
+            return await run_db(registrar_pre_usuario, usuario, registro_data)
 
     except HTTPException:
         raise
@@ -563,6 +1195,116 @@ async def crear_pre_registro(
             detail="Error interno al procesar el registro"
         )
 
+def precalentar_db():
+    """Abre el pool, aplica las migraciones si corresponde y deja en caché los datos de cada carrera"""
+    db_pool.abrir()
+    if DB_MIGRAR_AL_INICIAR:
+        migrar()
+    cargar_ids_carreras()
+    construir_indice_catalogo()
+    with get_db_cursor() as cursor:
+        history_summaries.verificar(cursor)
+    for nombre in catalogo_compartido.carreras:
+        carrera = detectar_carrera_solicitada(nombre)
+        if carrera and carrera != "LISTA_CARRERAS":
+            prompt_builder.bloque_carrera(query_carrera(carrera))
+
+def precalentar_catalogo():
+    """Recorre el detector (también la corrección de faltas, que lee el índice del snapshot), las intenciones y el prompt"""
+    for texto in ("qué carreras tienen", "horarios de derecho", "informasion de enfermeria y sicologia"):
+        detectar_carrera_solicitada(texto)
+        if router_intenciones:
+            router_intenciones.clasificar(texto)
+    prompt_builder.construir("hola", None, [])
+
+async def db_disponible() -> bool:
+    return await asyncio.to_thread(db_pool.health_check, readiness.timeout)
+
+async def gemini_disponible() -> bool:
+    return app.state.llm.circuito.estado != CircuitBreaker.ABIERTO
+
+@app.get("/healthz")
+async def healthz():
+    """El proceso y su event loop responden; no depende de la base de datos ni de Gemini"""
+    return {"estado": "ok", "activo_segundos": round(time.monotonic() - readiness.inicio, 1)}
+
+@app.get("/readyz")
+async def readyz():
+    """Estado de cada dependencia; 503 hasta que las obligatorias están preparadas y responden"""
+    estado = await readiness.comprobar()
+    return JSONResponse(estado, status_code=200 if estado["listo"] else 503)
+
+@app.get("/metrics")
+async def metricas():
+    """Métricas del proceso en formato de texto de Prometheus"""
+    return Response(registro.exponer(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@router.post("/pre-registro/batch")
+async def crear_pre_registros_lote(lote: PreRegistroLote, request: Request):
+    """Importa muchos pre-registros en una sola carga e informa el resultado de cada fila con problemas"""
+    if len(lote.registros) > PRE_REGISTRO_LOTE_MAX:
+        raise HTTPException(
+            status_code=413,
+            detail=f"El lote supera el máximo de {PRE_REGISTRO_LOTE_MAX} registros"
+        )
+
+    origen = lote.origen or request.headers.get("origin", "desconocido")
+    fecha_registro = datetime.now()
+    filas = []
+    errores = []
+    for numero, registro in enumerate(lote.registros, start=1):
+        try:
+            usuario = PreUsuarioCreate.model_validate(registro)
+        except ValidationError as e:
+            errores.append({
+                "fila": numero,
+                "cedula": registro.get("cedula") if isinstance(registro, dict) else None,
+                "error": "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+            })
+            continue
+        cedula = usuario.cedula.strip()
+        if not cedula:
+            errores.append({"fila": numero, "cedula": usuario.cedula, "error": "cedula: no puede estar vacía"})
+            continue
+        filas.append((
+            numero, usuario.nombre, cedula, usuario.correo, usuario.celular, usuario.carrera, fecha_registro, origen
+        ))
+
+    estados = {}
+    if filas:
+        try:
+            with ETAPAS.medir(etapa="pre_registro_lote_db"):
+                estados = await run_db(cargar_pre_usuarios, filas)
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"Error inesperado en la carga de pre-registros: {str(e)}", exc_info=True)
+            raise HTTPException(
+                status_code=500,
+                detail="Error interno al procesar el lote"
+            )
+
+    mensajes = {
+        "duplicado": "Ya existe un registro con esta cédula",
+        "repetido": "La cédula se repite en el lote; se usó la primera aparición"
+    }
+    for numero, _, cedula, *_ in filas:
+        estado = estados.get(numero)
+        if estado != "insertado":
+            errores.append({"fila": numero, "cedula": cedula, "error": mensajes.get(estado, "No se pudo registrar")})
+    errores.sort(key=lambda error: error["fila"])
+
+    insertados = sum(1 for estado in estados.values() if estado == "insertado")
+    logger.info(f"Lote de pre-registros ({origen}): {insertados} de {len(lote.registros)} insertados")
+    return {
+        "mensaje": "Lote procesado",
+        "total": len(lote.registros),
+        "insertados": insertados,
+        "duplicados": sum(1 for estado in estados.values() if estado == "duplicado"),
+        "con_errores": len(errores),
+        "errores": errores
+    }
+
 app.include_router(router)
 
 if __name__ == "__main__":
@@ -0,0 +1,128 @@
+"""Micro-benchmark: DetectorCarreras frente a la detección lineal anterior.
+
+Uso (desde la raíz del repositorio):
+    python -m bench.bench_detector
+"""
+import random
+import time
+import timeit
+
+from fuzzywuzzy import fuzz
+
+from data.sinonimos import CARRERAS_SINONIMOS
+from data.variaciones import CARRERAS_VARIACIONES
+from detector_carreras import DetectorCarreras
+
+MENSAJES = [
+    "hola, quiero información de derecho",
+    "cuánto cuesta la carrera de ingenieria electrica",
+    "me interesa ingeniería eléctrica en la noche",
+    "tienen sistemas inteligentes?",
+    "quiero ser enfermera",
+    "información sobre el ecosistema universitario",
+    "horarios de salud ocupacional y riesgos laborales",
+    "busco algo de administracion de empresas",
+    "hola buenas tardes",
+    "qué carreras tienen disponibles",
+    "me gustaría estudiar odontologia",
+    "precio de fisioterapia",
+]
+
+# Mensajes con faltas de ortografía que solo resuelve el respaldo difuso
+MENSAJES_CON_ERRORES = [
+    "quiero estudiar ingeneria sitemas",
+    "informacion de enfermeira",
+    "odontolojia precio",
+    "contavilidad y finansas",
+    "deresho",
+]
+
+
+def detectar_lineal(texto: str, variaciones=CARRERAS_VARIACIONES, sinonimos=CARRERAS_SINONIMOS):
+    """Copia de detectar_carrera_solicitada antes del detector compilado"""
+    texto = texto.lower()
+
+    if any(palabra in texto for palabra in ["carreras", "disponibles", "ofrecen", "tienen", "qué estudiar", "qué carreras"]):
+        return "LISTA_CARRERAS"
+
+    for sinonimo, carrera in sinonimos.items():
+        if sinonimo in texto:
+            return carrera
+
+    for carrera, lista in variaciones.items():
+        if carrera in texto:
+            return carrera
+        for variacion in lista:
+            if variacion in texto:
+                return carrera
+
+    best_match = None
+    highest_score = 0
+    for carrera in variaciones.keys():
+        score = fuzz.token_set_ratio(texto, carrera)
+        if score > highest_score and score > 60:
+            highest_score = score
+            best_match = carrera
+    return best_match
+
+
+def catalogo_ampliado(factor: int):
+    """Multiplica el catálogo con carreras ficticias para ver cómo escala cada método"""
+    variaciones = dict(CARRERAS_VARIACIONES)
+    for i in range(factor - 1):
+        for carrera, lista in CARRERAS_VARIACIONES.items():
+            variaciones[f"{carrera} sede{i}"] = [f"{v} sede{i}" for v in lista]
+    return variaciones
+
+
+def medir(funcion, repeticiones: int, mensajes=MENSAJES) -> float:
+    total = timeit.timeit(lambda: [funcion(m) for m in mensajes], number=repeticiones)
+    return total / (repeticiones * len(mensajes)) * 1e6
+
+
+def main(repeticiones: int = 500):
+    detector = DetectorCarreras()
+    construccion = timeit.timeit(DetectorCarreras, number=20) / 20
+    print(f"Compilación del detector: {construccion * 1e3:.2f} ms\n")
+
+    print(f"{'mensaje':50} {'lineal':35} {'compilado'}")
+    for mensaje in MENSAJES:
+        deteccion = detector.detectar(mensaje)
+        print(f"{mensaje[:50]:50} {str(detectar_lineal(mensaje))[:35]:35} {deteccion.carrera} ({deteccion.confianza})")
+
+    print(f"\n{'catálogo':10} {'lineal µs/msg':>15} {'compilado µs/msg':>18}")
+    for factor in (1, 10):
+        variaciones = catalogo_ampliado(factor)
+        detector = DetectorCarreras(variaciones=variaciones)
+        lineal = medir(lambda m: detectar_lineal(m, variaciones), repeticiones // factor)
+        compilado = medir(detector.detectar, repeticiones)
+        print(f"{'x' + str(factor):10} {lineal:15.2f} {compilado:18.2f}")
+
+    detector = DetectorCarreras()
+    print(f"\n{'mensaje con errores':40} {'lineal':35} {'compilado'}")
+    for mensaje in MENSAJES_CON_ERRORES:
+        deteccion = detector.detectar(mensaje)
+        print(f"{mensaje:40} {str(detectar_lineal(mensaje))[:35]:35} {deteccion.carrera} ({deteccion.confianza})")
+    lineal = medir(detectar_lineal, repeticiones // 10, MENSAJES_CON_ERRORES)
+    primera = medir(DetectorCarreras().detectar, 1, MENSAJES_CON_ERRORES)
+    cache = medir(detector.detectar, repeticiones, MENSAJES_CON_ERRORES)
+    print(f"lineal {lineal:.2f} µs/msg, índice n-gramas {primera:.2f} µs/msg (en frío), {cache:.2f} µs/msg (correcciones en caché)")
+
+    # Lote sintético: mensajes reales mezclados con palabras alteradas al azar
+    aleatorio = random.Random(0)
+    lote = []
+    for _ in range(50000):
+        palabras = aleatorio.choice(MENSAJES + MENSAJES_CON_ERRORES).split()
+        i = aleatorio.randrange(len(palabras))
+        if len(palabras[i]) > 4:
+            j = aleatorio.randrange(1, len(palabras[i]) - 1)
+            palabras[i] = palabras[i][:j] + palabras[i][j + 1:]
+        lote.append(" ".join(palabras))
+    inicio = time.perf_counter()
+    DetectorCarreras().classify_many(lote)
+    duracion = time.perf_counter() - inicio
+    print(f"\nclassify_many: {len(lote)} mensajes en {duracion:.2f} s ({len(lote) / duracion:,.0f} msg/s)")
+
+
+if __name__ == "__main__":
+    main()
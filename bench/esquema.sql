@@ -0,0 +1,46 @@
+-- Esquema mínimo que usa la API; lo carga bench/fixture.py en una base de datos de pruebas
+CREATE TABLE IF NOT EXISTS carrera (
+    id_carrera SERIAL PRIMARY KEY,
+    nombre TEXT NOT NULL,
+    modalidad TEXT,
+    semestre INTEGER,
+    "inscripción" NUMERIC(10,2),
+    pre NUMERIC(10,2),
+    "matrícula" NUMERIC(10,2),
+    cuotas_mensuales NUMERIC(10,2)
+);
+
+CREATE TABLE IF NOT EXISTS perfil_profesional (
+    id SERIAL PRIMARY KEY,
+    id_carrera INTEGER REFERENCES carrera(id_carrera),
+    descripcion TEXT
+);
+
+CREATE TABLE IF NOT EXISTS documentos (
+    id SERIAL PRIMARY KEY,
+    id_carrera INTEGER REFERENCES carrera(id_carrera),
+    nombre TEXT,
+    contenido BYTEA,
+    fecha_upload TIMESTAMP DEFAULT now()
+);
+
+CREATE TABLE IF NOT EXISTS chat_history (
+    id BIGSERIAL PRIMARY KEY,
+    session_id TEXT NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT,
+    carrera_referencia TEXT,
+    timestamp TIMESTAMP DEFAULT now()
+);
+
+CREATE TABLE IF NOT EXISTS pre_usuario (
+    id SERIAL PRIMARY KEY,
+    nombre TEXT,
+    cedula TEXT UNIQUE,
+    correo TEXT,
+    celular TEXT,
+    carrera TEXT,
+    fecha_registro TIMESTAMP,
+    origen TEXT,
+    procesado BOOLEAN DEFAULT false
+);
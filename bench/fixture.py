@@ -0,0 +1,171 @@
+"""Crea y llena una base de datos local de pruebas para los benchmarks.
+
+Usa los mismos parámetros de conexión que la API (DB_HOST, DB_NAME, ...).
+Si la base no existe se crea. Con --recrear se borran antes las tablas.
+
+Uso (desde la raíz del repositorio):
+    DB_NAME=UBE_bench python -m bench.fixture --recrear --documentos 3 --sesiones 2000
+"""
+import argparse
+import os
+import random
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import psycopg2
+from psycopg2 import sql
+from psycopg2.extras import execute_values
+
+from data.carreras import LISTA_COMPLETA_CARRERAS
+from db_config import DB_PARAMS
+
+ESQUEMA = os.path.join(os.path.dirname(__file__), "esquema.sql")
+TABLAS = ("chat_history", "pre_usuario", "documentos", "perfil_profesional", "carrera")
+
+MODALIDADES = ["Presencial", "Semipresencial", "En línea", "Híbrida"]
+
+
+def crear_base_si_falta():
+    try:
+        psycopg2.connect(**DB_PARAMS).close()
+        return
+    except psycopg2.OperationalError as e:
+        if "does not exist" not in str(e) and "no existe" not in str(e):
+            raise
+    conn = psycopg2.connect(**{**DB_PARAMS, "database": "postgres"})
+    conn.autocommit = True
+    with conn.cursor() as cursor:
+        cursor.execute(sql.SQL("CREATE DATABASE {}").format(sql.Identifier(DB_PARAMS["database"])))
+    conn.close()
+    print(f"Base de datos {DB_PARAMS['database']} creada")
+
+
+def documento_falso(tamano: int, semilla: int) -> bytes:
+    """Bytes con cabecera de PDF y relleno determinista del tamaño pedido"""
+    generador = random.Random(semilla)
+    cabecera = b"%PDF-1.4\n"
+    return cabecera + generador.randbytes(max(tamano - len(cabecera), 0))
+
+
+def sembrar(cursor, documentos: int, tamano_documento: int, sesiones: int, pre_usuarios: int, semilla: int):
+    generador = random.Random(semilla)
+
+    carreras = [
+        (
+            nombre,
+            generador.choice(MODALIDADES),
+            generador.choice([8, 9, 10]),
+            50, 100, generador.choice([180, 200, 220]),
+            generador.randrange(120, 260, 5)
+        )
+        for nombre in LISTA_COMPLETA_CARRERAS
+    ]
+    ids = [
+        fila[0] for fila in execute_values(
+            cursor,
+            """
+            INSERT INTO carrera (nombre, modalidad, semestre, "inscripción", pre, "matrícula", cuotas_mensuales)
+            VALUES %s RETURNING id_carrera
+            """,
+            carreras,
+            fetch=True
+        )
+    ]
+
+    execute_values(
+        cursor,
+        "INSERT INTO perfil_profesional (id_carrera, descripcion) VALUES %s",
+        [
+            (id_carrera, f"El profesional en {nombre} " + "está preparado para liderar proyectos. " * 12)
+            for id_carrera, (nombre, *_) in zip(ids, carreras)
+        ]
+    )
+
+    for id_carrera, (nombre, *_) in zip(ids, carreras):
+        for i in range(documentos):
+            cursor.execute(
+                "INSERT INTO documentos (id_carrera, nombre, contenido, fecha_upload) VALUES (%s, %s, %s, %s)",
+                (
+                    id_carrera,
+                    f"{nombre} - documento {i + 1}.pdf",
+                    psycopg2.Binary(documento_falso(tamano_documento, semilla + id_carrera * 100 + i)),
+                    datetime.now() - timedelta(days=generador.randrange(365))
+                )
+            )
+
+    inicio = datetime.now() - timedelta(days=30)
+    mensajes = []
+    for _ in range(sesiones):
+        session_id = str(uuid.UUID(int=generador.getrandbits(128)))
+        carrera = generador.choice(LISTA_COMPLETA_CARRERAS)
+        momento = inicio + timedelta(seconds=generador.randrange(30 * 86400))
+        for turno in range(generador.randint(1, 6)):
+            momento += timedelta(seconds=generador.randint(5, 120))
+            mensajes.append((session_id, "user", f"información de {carrera.lower()} ({turno})", carrera, momento))
+            momento += timedelta(seconds=2)
+            mensajes.append((session_id, "assistant", f"Claro, esta es la información de {carrera}.", carrera, momento))
+    execute_values(
+        cursor,
+        "INSERT INTO chat_history (session_id, role, content, carrera_referencia, timestamp) VALUES %s",
+        mensajes,
+        page_size=1000
+    )
+
+    execute_values(
+        cursor,
+        """
+        INSERT INTO pre_usuario (nombre, cedula, correo, celular, carrera, fecha_registro, origen, procesado)
+        VALUES %s
+        """,
+        [
+            (
+                f"Aspirante {i}", f"09{i:08d}", f"aspirante{i}@example.com", f"09{generador.randrange(10**8):08d}",
+                generador.choice(LISTA_COMPLETA_CARRERAS), inicio + timedelta(minutes=i), "bench", False
+            )
+            for i in range(pre_usuarios)
+        ],
+        page_size=1000
+    )
+    return len(ids), len(mensajes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Base de datos de pruebas para los benchmarks")
+    parser.add_argument("--recrear", action="store_true", help="borra las tablas antes de cargar")
+    parser.add_argument("--documentos", type=int, default=2, help="documentos por carrera")
+    parser.add_argument("--tamano-documento", type=int, default=512 * 1024, help="bytes por documento")
+    parser.add_argument("--sesiones", type=int, default=1000, help="sesiones de chat_history")
+    parser.add_argument("--pre-usuarios", type=int, default=500)
+    parser.add_argument("--semilla", type=int, default=42)
+    args = parser.parse_args()
+
+    crear_base_si_falta()
+    inicio = time.perf_counter()
+    conn = psycopg2.connect(**DB_PARAMS)
+    try:
+        with conn.cursor() as cursor:
+            if args.recrear:
+                cursor.execute(sql.SQL("DROP TABLE IF EXISTS {} CASCADE").format(
+                    sql.SQL(", ").join(map(sql.Identifier, TABLAS))
+                ))
+            with open(ESQUEMA, encoding="utf-8") as f:
+                cursor.execute(f.read())
+            cursor.execute("SELECT count(*) FROM carrera")
+            if cursor.fetchone()[0]:
+                print("La base ya tiene datos; use --recrear para cargarla de nuevo")
+                return
+            carreras, mensajes = sembrar(
+                cursor, args.documentos, args.tamano_documento, args.sesiones, args.pre_usuarios, args.semilla
+            )
+        conn.commit()
+    finally:
+        conn.close()
+    print(
+        f"{carreras} carreras, {carreras * args.documentos} documentos, {mensajes} mensajes y "
+        f"{args.pre_usuarios} pre-registros cargados en {time.perf_counter() - inicio:.1f} s"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,310 @@
+"""Prueba de carga de la API: throughput y latencias p50/p95/p99 por endpoint.
+
+Lanza trabajadores en lazo cerrado (cada uno espera su respuesta antes de la
+siguiente petición) para cada nivel de concurrencia y mezcla de tráfico.
+Con --iniciar levanta también el servidor local de Gemini (gemini_stub.py)
+y la API con uvicorn, para medir todo en una sola máquina.
+
+Uso (desde la raíz del repositorio, con la base cargada por bench.fixture):
+    python -m bench.load_test --iniciar --workers 2 --concurrencias 1,8,32 --mezclas chat,mixta
+    python -m bench.load_test --url http://localhost:5000 --duracion 30 --json resultados.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+import httpx
+import numpy as np
+
+# Peso relativo de cada tipo de petición en cada mezcla
+MEZCLAS: Dict[str, Dict[str, float]] = {
+    "chat": {"chat": 1.0},
+    "streaming": {"chat_stream": 1.0},
+    "documentos": {"documento": 1.0},
+    "pre_registro": {"pre_registro": 1.0},
+    "mixta": {"chat": 0.55, "chat_stream": 0.15, "documento": 0.2, "pre_registro": 0.1},
+}
+
+# Mensajes representativos: preguntas factuales (plantillas), abiertas (Gemini),
+# listado de carreras, consultas no entendidas y faltas de ortografía
+MENSAJES = [
+    "cuánto cuesta derecho",
+    "qué modalidad tiene enfermería",
+    "cuántos semestres dura odontología",
+    "horarios de ingeniería eléctrica",
+    "por qué estudiar psicología en la UBE",
+    "cuéntame del campo laboral de sistemas inteligentes",
+    "me recomiendas contabilidad y finanzas",
+    "qué carreras tienen disponibles",
+    "hola buenas tardes",
+    "quiero estudiar ingeneria sitemas",
+    "informacion de fisioterapia",
+]
+TURNOS_POR_SESION = 4
+RANGO_DOCUMENTO = 64 * 1024
+
+
+class Resultados:
+    """Latencias y errores por endpoint dentro de un nivel de carga"""
+
+    def __init__(self):
+        self.latencias: Dict[str, List[float]] = defaultdict(list)
+        self.primer_token: List[float] = []
+        self.errores: Dict[str, int] = defaultdict(int)
+        self.estados: Dict[str, Dict[int, int]] = defaultdict(lambda: defaultdict(int))
+
+    def resumen(self, duracion: float) -> Dict[str, dict]:
+        filas = {}
+        for endpoint, valores in sorted(self.latencias.items()):
+            ms = np.array(valores) * 1000
+            fila = {
+                "peticiones": len(valores),
+                "errores": self.errores[endpoint],
+                "rps": round(len(valores) / duracion, 1),
+                "p50_ms": round(float(np.percentile(ms, 50)), 1),
+                "p95_ms": round(float(np.percentile(ms, 95)), 1),
+                "p99_ms": round(float(np.percentile(ms, 99)), 1),
+                "max_ms": round(float(ms.max()), 1),
+                "estados": dict(self.estados[endpoint]),
+            }
+            if endpoint == "chat_stream" and self.primer_token:
+                ttft = np.array(self.primer_token) * 1000
+                fila["ttft_p50_ms"] = round(float(np.percentile(ttft, 50)), 1)
+                fila["ttft_p95_ms"] = round(float(np.percentile(ttft, 95)), 1)
+            filas[endpoint] = fila
+        return filas
+
+
+class Trabajador:
+    """Cliente que repite peticiones según la mezcla, con su propia sesión de chat"""
+
+    def __init__(self, cliente: httpx.AsyncClient, mezcla: Dict[str, float], documentos: List[int], semilla: int):
+        self.cliente = cliente
+        self.tipos = list(mezcla)
+        self.pesos = list(mezcla.values())
+        self.documentos = documentos
+        self.random = random.Random(semilla)
+        self.session_id: Optional[str] = None
+        self.turnos = 0
+        self.etags: Dict[int, str] = {}
+
+    def _sesion(self) -> Optional[str]:
+        if self.turnos % TURNOS_POR_SESION == 0:
+            self.session_id = None
+        self.turnos += 1
+        return self.session_id
+
+    async def chat(self, resultados: Resultados) -> int:
+        response = await self.cliente.post("/chat", json={
+            "message": self.random.choice(MENSAJES),
+            "session_id": self._sesion()
+        })
+        if response.status_code == 200:
+            self.session_id = response.json().get("session_id") or self.session_id
+        return response.status_code
+
+    async def chat_stream(self, resultados: Resultados) -> int:
+        inicio = time.perf_counter()
+        primero = None
+        async with self.cliente.stream("POST", "/chat/stream", json={
+            "message": self.random.choice(MENSAJES),
+            "session_id": self._sesion()
+        }) as response:
+            async for linea in response.aiter_lines():
+                if linea.startswith("event: meta"):
+                    continue
+                if linea.startswith("data:") and '"session_id"' in linea:
+                    self.session_id = json.loads(linea[len("data:"):]).get("session_id") or self.session_id
+                elif primero is None and linea.startswith(("event: token", "event: done")):
+                    primero = time.perf_counter() - inicio
+        if primero is not None:
+            resultados.primer_token.append(primero)
+        return response.status_code
+
+    async def documento(self, resultados: Resultados) -> int:
+        if not self.documentos:
+            return 0
+        id_documento = self.random.choice(self.documentos)
+        headers = {}
+        tipo = self.random.random()
+        if tipo < 0.2 and id_documento in self.etags:
+            headers["If-None-Match"] = self.etags[id_documento]
+        elif tipo < 0.3:
+            headers["Range"] = f"bytes=0-{RANGO_DOCUMENTO - 1}"
+        async with self.cliente.stream("GET", f"/documentos/{id_documento}", headers=headers) as response:
+            async for _ in response.aiter_bytes():
+                pass
+        if "etag" in response.headers:
+            self.etags[id_documento] = response.headers["etag"]
+        return response.status_code
+
+    async def pre_registro(self, resultados: Resultados) -> int:
+        # Una de cada diez cédulas se repite para ejercitar el caso de duplicados
+        if self.random.random() < 0.1:
+            cedula = f"09{self.random.randrange(500):08d}"
+        else:
+            cedula = f"{self.random.randrange(10**10):010d}"
+        response = await self.cliente.post("/pre-registro", json={
+            "nombre": "Aspirante de prueba",
+            "cedula": cedula,
+            "correo": "prueba@example.com",
+            "celular": "0999999999",
+            "carrera": "Derecho"
+        })
+        return response.status_code
+
+    async def correr(self, hasta: float, resultados: Optional[Resultados]):
+        while time.perf_counter() < hasta:
+            tipo = self.random.choices(self.tipos, self.pesos)[0]
+            inicio = time.perf_counter()
+            try:
+                estado = await getattr(self, tipo)(resultados or Resultados())
+                error = estado == 0 or estado >= 400
+            except httpx.HTTPError:
+                estado, error = -1, True
+            if resultados is not None:
+                resultados.latencias[tipo].append(time.perf_counter() - inicio)
+                resultados.estados[tipo][estado] += 1
+                if error:
+                    resultados.errores[tipo] += 1
+
+
+async def medir(url: str, mezcla: Dict[str, float], concurrencia: int, duracion: float,
+                calentamiento: float, documentos: List[int], semilla: int) -> Dict[str, dict]:
+    limites = httpx.Limits(max_connections=concurrencia, max_keepalive_connections=concurrencia)
+    async with httpx.AsyncClient(base_url=url, limits=limites, timeout=120) as cliente:
+        trabajadores = [Trabajador(cliente, mezcla, documentos, semilla + i) for i in range(concurrencia)]
+        if calentamiento > 0:
+            hasta = time.perf_counter() + calentamiento
+            await asyncio.gather(*(t.correr(hasta, None) for t in trabajadores))
+
+        resultados = Resultados()
+        inicio = time.perf_counter()
+        await asyncio.gather(*(t.correr(inicio + duracion, resultados) for t in trabajadores))
+        return resultados.resumen(time.perf_counter() - inicio)
+
+
+def ids_documentos() -> List[int]:
+    """Ids de documentos de la base de pruebas, leídos con la configuración de la API"""
+    from db_config import get_db_connection
+
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT id FROM documentos ORDER BY id")
+            return [fila["id"] for fila in cursor.fetchall()]
+    finally:
+        conn.close()
+
+
+def esperar_servicio(url: str, ruta: str, timeout: float = 30):
+    limite = time.monotonic() + timeout
+    while time.monotonic() < limite:
+        try:
+            if httpx.get(url + ruta, timeout=2).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} no respondió en {timeout} s")
+
+
+def iniciar_servicios(args) -> List[subprocess.Popen]:
+    """Levanta el servidor local de Gemini y la API con uvicorn"""
+    url_stub = f"http://127.0.0.1:{args.puerto_gemini}"
+    entorno_stub = {
+        **os.environ,
+        "GEMINI_STUB_PORT": str(args.puerto_gemini),
+        "GEMINI_STUB_LATENCIA": str(args.latencia_gemini),
+        "GEMINI_STUB_TTFT": str(args.ttft_gemini),
+    }
+    stub = subprocess.Popen([sys.executable, "gemini_stub.py"], env=entorno_stub,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    esperar_servicio(url_stub, "/docs")
+
+    entorno_api = {**os.environ, "GEMINI_BASE_URL": url_stub}
+    salida = open(args.log_api, "ab") if args.log_api else subprocess.DEVNULL
+    api = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api:app", "--host", "127.0.0.1", "--port", str(args.puerto_api),
+         "--workers", str(args.workers), "--log-level", "warning", "--no-access-log"],
+        env=entorno_api,
+        stdout=salida,
+        stderr=salida
+    )
+    esperar_servicio(f"http://127.0.0.1:{args.puerto_api}", "/cache")
+    return [stub, api]
+
+
+def imprimir(mezcla: str, concurrencia: int, filas: Dict[str, dict]):
+    print(f"\nmezcla={mezcla} concurrencia={concurrencia}")
+    print(f"{'endpoint':<14}{'n':>8}{'err':>6}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}  ttft p50/p95")
+    for endpoint, f in filas.items():
+        ttft = f"  {f['ttft_p50_ms']}/{f['ttft_p95_ms']}" if "ttft_p50_ms" in f else ""
+        print(
+            f"{endpoint:<14}{f['peticiones']:>8}{f['errores']:>6}{f['rps']:>9}"
+            f"{f['p50_ms']:>9}{f['p95_ms']:>9}{f['p99_ms']:>9}{f['max_ms']:>9}{ttft}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga de la API del chatbot")
+    parser.add_argument("--url", default="http://127.0.0.1:5000")
+    parser.add_argument("--concurrencias", default="1,8,32", help="niveles separados por comas")
+    parser.add_argument("--mezclas", default="mixta", help=f"separadas por comas: {', '.join(MEZCLAS)}")
+    parser.add_argument("--duracion", type=float, default=10, help="segundos medidos por nivel")
+    parser.add_argument("--calentamiento", type=float, default=2, help="segundos sin medir antes de cada nivel")
+    parser.add_argument("--semilla", type=int, default=1)
+    parser.add_argument("--json", help="archivo donde guardar los resultados")
+    parser.add_argument("--iniciar", action="store_true", help="levanta gemini_stub.py y la API")
+    parser.add_argument("--workers", type=int, default=1, help="workers de uvicorn con --iniciar")
+    parser.add_argument("--puerto-api", type=int, default=5055)
+    parser.add_argument("--puerto-gemini", type=int, default=8091)
+    parser.add_argument("--latencia-gemini", type=float, default=0.5)
+    parser.add_argument("--ttft-gemini", type=float, default=0.15)
+    parser.add_argument("--log-api", help="archivo para los logs de la API levantada con --iniciar")
+    args = parser.parse_args()
+
+    mezclas = args.mezclas.split(",")
+    for nombre in mezclas:
+        if nombre not in MEZCLAS:
+            parser.error(f"Mezcla desconocida: {nombre}")
+    concurrencias = [int(c) for c in args.concurrencias.split(",")]
+
+    procesos = []
+    url = args.url
+    if args.iniciar:
+        procesos = iniciar_servicios(args)
+        url = f"http://127.0.0.1:{args.puerto_api}"
+
+    try:
+        documentos = ids_documentos() if any("documento" in MEZCLAS[m] for m in mezclas) else []
+        todos = []
+        for nombre in mezclas:
+            for concurrencia in concurrencias:
+                filas = asyncio.run(medir(
+                    url, MEZCLAS[nombre], concurrencia, args.duracion, args.calentamiento,
+                    documentos, args.semilla + concurrencia
+                ))
+                imprimir(nombre, concurrencia, filas)
+                todos.append({"mezcla": nombre, "concurrencia": concurrencia, "endpoints": filas})
+    finally:
+        for proceso in procesos:
+            proceso.terminate()
+        for proceso in procesos:
+            proceso.wait(timeout=30)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"url": url, "duracion": args.duracion, "resultados": todos}, f, indent=2)
+        print(f"\nResultados guardados en {args.json}")
+
+
+if __name__ == "__main__":
+    main()
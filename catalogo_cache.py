@@ -0,0 +1,224 @@
+"""Caché en memoria del catálogo de carreras con expiración e invalidación por LISTEN/NOTIFY."""
+import os
+import time
+import select
+import logging
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import psycopg2
+import psycopg2.extensions
+
+from db_config import get_db_connection
+from detector_carreras import normalizar
+
+logger = logging.getLogger(__name__)
+
+CATALOGO_CACHE_TTL = float(os.getenv("CATALOGO_CACHE_TTL", "600"))
+CANAL_CATALOGO = "catalogo_cambios"
+TABLAS_CATALOGO = ("carrera", "perfil_profesional", "documentos")
+
+# Triggers que avisan por NOTIFY cada vez que cambia una tabla del catálogo
+SQL_TRIGGERS = f"""
+CREATE OR REPLACE FUNCTION notificar_cambio_catalogo() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('{CANAL_CATALOGO}', TG_TABLE_NAME);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+""" + "".join(
+    f"""
+DROP TRIGGER IF EXISTS {tabla}_notificar_cambio ON {tabla};
+CREATE TRIGGER {tabla}_notificar_cambio
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {tabla}
+    FOR EACH STATEMENT EXECUTE FUNCTION notificar_cambio_catalogo();
+"""
+    for tabla in TABLAS_CATALOGO
+)
+
+
+class CatalogoCache:
+    """Guarda los datos de cada carrera (fila, perfil, horarios y documentos) por nombre canónico.
+
+    Las entradas expiran a los `ttl` segundos. Además, un hilo escucha el canal
+    de NOTIFY y vacía la caché en cuanto cambia alguna tabla del catálogo.
+    `version` aumenta con cada invalidación para que otras cachés derivadas
+    del catálogo puedan detectar datos viejos.
+    """
+
+    def __init__(self, ttl: float = CATALOGO_CACHE_TTL, canal: str = CANAL_CATALOGO):
+        self.ttl = ttl
+        self.canal = canal
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidaciones = 0
+        self._entradas: Dict[str, Tuple[float, Any]] = {}
+        self._lock = threading.Lock()
+        self._detener = threading.Event()
+        self._hilo: Optional[threading.Thread] = None
+
+    def consultar(self, clave: str) -> Tuple[bool, Any]:
+        """(True, valor) si la clave está vigente en caché; no carga nada ni cuenta los fallos"""
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada and entrada[0] > time.monotonic():
+                self.hits += 1
+                return True, entrada[1]
+        return False, None
+
+    def obtener(self, clave: str, cargar: Callable[[], Any]) -> Any:
+        """Devuelve el valor en caché o lo carga con `cargar()`.
+
+        Si `cargar` lanza una excepción no se guarda nada.
+        """
+        ahora = time.monotonic()
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada and entrada[0] > ahora:
+                self.hits += 1
+                return entrada[1]
+            self.misses += 1
+            version = self.version
+
+        valor = cargar()
+
+        with self._lock:
+            # Si hubo una invalidación mientras se cargaba, el valor puede estar viejo
+            if version == self.version:
+                self._entradas[clave] = (time.monotonic() + self.ttl, valor)
+        return valor
+
+    def invalidar(self, clave: Optional[str] = None):
+        with self._lock:
+            if clave is None:
+                self._entradas.clear()
+            else:
+                self._entradas.pop(clave, None)
+            self.version += 1
+            self.invalidaciones += 1
+
+    def estadisticas(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entradas": len(self._entradas),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+                "invalidaciones": self.invalidaciones,
+                "version": self.version,
+                "ttl": self.ttl,
+                "escuchando": bool(self._hilo and self._hilo.is_alive())
+            }
+
+    def iniciar_escucha(self):
+        """Arranca el hilo que escucha las notificaciones de cambios del catálogo"""
+        if self._hilo and self._hilo.is_alive():
+            return
+        self._detener.clear()
+        self._hilo = threading.Thread(target=self._escuchar, name="catalogo-listen", daemon=True)
+        self._hilo.start()
+
+    def detener_escucha(self):
+        self._detener.set()
+        if self._hilo:
+            self._hilo.join(timeout=10)
+
+    def _escuchar(self):
+        espera = 1.0
+        while not self._detener.is_set():
+            conn = None
+            try:
+                conn = get_db_connection()
+                conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                with conn.cursor() as cursor:
+                    cursor.execute(f"LISTEN {self.canal}")
+                # Pudo haber cambios mientras no se escuchaba
+                self.invalidar()
+                espera = 1.0
+                logger.info(f"Escuchando cambios del catálogo en el canal {self.canal}")
+
+                while not self._detener.is_set():
+                    if select.select([conn], [], [], 5) == ([], [], []):
+                        continue
+                    conn.poll()
+                    tablas = set()
+                    while conn.notifies:
+                        tablas.add(conn.notifies.pop(0).payload)
+                    if tablas:
+                        logger.info(f"Catálogo modificado ({', '.join(sorted(tablas))}); se invalida la caché")
+                        self.invalidar()
+            except (ConnectionError, psycopg2.Error) as e:
+                logger.error(f"Error escuchando cambios del catálogo: {str(e)}")
+                self._detener.wait(espera)
+                espera = min(espera * 2, 60)
+            finally:
+                if conn:
+                    conn.close()
+
+
+class IdsCarreras:
+    """Resuelve el nombre canónico de una carrera a su id_carrera.
+
+    La tabla carrera se lee una vez y se vuelve a leer solo cuando cambia la
+    versión de la caché del catálogo (tras un NOTIFY de cambios), así que
+    las consultas del catálogo pueden ir por clave primaria. Los nombres
+    se comparan normalizados (sin tildes ni mayúsculas); si no hay uno igual
+    se acepta una única carrera cuyo nombre contenga al buscado.
+    """
+
+    def __init__(self, cache: CatalogoCache):
+        self.cache = cache
+        self._ids: Dict[str, int] = {}
+        self._version: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def cargar(self, cursor):
+        version = self.cache.version
+        cursor.execute("SELECT id_carrera, nombre FROM carrera")
+        ids = {}
+        for fila in cursor.fetchall():
+            nombre = normalizar(fila["nombre"])
+            if nombre in ids:
+                logger.warning(f"Carrera '{fila['nombre']}' repetida; se usa id_carrera {ids[nombre]}")
+                continue
+            ids[nombre] = fila["id_carrera"]
+        with self._lock:
+            self._ids = ids
+            self._version = version
+        logger.info(f"{len(ids)} carreras resueltas a id_carrera")
+
+    def resolver(self, cursor, nombre_carrera: str) -> Optional[int]:
+        if self._version != self.cache.version:
+            self.cargar(cursor)
+        normalizado = normalizar(nombre_carrera)
+        id_carrera = self._ids.get(normalizado)
+        if id_carrera is not None:
+            return id_carrera
+        candidatos = [i for nombre, i in self._ids.items() if normalizado in nombre]
+        if len(candidatos) == 1:
+            return candidatos[0]
+        if candidatos:
+            logger.warning(f"'{nombre_carrera}' coincide con {len(candidatos)} carreras; no se elige ninguna")
+        return None
+
+    def estadisticas(self) -> dict:
+        return {"carreras": len(self._ids), "version": self._version}
+
+
+def instalar_triggers():
+    """Crea (o recrea) los triggers de NOTIFY sobre las tablas del catálogo"""
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(SQL_TRIGGERS)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    instalar_triggers()
+    logger.info("Triggers de catálogo instalados")
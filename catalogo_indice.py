@@ -0,0 +1,137 @@
+"""Índice del catálogo por id_carrera con las respuestas de /carreras ya serializadas."""
+import json
+import hashlib
+import logging
+import threading
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from catalogo_cache import CatalogoCache
+from catalogo_snapshot import CatalogoCompartido
+
+logger = logging.getLogger(__name__)
+
+
+class Recurso(NamedTuple):
+    """Cuerpo JSON listo para enviar y su ETag fuerte"""
+    cuerpo: bytes
+    etag: str
+
+
+def recurso(datos) -> Recurso:
+    # Serialización determinista: los mismos datos dan el mismo ETag en todos los workers y reinicios
+    cuerpo = json.dumps(datos, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+    return Recurso(cuerpo, f'"{hashlib.sha256(cuerpo).hexdigest()[:32]}"')
+
+
+def _numero(valor) -> Optional[float]:
+    return float(valor) if valor is not None else None
+
+
+class IndiceCatalogo:
+    """Carreras, horarios y documentos por id_carrera, armados de una vez.
+
+    Cada respuesta se serializa y se le calcula el ETag al construir el
+    índice, así que atender /carreras es buscar bytes en un diccionario. El
+    índice queda viejo cuando cambia la versión de la caché del catálogo (un
+    NOTIFY de la base) o el snapshot de horarios, y se reconstruye en la
+    siguiente consulta.
+    """
+
+    def __init__(self, cache: CatalogoCache, catalogo: CatalogoCompartido):
+        self.cache = cache
+        self.catalogo = catalogo
+        self.construcciones = 0
+        self._version: Optional[Tuple[int, str]] = None
+        self._lista: Optional[Recurso] = None
+        self._carreras: Dict[int, Recurso] = {}
+        self._horarios: Dict[int, Recurso] = {}
+        self._lock = threading.Lock()
+
+    def _version_actual(self) -> Tuple[int, str]:
+        return self.cache.version, self.catalogo.actual.version
+
+    def vigente(self) -> bool:
+        return self._version == self._version_actual()
+
+    def construir(self, cursor):
+        """Lee el catálogo de la base y serializa todas las respuestas"""
+        # Si el catálogo cambia mientras se construye, el índice queda marcado como viejo
+        version = self._version_actual()
+        snapshot = self.catalogo.actual
+        cursor.execute("""
+            SELECT c.id_carrera, c.nombre, c.modalidad, c.semestre,
+                   c."inscripción" AS inscripcion, c.pre, c."matrícula" AS matricula, c.cuotas_mensuales,
+                   p.descripcion
+            FROM carrera c
+            LEFT JOIN LATERAL (
+                SELECT descripcion FROM perfil_profesional WHERE id_carrera = c.id_carrera ORDER BY id LIMIT 1
+            ) p ON true
+            ORDER BY c.id_carrera
+        """)
+        filas = cursor.fetchall()
+        # octet_length no lee el contenido
+        cursor.execute("""
+            SELECT id, id_carrera, nombre, fecha_upload, octet_length(contenido) AS tamano
+            FROM documentos
+            ORDER BY id_carrera, fecha_upload DESC NULLS LAST, id
+        """)
+        documentos: Dict[int, List[dict]] = {}
+        for doc in cursor.fetchall():
+            documentos.setdefault(doc["id_carrera"], []).append({
+                "id": doc["id"],
+                "nombre": doc["nombre"],
+                "fecha_upload": doc["fecha_upload"].isoformat() if doc["fecha_upload"] else None,
+                "tamano": doc["tamano"],
+                "url": f"/documentos/{doc['id']}"
+            })
+
+        resumenes, carreras, horarios = [], {}, {}
+        for fila in filas:
+            id_carrera = fila["id_carrera"]
+            resumen = {
+                "id": id_carrera,
+                "nombre": fila["nombre"],
+                "modalidad": fila["modalidad"],
+                "semestres": fila["semestre"],
+                "costos": {
+                    "inscripcion": _numero(fila["inscripcion"]),
+                    "pre": _numero(fila["pre"]),
+                    "matricula": _numero(fila["matricula"]),
+                    "cuotas_mensuales": _numero(fila["cuotas_mensuales"])
+                }
+            }
+            turnos = [
+                {"turno": turno, "bloques": bloques}
+                for turno, bloques in snapshot.horarios_de(fila["nombre"]).items()
+            ]
+            resumenes.append(resumen)
+            carreras[id_carrera] = recurso({
+                **resumen,
+                "perfil": fila["descripcion"],
+                "horarios": turnos,
+                "documentos": documentos.get(id_carrera, [])
+            })
+            horarios[id_carrera] = recurso({"id_carrera": id_carrera, "horarios": turnos})
+
+        lista = recurso({"carreras": resumenes})
+        with self._lock:
+            self._lista, self._carreras, self._horarios = lista, carreras, horarios
+            self._version = version
+            self.construcciones += 1
+        logger.info(f"Índice del catálogo construido: {len(carreras)} carreras")
+
+    def lista(self) -> Optional[Recurso]:
+        return self._lista
+
+    def carrera(self, id_carrera: int) -> Optional[Recurso]:
+        return self._carreras.get(id_carrera)
+
+    def horarios(self, id_carrera: int) -> Optional[Recurso]:
+        return self._horarios.get(id_carrera)
+
+    def estadisticas(self) -> dict:
+        return {
+            "carreras": len(self._carreras),
+            "construcciones": self.construcciones,
+            "vigente": self.vigente()
+        }
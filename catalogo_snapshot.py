@@ -0,0 +1,353 @@
+"""Snapshot binario del catálogo (carreras, horarios y tablas del detector) compartido entre procesos.
+
+El archivo se compila una vez y cada worker lo abre con mmap: las matrices del
+índice de trigramas se leen directamente de las páginas compartidas y las
+tablas pequeñas se decodifican de una sección JSON. Para publicar una versión
+nueva se escribe un archivo temporal y se renombra sobre el anterior; los
+workers detectan el cambio y cambian de snapshot sin reiniciar.
+
+Los archivos van en un directorio de la aplicación (UBE_DIRECTORIO_DATOS) y
+solo se abren si pertenecen al usuario del proceso y nadie más puede
+escribirlos. Al iniciar, la versión (hash del catálogo de origen) se compara
+con data/ o con el JSON del que se compiló, y si no coincide se compila de nuevo.
+
+Uso:
+    python catalogo_snapshot.py                      # desde los módulos de data/
+    python catalogo_snapshot.py --fuente catalogo.json
+"""
+import os
+import json
+import mmap
+import time
+import struct
+import asyncio
+import hashlib
+import logging
+import argparse
+import tempfile
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from detector_carreras import DetectorCarreras, normalizar
+
+logger = logging.getLogger(__name__)
+
+# Directorio propio de la aplicación para los archivos compilados (no el temporal compartido)
+DIRECTORIO_DATOS = os.getenv("UBE_DIRECTORIO_DATOS", os.path.join(os.path.dirname(os.path.abspath(__file__)), "var"))
+CATALOGO_SNAPSHOT = os.getenv("CATALOGO_SNAPSHOT", os.path.join(DIRECTORIO_DATOS, "ube_catalogo.snap"))
+# Cada cuántos segundos se revisa si hay un snapshot nuevo (0 desactiva la revisión)
+CATALOGO_SNAPSHOT_INTERVALO = float(os.getenv("CATALOGO_SNAPSHOT_INTERVALO", "5"))
+
+MAGICO = b"UBECAT\x00\x00"
+FORMATO = 2
+# mágico, formato, número de secciones, versión (hash del contenido), fecha de compilación
+CABECERA = struct.Struct("<8sHH16sQ")
+# nombre, desplazamiento y tamaño de cada sección
+SECCION = struct.Struct("<16sQQ")
+ALINEACION = 64
+
+
+def fuentes_modulos() -> dict:
+    """Catálogo tal como está en los módulos de data/"""
+    from data.carreras import LISTA_COMPLETA_CARRERAS
+    from data.horario import HORARIO_CARRERA
+    from data.sinonimos import CARRERAS_SINONIMOS
+    from data.variaciones import CARRERAS_VARIACIONES
+
+    return {
+        "carreras": LISTA_COMPLETA_CARRERAS,
+        "horarios": HORARIO_CARRERA,
+        "variaciones": CARRERAS_VARIACIONES,
+        "sinonimos": CARRERAS_SINONIMOS
+    }
+
+
+def fuentes_de(origen: str) -> dict:
+    """Fuentes según el origen guardado en el snapshot: data/ o la ruta del JSON"""
+    if origen == "data":
+        return fuentes_modulos()
+    with open(origen, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def normalizar_horarios(horarios: Dict[str, dict]) -> Dict[str, Dict[str, List[dict]]]:
+    """Horarios por nombre normalizado de la carrera; cada turno es una lista de bloques {dias, horario}.
+
+    Acepta también un solo bloque por turno (el formato anterior de data/horario.py).
+    """
+    resultado = {}
+    for carrera, turnos in horarios.items():
+        resultado[normalizar(carrera)] = {
+            turno: [bloques] if isinstance(bloques, dict) else list(bloques)
+            for turno, bloques in turnos.items()
+        }
+    return resultado
+
+
+def version_de(fuentes: dict) -> str:
+    """Hash del contenido: el mismo catálogo produce siempre la misma versión"""
+    canonico = json.dumps([FORMATO, fuentes], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(canonico.encode("utf-8")).hexdigest()[:16]
+
+
+def escribir_secciones(ruta: str, magico: bytes, formato: int, version: str, secciones: List[Tuple[str, bytes]]):
+    """Escribe un archivo de secciones alineadas de forma atómica (temporal + rename)"""
+    for nombre, _ in secciones:
+        if len(nombre.encode("ascii")) > 16:
+            raise ValueError(f"Nombre de sección demasiado largo: {nombre}")
+    tabla = []
+    posicion = CABECERA.size + SECCION.size * len(secciones)
+    for nombre, datos in secciones:
+        posicion += -posicion % ALINEACION
+        tabla.append((nombre, posicion, len(datos)))
+        posicion += len(datos)
+
+    directorio = os.path.dirname(os.path.abspath(ruta))
+    os.makedirs(directorio, mode=0o700, exist_ok=True)
+    descriptor, temporal = tempfile.mkstemp(prefix=f".{os.path.basename(ruta)}-", dir=directorio)
+    try:
+        with os.fdopen(descriptor, "wb") as f:
+            f.write(CABECERA.pack(magico, formato, len(secciones), version.encode("ascii"), int(time.time())))
+            for nombre, desplazamiento, tamano in tabla:
+                f.write(SECCION.pack(nombre.encode("ascii"), desplazamiento, tamano))
+            for (_, datos), (_, desplazamiento, _) in zip(secciones, tabla):
+                f.write(b"\x00" * (desplazamiento - f.tell()))
+                f.write(datos)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(temporal, 0o644)
+        os.replace(temporal, ruta)
+    except BaseException:
+        os.unlink(temporal)
+        raise
+
+
+class Secciones(NamedTuple):
+    """Un archivo de secciones abierto con mmap"""
+    datos: mmap.mmap
+    version: str
+    creado: int
+    # nombre -> (desplazamiento, tamaño)
+    secciones: Dict[str, Tuple[int, int]]
+    identidad: Tuple
+
+    def bytes(self, nombre: str) -> bytes:
+        desplazamiento, tamano = self.secciones[nombre]
+        return self.datos[desplazamiento:desplazamiento + tamano]
+
+    def arreglo(self, nombre: str, dtype: str, forma) -> np.ndarray:
+        """Vista de solo lectura sobre el mmap: las páginas se comparten entre procesos"""
+        desplazamiento, tamano = self.secciones[nombre]
+        tipo = np.dtype(dtype)
+        return np.frombuffer(
+            self.datos, dtype=tipo, count=tamano // tipo.itemsize, offset=desplazamiento
+        ).reshape(forma)
+
+
+def verificar_propietario(ruta: str, estado: os.stat_result):
+    """Rechaza archivos de otro usuario o que otros pueden escribir"""
+    if hasattr(os, "getuid") and estado.st_uid != os.getuid():
+        raise ValueError(f"{ruta} pertenece a otro usuario (uid {estado.st_uid})")
+    if estado.st_mode & 0o022:
+        raise ValueError(f"{ruta} puede ser modificado por otros usuarios")
+
+
+def leer_secciones(ruta: str, magico: bytes, formato: int, descripcion: str) -> Secciones:
+    with open(ruta, "rb") as f:
+        estado = os.fstat(f.fileno())
+        verificar_propietario(ruta, estado)
+        datos = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    magico_leido, formato_leido, cantidad, version, creado = CABECERA.unpack_from(datos, 0)
+    if magico_leido != magico or formato_leido != formato:
+        raise ValueError(f"{ruta} no es un {descripcion} con formato {formato}")
+    secciones = {}
+    for i in range(cantidad):
+        nombre, desplazamiento, tamano = SECCION.unpack_from(datos, CABECERA.size + i * SECCION.size)
+        if desplazamiento + tamano > len(datos):
+            raise ValueError(f"{descripcion[0].upper()}{descripcion[1:]} truncado: {ruta}")
+        secciones[nombre.rstrip(b"\x00").decode("ascii")] = (desplazamiento, tamano)
+    return Secciones(
+        datos, version.decode("ascii"), creado, secciones,
+        (estado.st_dev, estado.st_ino, estado.st_mtime_ns, estado.st_size)
+    )
+
+
+def compilar(ruta: str = CATALOGO_SNAPSHOT, fuentes: Optional[dict] = None, origen: str = "data") -> str:
+    """Escribe el snapshot de forma atómica y devuelve su versión"""
+    fuentes = fuentes or fuentes_modulos()
+    version = version_de(fuentes)
+    tablas = DetectorCarreras(fuentes["variaciones"], fuentes["sinonimos"]).tablas()
+    indice = tablas.pop("indice")
+
+    arreglos = {
+        "matriz_t": np.ascontiguousarray(indice.pop("matriz_t"), dtype=np.float32),
+        "tamanos": np.ascontiguousarray(indice.pop("tamanos"), dtype=np.float32)
+    }
+    meta = {
+        "origen": origen,
+        "catalogo": {"carreras": fuentes["carreras"], "horarios": normalizar_horarios(fuentes["horarios"])},
+        "detector": {**tablas, "indice": indice},
+        "arreglos": {nombre: {"dtype": a.dtype.str, "forma": a.shape} for nombre, a in arreglos.items()}
+    }
+    secciones = [("meta", json.dumps(meta, ensure_ascii=False).encode("utf-8"))]
+    secciones += [(nombre, a.tobytes()) for nombre, a in arreglos.items()]
+    escribir_secciones(ruta, MAGICO, FORMATO, version, secciones)
+    return version
+
+
+class Snapshot:
+    """Un snapshot abierto: catálogo, horarios y detector listos para usar"""
+
+    def __init__(
+        self, version: str, creado: int, origen: str, catalogo: dict, detector: DetectorCarreras, identidad: Tuple
+    ):
+        self.version = version
+        self.creado = creado
+        self.origen = origen
+        self.carreras: List[str] = catalogo["carreras"]
+        # nombre normalizado -> turno -> bloques
+        self.horarios: Dict[str, Dict[str, List[dict]]] = catalogo["horarios"]
+        self.detector = detector
+        self.identidad = identidad
+
+    def horarios_de(self, carrera: str) -> Dict[str, List[dict]]:
+        """Horarios de la carrera sin importar mayúsculas ni tildes del nombre"""
+        return self.horarios.get(normalizar(carrera), {})
+
+    @classmethod
+    def abrir(cls, ruta: str = CATALOGO_SNAPSHOT) -> "Snapshot":
+        archivo = leer_secciones(ruta, MAGICO, FORMATO, "snapshot de catálogo")
+        meta = json.loads(archivo.bytes("meta").decode("utf-8"))
+        tablas = meta["detector"]
+        tablas["indice"].update({
+            nombre: archivo.arreglo(nombre, info["dtype"], info["forma"]) for nombre, info in meta["arreglos"].items()
+        })
+        return cls(
+            archivo.version,
+            archivo.creado,
+            meta["origen"],
+            meta["catalogo"],
+            DetectorCarreras.desde_tablas(tablas),
+            archivo.identidad
+        )
+
+
+def _identidad(ruta: str) -> Optional[Tuple]:
+    try:
+        estado = os.stat(ruta)
+    except FileNotFoundError:
+        return None
+    return (estado.st_dev, estado.st_ino, estado.st_mtime_ns, estado.st_size)
+
+
+class CatalogoCompartido:
+    """Snapshot vigente del proceso, con recarga atómica.
+
+    `actual` siempre apunta a un snapshot completo: el nuevo se abre y se
+    arma aparte y solo después se reemplaza la referencia, así que una
+    petición en curso sigue usando el que tomó. El anterior se libera cuando
+    nadie lo usa.
+    """
+
+    def __init__(self, ruta: str = CATALOGO_SNAPSHOT, intervalo: float = CATALOGO_SNAPSHOT_INTERVALO):
+        self.ruta = ruta
+        self.intervalo = intervalo
+        self.recargas = 0
+        self.actual = self._abrir_o_compilar()
+
+    def _abrir_o_compilar(self) -> Snapshot:
+        """Abre el snapshot; lo compila de nuevo si falta, está dañado o no coincide con su origen.
+
+        Uno compilado desde un JSON (--fuente) se compara con ese JSON; si el
+        JSON ya no se puede leer, se compila desde data/.
+        """
+        origen = "data"
+        try:
+            snapshot = Snapshot.abrir(self.ruta)
+            origen = snapshot.origen
+            try:
+                fuentes = fuentes_de(origen)
+            except (OSError, ValueError) as e:
+                logger.warning(f"No se puede leer el origen {origen} del snapshot ({str(e)}); se usa data/")
+                origen, fuentes = "data", fuentes_modulos()
+            if origen == snapshot.origen and snapshot.version == version_de(fuentes):
+                return snapshot
+            logger.info(f"El snapshot {snapshot.version} no coincide con {origen}; se compila de nuevo")
+        except FileNotFoundError:
+            logger.info(f"No existe el snapshot de catálogo {self.ruta}; se compila")
+            fuentes = fuentes_modulos()
+        except (ValueError, KeyError, struct.error) as e:
+            logger.error(f"Snapshot de catálogo inválido ({str(e)}); se compila de nuevo")
+            fuentes = fuentes_modulos()
+        version = compilar(self.ruta, fuentes, origen)
+        logger.info(f"Snapshot de catálogo {version} compilado en {self.ruta}")
+        return Snapshot.abrir(self.ruta)
+
+    def recargar(self) -> bool:
+        """Cambia al snapshot del archivo si es otro; True si cambió"""
+        identidad = _identidad(self.ruta)
+        if identidad is None or identidad == self.actual.identidad:
+            return False
+        try:
+            nuevo = Snapshot.abrir(self.ruta)
+        except (OSError, ValueError, KeyError, struct.error) as e:
+            logger.error(f"No se pudo recargar el snapshot de catálogo: {str(e)}")
+            return False
+        anterior, self.actual = self.actual, nuevo
+        self.recargas += 1
+        logger.info(f"Snapshot de catálogo recargado: {anterior.version} -> {nuevo.version}")
+        return True
+
+    async def vigilar(self, al_cambiar: Optional[Callable[[], None]] = None):
+        """Revisa el archivo cada `intervalo` segundos y recarga cuando cambia"""
+        while True:
+            await asyncio.sleep(self.intervalo)
+            try:
+                if await asyncio.to_thread(self.recargar) and al_cambiar:
+                    al_cambiar()
+            except Exception as e:
+                logger.error(f"Error revisando el snapshot de catálogo: {str(e)}")
+
+    @property
+    def carreras(self) -> List[str]:
+        return self.actual.carreras
+
+    def horarios_de(self, carrera: str) -> Dict[str, List[dict]]:
+        return self.actual.horarios_de(carrera)
+
+    @property
+    def detector(self) -> DetectorCarreras:
+        return self.actual.detector
+
+    def estadisticas(self) -> dict:
+        return {
+            "version": self.actual.version,
+            "creado": self.actual.creado,
+            "origen": self.actual.origen,
+            "carreras": len(self.actual.carreras),
+            "recargas": self.recargas,
+            "ruta": self.ruta
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compila el snapshot binario del catálogo")
+    parser.add_argument("--fuente", help="JSON con carreras, horarios, variaciones y sinonimos (por defecto, data/)")
+    parser.add_argument("--salida", default=CATALOGO_SNAPSHOT)
+    args = parser.parse_args()
+
+    fuentes = None
+    if args.fuente:
+        with open(args.fuente, encoding="utf-8") as f:
+            fuentes = json.load(f)
+    inicio = time.perf_counter()
+    version = compilar(args.salida, fuentes, os.path.abspath(args.fuente) if args.fuente else "data")
+    print(f"Snapshot {version} escrito en {args.salida} ({os.path.getsize(args.salida)} bytes, "
+          f"{time.perf_counter() - inicio:.2f} s)")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
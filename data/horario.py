@@ -1,28 +1,20 @@
 HORARIO_CARRERA = {
     "Derecho": {
-        "Nocturno": {
-            "dias": "Lunes a Viernes",
-            "horario": "18H00 a 22H00"
-        },
-        "Viernes, sábados y domingos": {
-            "dias": "Viernes",
-            "horario": "18:00 - 21:00",
-            "dias": "Sábados",
-             "horario": "08H00 a 18H00",
-            "dias": "Domingos",
-             "horario": "08H00 a 12H00",
-        }
+        "Nocturno": [
+            {"dias": "Lunes a Viernes", "horario": "18H00 a 22H00"}
+        ],
+        "Viernes, sábados y domingos": [
+            {"dias": "Viernes", "horario": "18:00 - 21:00"},
+            {"dias": "Sábados", "horario": "08H00 a 18H00"},
+            {"dias": "Domingos", "horario": "08H00 a 12H00"}
+        ]
     },
     "Ingeniería Eléctrica": {
-        "Matutino": {
-            "dias": "Lunes a viernes",
-            "horario": "07H30 a 11H30"
-        },
-           "Fines de semana": {
-            "dias": "Sábados y domingos",
-            "horario": "Sábados y domingos"
-        }
-        
+        "Matutino": [
+            {"dias": "Lunes a viernes", "horario": "07H30 a 11H30"}
+        ],
+        "Fines de semana": [
+            {"dias": "Sábados y domingos", "horario": "Sábados y domingos"}
+        ]
     },
-    
-}
\ No newline at end of file
+}
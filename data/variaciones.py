@@ -63,6 +63,8 @@ CARRERAS_VARIACIONES: Dict[str, List[str]] = {
         "psicólogo",
         "psicologo",
         "psico",
+        "sicología",
+        "sicologia",
         "terapia psicológica"
     ],
     "licenciatura en seguridad y salud ocupacional": [
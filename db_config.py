@@ -1,19 +1,187 @@
+import os
+import time
+import threading
+import logging
+from contextlib import contextmanager
+from typing import Optional
+
 import psycopg2
+from psycopg2 import pool
 from psycopg2.extras import RealDictCursor
 
+from metrics import registro
+
+logger = logging.getLogger(__name__)
+
+DB_PARAMS = {
+    "user": os.getenv("DB_USER", "postgres"),
+    "password": os.getenv("DB_PASSWORD", "root"),
+    "host": os.getenv("DB_HOST", "localhost"),
+    "port": os.getenv("DB_PORT", "5432"),
+    "database": os.getenv("DB_NAME", "UBE"),
+}
+
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "2"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+DB_POOL_CHECK_IDLE = float(os.getenv("DB_POOL_CHECK_IDLE", "30"))
+
+DB_POOL_ESPERA = registro.histograma(
+    "chatbot_db_pool_espera_segundos", "Espera para obtener una conexión del pool de base de datos"
+)
+DB_POOL_AGOTADO = registro.contador(
+    "chatbot_db_pool_agotado_total", "Peticiones que no obtuvieron conexión dentro del timeout"
+)
+
 def get_db_connection():
 
     try:
         conn = psycopg2.connect(
-            user="postgres",
-            password="root",  
-            host="localhost",
-            port="5432",          
-            database="UBE",       
+            **DB_PARAMS,
             cursor_factory=RealDictCursor,
             options="-c client_encoding=utf8"
         )
         conn.set_client_encoding('UTF8')
         return conn
     except psycopg2.Error as e:
-        raise ConnectionError(f"No se pudo conectar a la base de datos: {str(e)}")
\ No newline at end of file
+        raise ConnectionError(f"No se pudo conectar a la base de datos: {str(e)}")
+
+
+class DatabasePool:
+    """Pool de conexiones reutilizables hacia PostgreSQL.
+
+    ThreadedConnectionPool lanza un error cuando se agota; el semáforo hace que
+    quien pida una conexión espere hasta `timeout` segundos a que se libere una.
+    Las conexiones que llevan más de `check_idle` segundos sin usarse se
+    verifican con un SELECT 1 antes de entregarse.
+    """
+
+    def __init__(
+        self,
+        minconn: int = DB_POOL_MIN,
+        maxconn: int = DB_POOL_MAX,
+        timeout: float = DB_POOL_TIMEOUT,
+        check_idle: float = DB_POOL_CHECK_IDLE
+    ):
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.check_idle = check_idle
+        self._pool = None
+        self._lock = threading.Lock()
+        self._disponibles = threading.BoundedSemaphore(maxconn)
+        self._ultimo_uso = {}
+        self._en_uso = 0
+
+    def _get_pool(self) -> pool.ThreadedConnectionPool:
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    try:
+                        self._pool = pool.ThreadedConnectionPool(
+                            self.minconn,
+                            self.maxconn,
+                            **DB_PARAMS,
+                            cursor_factory=RealDictCursor,
+                            options="-c client_encoding=utf8"
+                        )
+                    except psycopg2.Error as e:
+                        raise ConnectionError(f"No se pudo conectar a la base de datos: {str(e)}")
+        return self._pool
+
+    def abrir(self):
+        """Crea las conexiones mínimas del pool"""
+        self._get_pool()
+
+    def _conexion_valida(self, conn) -> bool:
+        if conn.closed:
+            return False
+        if time.monotonic() - self._ultimo_uso.get(id(conn), 0) < self.check_idle:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def obtener(self, timeout: Optional[float] = None):
+        """Toma una conexión del pool, esperando si están todas ocupadas"""
+        inicio = time.perf_counter()
+        disponible = self._disponibles.acquire(timeout=self.timeout if timeout is None else timeout)
+        DB_POOL_ESPERA.observar(time.perf_counter() - inicio)
+        if not disponible:
+            DB_POOL_AGOTADO.inc()
+            raise ConnectionError("No hay conexiones disponibles en el pool de base de datos")
+        try:
+            db_pool = self._get_pool()
+            conn = db_pool.getconn()
+            if not self._conexion_valida(conn):
+                logger.warning("Conexión inválida descartada del pool")
+                self._ultimo_uso.pop(id(conn), None)
+                db_pool.putconn(conn, close=True)
+                conn = db_pool.getconn()
+            with self._lock:
+                self._en_uso += 1
+            return conn
+        except Exception:
+            self._disponibles.release()
+            raise
+
+    def liberar(self, conn):
+        """Devuelve la conexión al pool; si no se puede limpiar, el pool la cierra"""
+        try:
+            descartar = bool(conn.closed)
+            if not descartar:
+                try:
+                    conn.rollback()
+                except psycopg2.Error as e:
+                    logger.warning(f"Conexión descartada al liberarla, falló el rollback: {str(e)}")
+                    descartar = True
+            if descartar:
+                self._ultimo_uso.pop(id(conn), None)
+            else:
+                self._ultimo_uso[id(conn)] = time.monotonic()
+            self._get_pool().putconn(conn, close=descartar)
+        finally:
+            with self._lock:
+                self._en_uso -= 1
+            self._disponibles.release()
+
+    @contextmanager
+    def conexion(self, timeout: Optional[float] = None):
+        conn = self.obtener(timeout)
+        try:
+            yield conn
+        finally:
+            self.liberar(conn)
+
+    def health_check(self, timeout: Optional[float] = None) -> bool:
+        """Comprueba que la base de datos responde"""
+        try:
+            with self.conexion(timeout) as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute("SELECT 1")
+                return True
+        except Exception as e:
+            logger.error(f"Health check de base de datos fallido: {str(e)}")
+            return False
+
+    def estadisticas(self) -> dict:
+        return {
+            "min": self.minconn,
+            "max": self.maxconn,
+            "en_uso": self._en_uso,
+            "abierto": self._pool is not None
+        }
+
+    def cerrar(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.closeall()
+                self._pool = None
+                self._ultimo_uso.clear()
+
+
+db_pool = DatabasePool()
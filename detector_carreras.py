@@ -0,0 +1,355 @@
+"""Detector de carreras compilado una sola vez a partir de sinónimos y variaciones."""
+import re
+import logging
+import unicodedata
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from fuzzywuzzy import fuzz
+
+from data.sinonimos import CARRERAS_SINONIMOS
+from data.variaciones import CARRERAS_VARIACIONES
+
+logger = logging.getLogger(__name__)
+
+LISTA_CARRERAS = "LISTA_CARRERAS"
+PALABRAS_LISTA = ["carreras", "disponibles", "ofrecen", "tienen", "qué estudiar", "qué carreras"]
+
+# Confianza según el tipo de coincidencia
+CONFIANZA_NOMBRE = 1.0
+CONFIANZA_PALABRA_COMPLETA = 0.95
+CONFIANZA_PREFIJO = 0.6
+
+# Palabras más cortas que esto no se corrigen (evita "de" -> "dental")
+LONGITUD_MINIMA_CORRECCION = 4
+# Coeficiente de Dice mínimo entre trigramas para entrar a la lista corta
+DICE_MINIMO = 0.3
+# Puntaje mínimo de fuzz.ratio para aceptar una corrección
+SIMILITUD_MINIMA = 80
+# Diferencia máxima de longitud entre una palabra y su corrección
+DIFERENCIA_LONGITUD_MAXIMA = 2
+
+_NO_ALFANUMERICO = re.compile(r"[^0-9a-z]+")
+# Terminaciones de plural que no convierten la coincidencia en un prefijo
+_PLURALES = {"s", "es"}
+
+
+def normalizar(texto: str) -> str:
+    """Minúsculas, sin tildes y con un solo espacio entre palabras"""
+    texto = texto.lower()
+    if not texto.isascii():
+        texto = unicodedata.normalize("NFKD", texto).encode("ascii", "ignore").decode("ascii")
+    return _NO_ALFANUMERICO.sub(" ", texto).strip()
+
+
+def _regex_trie(patrones: Iterable[str]) -> str:
+    """Arma una alternancia en forma de trie ("d(?:ental|erecho)").
+
+    El motor de re solo explora la rama del carácter actual en lugar de probar
+    cada patrón, y los cuantificadores codiciosos dan la coincidencia más larga.
+    """
+    trie: dict = {}
+    for patron in patrones:
+        nodo = trie
+        for caracter in patron:
+            nodo = nodo.setdefault(caracter, {})
+        nodo[""] = True
+
+    def construir(nodo: dict) -> str:
+        ramas = [re.escape(c) + construir(hijo) for c, hijo in sorted(nodo.items()) if c]
+        if not ramas:
+            return ""
+        cuerpo = ramas[0] if len(ramas) == 1 else "(?:" + "|".join(ramas) + ")"
+        if "" in nodo:
+            return ("(?:" + cuerpo + ")" if len(ramas) == 1 else cuerpo) + "?"
+        return cuerpo
+
+    return construir(trie)
+
+
+def correccion_plausible(palabra: str, candidata: str) -> bool:
+    """Descarta correcciones que son otra palabra y no una falta de ortografía.
+
+    Si la palabra del catálogo está contenida en la desconocida ("sistema" en
+    "ecosistema") la desconocida es una palabra distinta; además se exige la
+    misma inicial y una longitud parecida.
+    """
+    return (
+        candidata not in palabra
+        and palabra[:1] == candidata[:1]
+        and abs(len(palabra) - len(candidata)) <= DIFERENCIA_LONGITUD_MAXIMA
+    )
+
+
+def ngramas(palabra: str, n: int = 3) -> List[str]:
+    relleno = f" {palabra} "
+    return [relleno[i:i + n] for i in range(len(relleno) - n + 1)]
+
+
+class IndiceNgramas:
+    """Índice de trigramas de caracteres sobre las palabras del catálogo.
+
+    Cada palabra del catálogo es una fila binaria de una matriz de trigramas.
+    Una palabra desconocida se multiplica contra esa matriz para obtener, con
+    el coeficiente de Dice, una lista corta de candidatas; solo esas se puntúan
+    con fuzz.ratio. Las correcciones se recuerdan porque las mismas faltas de
+    ortografía se repiten mucho. Las candidatas que no pasan
+    `correccion_plausible` no se puntúan.
+    """
+
+    def __init__(
+        self,
+        palabras: Iterable[str],
+        candidatos: int = 3,
+        similitud_minima: int = SIMILITUD_MINIMA,
+        max_cache: int = 10000
+    ):
+        self.palabras = sorted(set(palabras))
+        self.candidatos = min(candidatos, len(self.palabras))
+        self.similitud_minima = similitud_minima
+        self.max_cache = max_cache
+        self._cache: Dict[str, Optional[Tuple[str, float]]] = {}
+
+        self._vocabulario: Dict[str, int] = {}
+        filas, columnas = [], []
+        for i, palabra in enumerate(self.palabras):
+            for ngrama in set(ngramas(palabra)):
+                filas.append(i)
+                columnas.append(self._vocabulario.setdefault(ngrama, len(self._vocabulario)))
+        matriz = np.zeros((len(self.palabras), len(self._vocabulario)), dtype=np.float32)
+        matriz[filas, columnas] = 1.0
+        self._matriz_t = np.ascontiguousarray(matriz.T)
+        self._tamanos = matriz.sum(axis=1)
+
+    @classmethod
+    def desde_tablas(
+        cls,
+        palabras: List[str],
+        vocabulario: List[str],
+        matriz_t: np.ndarray,
+        tamanos: np.ndarray,
+        candidatos: int = 3,
+        similitud_minima: int = SIMILITUD_MINIMA,
+        max_cache: int = 10000
+    ) -> "IndiceNgramas":
+        """Índice a partir de tablas ya calculadas; las matrices pueden ser vistas de solo lectura (mmap)"""
+        indice = cls.__new__(cls)
+        indice.palabras = list(palabras)
+        indice.candidatos = min(candidatos, len(indice.palabras))
+        indice.similitud_minima = similitud_minima
+        indice.max_cache = max_cache
+        indice._cache = {}
+        indice._vocabulario = {ngrama: i for i, ngrama in enumerate(vocabulario)}
+        indice._matriz_t = matriz_t
+        indice._tamanos = tamanos
+        return indice
+
+    def tablas(self) -> dict:
+        """Lo necesario para reconstruir el índice con `desde_tablas`"""
+        return {
+            "palabras": self.palabras,
+            "vocabulario": sorted(self._vocabulario, key=self._vocabulario.get),
+            "matriz_t": self._matriz_t,
+            "tamanos": self._tamanos
+        }
+
+    def _vectorizar(self, palabras: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        matriz = np.zeros((len(palabras), len(self._vocabulario)), dtype=np.float32)
+        tamanos = np.empty(len(palabras), dtype=np.float32)
+        for i, palabra in enumerate(palabras):
+            propios = set(ngramas(palabra))
+            tamanos[i] = len(propios)
+            columnas = [self._vocabulario[g] for g in propios if g in self._vocabulario]
+            matriz[i, columnas] = 1.0
+        return matriz, tamanos
+
+    def corregir(self, palabras: Iterable[str], bloque: int = 4096) -> Dict[str, Tuple[str, float]]:
+        """Devuelve {palabra: (palabra_del_catalogo, similitud 0-1)} para las que se pudieron corregir"""
+        correcciones = {}
+        pendientes = []
+        for palabra in set(palabras):
+            if palabra in self._cache:
+                if self._cache[palabra]:
+                    correcciones[palabra] = self._cache[palabra]
+            else:
+                pendientes.append(palabra)
+
+        if not pendientes or not self.candidatos:
+            return correcciones
+
+        for inicio in range(0, len(pendientes), bloque):
+            lote = pendientes[inicio:inicio + bloque]
+            matriz, tamanos = self._vectorizar(lote)
+            dice = 2 * (matriz @ self._matriz_t) / (tamanos[:, None] + self._tamanos[None, :])
+            mejores = np.argpartition(-dice, self.candidatos - 1, axis=1)[:, :self.candidatos]
+
+            for i, palabra in enumerate(lote):
+                elegida = None
+                for j in mejores[i]:
+                    if dice[i, j] < DICE_MINIMO or not correccion_plausible(palabra, self.palabras[j]):
+                        continue
+                    puntaje = fuzz.ratio(palabra, self.palabras[j])
+                    if puntaje >= self.similitud_minima and (elegida is None or puntaje > elegida[1]):
+                        elegida = (self.palabras[j], puntaje)
+                resultado = (elegida[0], elegida[1] / 100) if elegida else None
+                if len(self._cache) >= self.max_cache:
+                    self._cache.clear()
+                self._cache[palabra] = resultado
+                if resultado:
+                    correcciones[palabra] = resultado
+
+        return correcciones
+
+
+class Deteccion(NamedTuple):
+    carrera: Optional[str]
+    confianza: float
+
+
+class DetectorCarreras:
+    """Reconoce la carrera mencionada en un mensaje en una sola pasada.
+
+    Todos los nombres, sinónimos y variaciones se normalizan y se compilan en
+    una única expresión regular con forma de trie que exige límite de palabra
+    al inicio. Si el patrón termina a
+    mitad de una palabra ("fisio" en "fisioterapia") cuenta como prefijo, con
+    menos confianza, salvo que lo que sigue sea un plural. Gana la carrera con
+    la coincidencia más confiable y, a igualdad, la que cubre más texto.
+    """
+
+    def __init__(
+        self,
+        variaciones: Dict[str, List[str]] = CARRERAS_VARIACIONES,
+        sinonimos: Dict[str, str] = CARRERAS_SINONIMOS,
+        palabras_lista: Iterable[str] = PALABRAS_LISTA
+    ):
+        self._patrones: Dict[str, Tuple[str, bool]] = {}
+        for carrera, lista in variaciones.items():
+            self._agregar(carrera, carrera, es_nombre=True)
+            for variacion in lista:
+                self._agregar(variacion, carrera)
+        for sinonimo, carrera in sinonimos.items():
+            self._agregar(sinonimo, carrera)
+        # Las palabras de listado van en el mismo autómata, pero solo cuentan
+        # si no se reconoce ninguna carrera
+        for palabra in palabras_lista:
+            self._agregar(palabra, LISTA_CARRERAS)
+
+        self._regex = re.compile(r"\b(?:" + _regex_trie(self._patrones) + r")(\w*)")
+        self._palabras_catalogo = {
+            palabra
+            for patron in self._patrones
+            for palabra in patron.split()
+            if len(palabra) >= LONGITUD_MINIMA_CORRECCION
+        }
+        self._indice = IndiceNgramas(self._palabras_catalogo)
+
+    @classmethod
+    def desde_tablas(cls, tablas: dict) -> "DetectorCarreras":
+        """Detector a partir de las tablas de `tablas()` sin volver a armar el trie ni el índice"""
+        detector = cls.__new__(cls)
+        detector._patrones = {patron: (carrera, es_nombre) for patron, (carrera, es_nombre) in tablas["patrones"].items()}
+        detector._regex = re.compile(tablas["regex"])
+        detector._palabras_catalogo = set(tablas["palabras_catalogo"])
+        detector._indice = IndiceNgramas.desde_tablas(**tablas["indice"])
+        return detector
+
+    def tablas(self) -> dict:
+        """Patrones, expresión regular y tablas del índice de trigramas ya calculados"""
+        return {
+            "patrones": {patron: [carrera, es_nombre] for patron, (carrera, es_nombre) in self._patrones.items()},
+            "regex": self._regex.pattern,
+            "palabras_catalogo": sorted(self._palabras_catalogo),
+            "indice": self._indice.tablas()
+        }
+
+    def _agregar(self, texto: str, carrera: str, es_nombre: bool = False):
+        patron = normalizar(texto)
+        if not patron:
+            return
+        previo = self._patrones.get(patron)
+        if previo and previo[0] != carrera:
+            logger.warning(f"Patrón '{patron}' asignado a '{previo[0]}' y '{carrera}'; se conserva el primero")
+            return
+        self._patrones[patron] = (carrera, es_nombre or (previo[1] if previo else False))
+
+    def _detectar_exacto(self, normalizado: str) -> Deteccion:
+        mejor: Dict[str, Tuple[float, int]] = {}
+        pide_lista = False
+        for match in self._regex.finditer(normalizado):
+            resto = match.group(1)
+            patron = match.group(0)[:len(match.group(0)) - len(resto)]
+            carrera, es_nombre = self._patrones[patron]
+            if carrera == LISTA_CARRERAS:
+                pide_lista = pide_lista or not resto
+                continue
+            if resto and resto not in _PLURALES:
+                confianza = CONFIANZA_PREFIJO
+            elif es_nombre:
+                confianza = CONFIANZA_NOMBRE
+            else:
+                confianza = CONFIANZA_PALABRA_COMPLETA
+
+            actual = mejor.get(carrera, (0.0, 0))
+            mejor[carrera] = (max(actual[0], confianza), actual[1] + len(patron))
+
+        if mejor:
+            carrera, (confianza, _) = max(mejor.items(), key=lambda item: item[1])
+            return Deteccion(carrera, confianza)
+
+        if pide_lista:
+            return Deteccion(LISTA_CARRERAS, 1.0)
+
+        return Deteccion(None, 0.0)
+
+    def _desconocidas(self, normalizado: str) -> List[str]:
+        return [
+            palabra for palabra in normalizado.split()
+            if len(palabra) >= LONGITUD_MINIMA_CORRECCION and palabra not in self._palabras_catalogo
+        ]
+
+    def _detectar_corregido(self, normalizado: str, correcciones: Dict[str, Tuple[str, float]]) -> Deteccion:
+        """Reemplaza las palabras corregidas y vuelve a pasar el autómata.
+
+        La confianza se multiplica por la menor similitud de las correcciones usadas.
+        """
+        palabras = normalizado.split()
+        usadas = [correcciones[p] for p in palabras if p in correcciones]
+        if not usadas:
+            return Deteccion(None, 0.0)
+        corregido = " ".join(correcciones[p][0] if p in correcciones else p for p in palabras)
+        deteccion = self._detectar_exacto(corregido)
+        if not deteccion.carrera:
+            return deteccion
+        similitud = min(similitud for _, similitud in usadas)
+        return Deteccion(deteccion.carrera, round(deteccion.confianza * similitud, 2))
+
+    def detectar(self, texto: str) -> Deteccion:
+        """Devuelve la carrera canónica con su confianza, LISTA_CARRERAS o None"""
+        normalizado = normalizar(texto)
+        deteccion = self._detectar_exacto(normalizado)
+        if deteccion.confianza >= CONFIANZA_PALABRA_COMPLETA:
+            return deteccion
+
+        correcciones = self._indice.corregir(self._desconocidas(normalizado))
+        return max(deteccion, self._detectar_corregido(normalizado, correcciones), key=lambda d: d.confianza)
+
+    def classify_many(self, textos: Iterable[str]) -> List[Deteccion]:
+        """Clasifica un lote de mensajes.
+
+        Las palabras desconocidas de todos los mensajes sin coincidencia exacta
+        clara se deduplican y se corrigen juntas con una sola multiplicación de matrices.
+        """
+        normalizados = [normalizar(texto) for texto in textos]
+        resultados = [self._detectar_exacto(n) for n in normalizados]
+
+        dudosos = [i for i, deteccion in enumerate(resultados) if deteccion.confianza < CONFIANZA_PALABRA_COMPLETA]
+        desconocidas = {p for i in dudosos for p in self._desconocidas(normalizados[i])}
+        if desconocidas:
+            correcciones = self._indice.corregir(desconocidas)
+            for i in dudosos:
+                corregido = self._detectar_corregido(normalizados[i], correcciones)
+                if corregido.confianza > resultados[i].confianza:
+                    resultados[i] = corregido
+
+        return resultados
@@ -0,0 +1,399 @@
+"""Índice BM25 de los PDF de cada carrera, para poner en el prompt solo los fragmentos relevantes.
+
+La ingesta es un proceso aparte: extrae el texto de documentos.contenido, lo
+divide en fragmentos y escribe el índice en un archivo de secciones (el mismo
+formato del snapshot de catálogo) que la API abre con mmap. Es incremental:
+solo se vuelven a leer los documentos nuevos o con otra fecha_upload; los
+demás conservan los fragmentos del índice anterior.
+
+Uso:
+    python documentos_indice.py                 # actualiza el índice
+    python documentos_indice.py --completo      # vuelve a extraer todos los documentos
+    python documentos_indice.py --buscar 3 "requisitos de titulación"
+
+Requiere pypdf solo para la ingesta; la API únicamente lee el índice.
+"""
+import io
+import os
+import json
+import time
+import struct
+import asyncio
+import hashlib
+import logging
+import argparse
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from catalogo_snapshot import DIRECTORIO_DATOS, Secciones, escribir_secciones, leer_secciones
+from db_config import get_db_connection
+from detector_carreras import normalizar
+
+logger = logging.getLogger(__name__)
+
+DOCUMENTOS_INDICE = os.getenv("DOCUMENTOS_INDICE", os.path.join(DIRECTORIO_DATOS, "ube_documentos.idx"))
+# Cada cuántos segundos la API revisa si la ingesta publicó un índice nuevo (0 desactiva la revisión)
+DOCUMENTOS_INDICE_INTERVALO = float(os.getenv("DOCUMENTOS_INDICE_INTERVALO", "30"))
+DOCUMENTOS_FRAGMENTO_PALABRAS = int(os.getenv("DOCUMENTOS_FRAGMENTO_PALABRAS", "120"))
+DOCUMENTOS_FRAGMENTO_SOLAPAMIENTO = int(os.getenv("DOCUMENTOS_FRAGMENTO_SOLAPAMIENTO", "30"))
+# Fragmentos que se agregan al prompt por consulta
+DOCUMENTOS_FRAGMENTOS = int(os.getenv("DOCUMENTOS_FRAGMENTOS", "3"))
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+MAGICO = b"UBEDOC\x00\x00"
+FORMATO = 1
+
+# Palabras frecuentes que no ayudan a elegir un fragmento
+PALABRAS_VACIAS = {
+    "las", "los", "del", "con", "por", "para", "que", "una", "uno", "unos", "unas", "como", "mas", "pero",
+    "sus", "este", "esta", "estos", "estas", "ese", "esa", "son", "ser", "sera", "han", "hay", "muy", "sin",
+    "sobre", "entre", "cual", "cuales", "donde", "cuando", "tiene", "tienen", "quiero", "info", "informacion"
+}
+
+
+class Fragmento(NamedTuple):
+    texto: str
+    documento: str
+    puntaje: float
+
+
+def terminos(texto: str) -> List[str]:
+    """Palabras normalizadas sin las vacías; el plural en -s se reduce al singular"""
+    resultado = []
+    for palabra in normalizar(texto).split():
+        if len(palabra) < 3 or palabra in PALABRAS_VACIAS:
+            continue
+        resultado.append(palabra[:-1] if len(palabra) > 4 and palabra.endswith("s") else palabra)
+    return resultado
+
+
+def fragmentar(
+    texto: str,
+    palabras: int = DOCUMENTOS_FRAGMENTO_PALABRAS,
+    solapamiento: int = DOCUMENTOS_FRAGMENTO_SOLAPAMIENTO
+) -> List[str]:
+    """Ventanas de `palabras` palabras que se solapan, para no cortar una idea entre dos fragmentos"""
+    lista = texto.split()
+    if not lista:
+        return []
+    paso = max(palabras - solapamiento, 1)
+    return [" ".join(lista[i:i + palabras]) for i in range(0, max(len(lista) - solapamiento, 1), paso)]
+
+
+def extraer_texto(contenido: bytes) -> str:
+    from pypdf import PdfReader
+
+    lector = PdfReader(io.BytesIO(contenido))
+    return "\n".join(pagina.extract_text() or "" for pagina in lector.pages)
+
+
+def construir_bm25(fragmentos: List[List[str]], k1: float = BM25_K1, b: float = BM25_B) -> dict:
+    """Listas invertidas con el peso BM25 de cada término en cada fragmento ya calculado.
+
+    Las listas de un término quedan ordenadas por número de fragmento, así que
+    las de una carrera (fragmentos contiguos) se ubican con searchsorted.
+    """
+    vocabulario: Dict[str, int] = {}
+    filas, columnas = [], []
+    for i, lista in enumerate(fragmentos):
+        for termino in lista:
+            filas.append(i)
+            columnas.append(vocabulario.setdefault(termino, len(vocabulario)))
+    total = len(fragmentos)
+    filas = np.asarray(filas, dtype=np.int64)
+    columnas = np.asarray(columnas, dtype=np.int64)
+
+    largos = np.bincount(filas, minlength=total).astype(np.float32)
+    unicas, frecuencias = np.unique(columnas * max(total, 1) + filas, return_counts=True)
+    termino, fragmento = unicas // max(total, 1), unicas % max(total, 1)
+    df = np.bincount(termino, minlength=len(vocabulario))
+    idf = np.log1p((total - df + 0.5) / (df + 0.5))
+    promedio = float(largos.mean()) if total and largos.any() else 1.0
+    tf = frecuencias.astype(np.float32)
+    pesos = idf[termino] * tf * (k1 + 1) / (tf + k1 * (1 - b + b * largos[fragmento] / promedio))
+
+    posiciones = np.zeros(len(vocabulario) + 1, dtype=np.int64)
+    np.cumsum(df, out=posiciones[1:])
+    return {
+        "vocabulario": sorted(vocabulario, key=vocabulario.get),
+        "terminos_pos": posiciones,
+        "lista_fragmento": fragmento.astype(np.int32),
+        "lista_peso": pesos.astype(np.float32)
+    }
+
+
+class IndiceDocumentos:
+    """Un índice abierto: fragmentos por carrera y listas invertidas sobre el mmap"""
+
+    def __init__(self, archivo: Secciones, meta: dict, arreglos: Dict[str, np.ndarray]):
+        self.archivo = archivo
+        self.version = archivo.version
+        self.creado = archivo.creado
+        self.documentos: List[dict] = meta["documentos"]
+        self.carreras: Dict[int, Tuple[int, int]] = {int(k): tuple(v) for k, v in meta["carreras"].items()}
+        self._nombres = {doc["id"]: doc["nombre"] for doc in self.documentos}
+        self._vocabulario = {termino: i for i, termino in enumerate(meta["vocabulario"])}
+        self._textos_inicio = archivo.secciones["textos"][0]
+        self._textos_pos = arreglos["textos_pos"]
+        self._fragmento_documento = arreglos["fragmento_doc"]
+        self._terminos_pos = arreglos["terminos_pos"]
+        self._lista_fragmento = arreglos["lista_fragmento"]
+        self._lista_peso = arreglos["lista_peso"]
+        self.identidad = archivo.identidad
+
+    @classmethod
+    def abrir(cls, ruta: str = DOCUMENTOS_INDICE) -> "IndiceDocumentos":
+        archivo = leer_secciones(ruta, MAGICO, FORMATO, "índice de documentos")
+        meta = json.loads(archivo.bytes("meta").decode("utf-8"))
+        arreglos = {
+            nombre: archivo.arreglo(nombre, info["dtype"], info["forma"]) for nombre, info in meta["arreglos"].items()
+        }
+        return cls(archivo, meta, arreglos)
+
+    @property
+    def fragmentos(self) -> int:
+        return len(self._fragmento_documento)
+
+    def texto(self, fragmento: int) -> str:
+        inicio = self._textos_inicio + int(self._textos_pos[fragmento])
+        fin = self._textos_inicio + int(self._textos_pos[fragmento + 1])
+        return self.archivo.datos[inicio:fin].decode("utf-8")
+
+    def textos_documento(self, documento: dict) -> List[str]:
+        return [self.texto(i) for i in range(*documento["fragmentos"])]
+
+    def buscar(self, id_carrera: int, consulta: str, k: int) -> List[Fragmento]:
+        """Los k fragmentos de los documentos de la carrera con mayor puntaje BM25 para la consulta"""
+        rango = self.carreras.get(id_carrera)
+        if rango is None or k <= 0:
+            return []
+        inicio, fin = rango
+        puntajes = np.zeros(fin - inicio, dtype=np.float32)
+        for termino in set(terminos(consulta)):
+            i = self._vocabulario.get(termino)
+            if i is None:
+                continue
+            desde, hasta = int(self._terminos_pos[i]), int(self._terminos_pos[i + 1])
+            fragmentos = self._lista_fragmento[desde:hasta]
+            a, b = np.searchsorted(fragmentos, (inicio, fin))
+            puntajes[fragmentos[a:b] - inicio] += self._lista_peso[desde + a:desde + b]
+
+        candidatos = np.flatnonzero(puntajes)
+        if len(candidatos) > k:
+            candidatos = candidatos[np.argpartition(puntajes[candidatos], -k)[-k:]]
+        candidatos = candidatos[np.argsort(-puntajes[candidatos], kind="stable")]
+        return [
+            Fragmento(
+                self.texto(inicio + int(i)),
+                self._nombres.get(int(self._fragmento_documento[inicio + i]), ""),
+                float(puntajes[i])
+            )
+            for i in candidatos
+        ]
+
+
+def escribir(ruta: str, documentos: List[dict], textos: Dict[int, List[str]]) -> str:
+    """Arma el índice completo a partir de los fragmentos de cada documento y lo publica"""
+    documentos = sorted(documentos, key=lambda d: (d["id_carrera"], d["id"]))
+    lista_textos, fragmento_documento, carreras = [], [], {}
+    for doc in documentos:
+        inicio = len(lista_textos)
+        lista_textos.extend(textos.get(doc["id"], []))
+        fragmento_documento.extend([doc["id"]] * (len(lista_textos) - inicio))
+        doc["fragmentos"] = [inicio, len(lista_textos)]
+        rango = carreras.setdefault(doc["id_carrera"], [inicio, inicio])
+        rango[1] = len(lista_textos)
+
+    bm25 = construir_bm25([terminos(t) for t in lista_textos])
+    codificados = [t.encode("utf-8") for t in lista_textos]
+    textos_pos = np.zeros(len(codificados) + 1, dtype=np.int64)
+    np.cumsum([len(t) for t in codificados], out=textos_pos[1:])
+    arreglos = {
+        "textos_pos": textos_pos,
+        "fragmento_doc": np.asarray(fragmento_documento, dtype=np.int32),
+        "terminos_pos": bm25["terminos_pos"],
+        "lista_fragmento": bm25["lista_fragmento"],
+        "lista_peso": bm25["lista_peso"]
+    }
+    meta = {
+        "documentos": documentos,
+        "carreras": carreras,
+        "vocabulario": bm25["vocabulario"],
+        "parametros": {
+            "palabras": DOCUMENTOS_FRAGMENTO_PALABRAS, "solapamiento": DOCUMENTOS_FRAGMENTO_SOLAPAMIENTO,
+            "k1": BM25_K1, "b": BM25_B
+        },
+        "arreglos": {nombre: {"dtype": a.dtype.str, "forma": a.shape} for nombre, a in arreglos.items()}
+    }
+    version = hashlib.sha256(
+        json.dumps([FORMATO, documentos, meta["parametros"]], sort_keys=True).encode("utf-8")
+    ).hexdigest()[:16]
+    secciones = [("meta", json.dumps(meta, ensure_ascii=False).encode("utf-8")), ("textos", b"".join(codificados))]
+    secciones += [(nombre, np.ascontiguousarray(a).tobytes()) for nombre, a in arreglos.items()]
+    escribir_secciones(ruta, MAGICO, FORMATO, version, secciones)
+    return version
+
+
+def actualizar(ruta: str = DOCUMENTOS_INDICE, completo: bool = False) -> dict:
+    """Extrae los documentos nuevos o modificados y publica el índice si algo cambió"""
+    try:
+        import pypdf  # noqa: F401
+    except ImportError:
+        raise RuntimeError("La ingesta de documentos necesita pypdf (pip install pypdf)")
+
+    anterior = None
+    if not completo:
+        try:
+            anterior = IndiceDocumentos.abrir(ruta)
+        except FileNotFoundError:
+            pass
+        except (ValueError, KeyError, struct.error) as e:
+            logger.warning(f"Índice de documentos inválido ({str(e)}); se reconstruye completo")
+    previos = {doc["id"]: doc for doc in anterior.documentos} if anterior else {}
+
+    resumen = {"documentos": 0, "extraidos": 0, "reutilizados": 0, "fallidos": 0, "eliminados": 0, "version": None}
+    documentos, textos = [], {}
+    conn = get_db_connection()
+    try:
+        with conn, conn.cursor() as cursor:
+            # Solo metadatos; el contenido se lee de a un documento. Sin carrera no hay búsqueda que lo use
+            cursor.execute(
+                "SELECT id, id_carrera, nombre, fecha_upload FROM documentos WHERE id_carrera IS NOT NULL ORDER BY id"
+            )
+            filas = cursor.fetchall()
+            for fila in filas:
+                doc = {
+                    "id": fila["id"],
+                    "id_carrera": fila["id_carrera"],
+                    "nombre": fila["nombre"],
+                    "fecha_upload": fila["fecha_upload"].isoformat() if fila["fecha_upload"] else None
+                }
+                previo = previos.get(doc["id"])
+                # Sin fecha_upload no se sabe si cambió: se vuelve a extraer
+                if (previo and doc["fecha_upload"] and previo["fecha_upload"] == doc["fecha_upload"]
+                        and previo["id_carrera"] == doc["id_carrera"]):
+                    textos[doc["id"]] = anterior.textos_documento(previo)
+                    resumen["reutilizados"] += 1
+                else:
+                    cursor.execute("SELECT contenido FROM documentos WHERE id = %s", (doc["id"],))
+                    try:
+                        textos[doc["id"]] = fragmentar(extraer_texto(bytes(cursor.fetchone()["contenido"])))
+                        resumen["extraidos"] += 1
+                    except Exception as e:
+                        # Queda sin fragmentos hasta que se suba otra versión (otra fecha_upload)
+                        textos[doc["id"]] = []
+                        resumen["fallidos"] += 1
+                        logger.warning(f"No se pudo extraer el texto de {doc['nombre']} (id {doc['id']}): {str(e)}")
+                documentos.append(doc)
+    finally:
+        conn.close()
+
+    resumen["documentos"] = len(documentos)
+    resumen["eliminados"] = len(set(previos) - {doc["id"] for doc in documentos})
+    if anterior and not resumen["extraidos"] and not resumen["fallidos"] and not resumen["eliminados"]:
+        resumen["version"] = anterior.version
+        return resumen
+    resumen["version"] = escribir(ruta, documentos, textos)
+    return resumen
+
+
+def _identidad(ruta: str) -> Optional[Tuple]:
+    try:
+        estado = os.stat(ruta)
+    except FileNotFoundError:
+        return None
+    return (estado.st_dev, estado.st_ino, estado.st_mtime_ns, estado.st_size)
+
+
+class DocumentosCompartidos:
+    """Índice de documentos vigente del proceso, con recarga atómica como el snapshot de catálogo.
+
+    Si todavía no se ejecutó la ingesta no hay índice y las búsquedas no
+    devuelven nada; el prompt sigue listando solo los nombres de los archivos.
+    """
+
+    def __init__(self, ruta: str = DOCUMENTOS_INDICE, intervalo: float = DOCUMENTOS_INDICE_INTERVALO):
+        self.ruta = ruta
+        self.intervalo = intervalo
+        self.recargas = 0
+        self.busquedas = 0
+        self.actual: Optional[IndiceDocumentos] = None
+        self._identidad: Optional[Tuple] = None
+        self.recargar()
+        if self.actual is None:
+            logger.info(f"No hay índice de documentos en {self.ruta} (ejecute documentos_indice.py)")
+
+    def recargar(self) -> bool:
+        """Abre el índice del archivo si es otro; True si cambió"""
+        identidad = _identidad(self.ruta)
+        if identidad is None or identidad == self._identidad:
+            return False
+        try:
+            nuevo = IndiceDocumentos.abrir(self.ruta)
+        except (OSError, ValueError, KeyError, struct.error) as e:
+            logger.error(f"No se pudo abrir el índice de documentos: {str(e)}")
+            return False
+        anterior, self.actual, self._identidad = self.actual, nuevo, nuevo.identidad
+        if anterior is not None:
+            self.recargas += 1
+            logger.info(f"Índice de documentos recargado: {anterior.version} -> {nuevo.version}")
+        return True
+
+    async def vigilar(self):
+        """Revisa el archivo cada `intervalo` segundos y recarga cuando cambia"""
+        while True:
+            await asyncio.sleep(self.intervalo)
+            try:
+                await asyncio.to_thread(self.recargar)
+            except Exception as e:
+                logger.error(f"Error revisando el índice de documentos: {str(e)}")
+
+    def buscar(self, id_carrera: Optional[int], consulta: str, k: int = DOCUMENTOS_FRAGMENTOS) -> List[Fragmento]:
+        indice = self.actual
+        if indice is None or id_carrera is None:
+            return []
+        self.busquedas += 1
+        return indice.buscar(id_carrera, consulta, k)
+
+    def estadisticas(self) -> dict:
+        indice = self.actual
+        return {
+            "version": indice.version if indice else None,
+            "documentos": len(indice.documentos) if indice else 0,
+            "fragmentos": indice.fragmentos if indice else 0,
+            "recargas": self.recargas,
+            "busquedas": self.busquedas,
+            "ruta": self.ruta
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Índice BM25 de los documentos de las carreras")
+    parser.add_argument("--salida", default=DOCUMENTOS_INDICE)
+    parser.add_argument("--completo", action="store_true", help="vuelve a extraer todos los documentos")
+    parser.add_argument("--buscar", nargs=2, metavar=("ID_CARRERA", "CONSULTA"), help="prueba una búsqueda")
+    parser.add_argument("-k", type=int, default=DOCUMENTOS_FRAGMENTOS)
+    args = parser.parse_args()
+
+    if args.buscar:
+        indice = IndiceDocumentos.abrir(args.salida)
+        inicio = time.perf_counter()
+        fragmentos = indice.buscar(int(args.buscar[0]), args.buscar[1], args.k)
+        print(f"{len(fragmentos)} fragmentos en {(time.perf_counter() - inicio) * 1000:.2f} ms")
+        for fragmento in fragmentos:
+            print(f"\n[{fragmento.puntaje:.2f}] {fragmento.documento}\n{fragmento.texto}")
+        return
+
+    inicio = time.perf_counter()
+    resumen = actualizar(args.salida, args.completo)
+    print(f"Índice {resumen['version']} en {args.salida}: {resumen['documentos']} documentos, "
+          f"{resumen['extraidos']} extraídos, {resumen['reutilizados']} sin cambios, "
+          f"{resumen['fallidos']} sin texto, {resumen['eliminados']} eliminados "
+          f"({time.perf_counter() - inicio:.2f} s)")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
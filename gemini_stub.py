@@ -0,0 +1,155 @@
+"""Servidor local que imita la API de Gemini para pruebas sin conexión.
+
+Uso:
+    GEMINI_STUB_LATENCIA=0.5 python gemini_stub.py
+    GEMINI_STUB_ERROR_TASA=0.3 GEMINI_STUB_RETRY_AFTER=1 python gemini_stub.py
+    GEMINI_BASE_URL=http://localhost:8081 python api.py
+"""
+import asyncio
+import json
+import os
+import random
+import time
+import uuid
+from datetime import datetime, timezone
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+LATENCIA = float(os.getenv("GEMINI_STUB_LATENCIA", "0.2"))
+# Tiempo hasta el primer fragmento y entre fragmentos en modo streaming
+LATENCIA_PRIMER_TOKEN = float(os.getenv("GEMINI_STUB_TTFT", "0.05"))
+LATENCIA_FRAGMENTO = float(os.getenv("GEMINI_STUB_LATENCIA_FRAGMENTO", "0.02"))
+RESPUESTA = os.getenv(
+    "GEMINI_STUB_RESPUESTA",
+    "¡Hola! Soy Sara 😊 Esta es una respuesta de prueba del servidor local."
+)
+
+# Fracción de llamadas que fallan con ERROR_ESTADO (p. ej. 429 con Retry-After) para probar los reintentos
+ERROR_TASA = float(os.getenv("GEMINI_STUB_ERROR_TASA", "0"))
+ERROR_ESTADO = int(os.getenv("GEMINI_STUB_ERROR_ESTADO", "429"))
+ERROR_RETRY_AFTER = os.getenv("GEMINI_STUB_RETRY_AFTER", "")
+
+app = FastAPI()
+
+# nombre -> (expira_en, prefijo) de los cachedContents creados
+contenidos_cacheados = {}
+
+
+def uso(cuerpo: dict, respuesta: str) -> dict:
+    """usageMetadata aproximado: cuatro caracteres por token"""
+    entrada = sum(len(part.get("text", "")) for c in cuerpo.get("contents", []) for part in c.get("parts", []))
+    cacheados = 0
+    if cuerpo.get("cachedContent") in contenidos_cacheados:
+        contenidos = contenidos_cacheados[cuerpo["cachedContent"]][1] or []
+        cacheados = sum(len(part.get("text", "")) for c in contenidos for part in c.get("parts", [])) // 4
+    return {
+        "promptTokenCount": entrada // 4 + cacheados,
+        "candidatesTokenCount": len(respuesta) // 4,
+        "cachedContentTokenCount": cacheados,
+        "totalTokenCount": entrada // 4 + cacheados + len(respuesta) // 4
+    }
+
+
+def error_simulado():
+    """Respuesta de error para una fracción ERROR_TASA de las llamadas, o None"""
+    if random.random() >= ERROR_TASA:
+        return None
+    headers = {"Retry-After": ERROR_RETRY_AFTER} if ERROR_RETRY_AFTER else None
+    return JSONResponse(
+        status_code=ERROR_ESTADO,
+        content={"error": {"code": ERROR_ESTADO, "message": "Error simulado por el servidor local"}},
+        headers=headers
+    )
+
+
+def verificar_cache(cuerpo: dict):
+    """Responde 404 si la petición usa un cachedContent inexistente o expirado, como Gemini"""
+    nombre = cuerpo.get("cachedContent")
+    if not nombre:
+        return
+    entrada = contenidos_cacheados.get(nombre)
+    if entrada is None or entrada[0] <= time.time():
+        contenidos_cacheados.pop(nombre, None)
+        raise HTTPException(status_code=404, detail=f"CachedContent not found: {nombre}")
+
+
+@app.post("/v1beta/cachedContents")
+async def crear_contenido_cacheado(request: Request):
+    """Guarda el contenido y devuelve su nombre con la expiración pedida"""
+    cuerpo = await request.json()
+    ttl = float(str(cuerpo.get("ttl", "3600s")).rstrip("s"))
+    nombre = f"cachedContents/{uuid.uuid4().hex}"
+    expira = time.time() + ttl
+    contenidos_cacheados[nombre] = (expira, cuerpo.get("contents"))
+    return {
+        "name": nombre,
+        "model": cuerpo.get("model"),
+        "expireTime": datetime.fromtimestamp(expira, timezone.utc).isoformat()
+    }
+
+
+@app.delete("/v1beta/{nombre:path}")
+async def borrar_contenido_cacheado(nombre: str):
+    contenidos_cacheados.pop(nombre, None)
+    return {}
+
+
+@app.get("/v1beta/models/{modelo}")
+async def obtener_modelo(modelo: str):
+    return {"name": f"models/{modelo}", "supportedGenerationMethods": ["generateContent", "streamGenerateContent"]}
+
+
+@app.post("/v1beta/models/{modelo}:generateContent")
+async def generate_content(modelo: str, request: Request):
+    """Responde con un texto fijo después de la latencia configurada"""
+    cuerpo = await request.json()
+    verificar_cache(cuerpo)
+    await asyncio.sleep(LATENCIA)
+    error = error_simulado()
+    if error is not None:
+        return error
+    return {
+        "candidates": [{
+            "content": {"parts": [{"text": RESPUESTA}], "role": "model"},
+            "finishReason": "STOP"
+        }],
+        "usageMetadata": uso(cuerpo, RESPUESTA),
+        "modelVersion": modelo
+    }
+
+
+@app.post("/v1beta/models/{modelo}:streamGenerateContent")
+async def stream_generate_content(modelo: str, request: Request):
+    """Devuelve la respuesta fija palabra por palabra como eventos SSE"""
+    cuerpo = await request.json()
+    verificar_cache(cuerpo)
+    error = error_simulado()
+    if error is not None:
+        return error
+
+    async def eventos():
+        await asyncio.sleep(LATENCIA_PRIMER_TOKEN)
+        palabras = RESPUESTA.split(" ")
+        for i, palabra in enumerate(palabras):
+            texto = palabra if i == len(palabras) - 1 else palabra + " "
+            chunk = {
+                "candidates": [{"content": {"parts": [{"text": texto}], "role": "model"}}],
+                "modelVersion": modelo
+            }
+            if i == len(palabras) - 1:
+                chunk["usageMetadata"] = uso(cuerpo, RESPUESTA)
+            yield f"data: {json.dumps(chunk)}\r\n\r\n"
+            await asyncio.sleep(LATENCIA_FRAGMENTO)
+
+    return StreamingResponse(eventos(), media_type="text/event-stream")
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(
+        app,
+        host="0.0.0.0",
+        port=int(os.getenv("GEMINI_STUB_PORT", "8081")),
+        log_level="info"
+    )
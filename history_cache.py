@@ -0,0 +1,133 @@
+"""Buffer circular en memoria con los últimos mensajes de cada sesión."""
+import os
+import time
+import threading
+from collections import OrderedDict, deque
+from typing import Any, Dict, List, Optional
+
+HISTORIAL_CACHE_MENSAJES = int(os.getenv("HISTORIAL_CACHE_MENSAJES", "10"))
+HISTORIAL_CACHE_SESIONES = int(os.getenv("HISTORIAL_CACHE_SESIONES", "10000"))
+HISTORIAL_CACHE_TTL = float(os.getenv("HISTORIAL_CACHE_TTL", "1800"))
+
+
+class _Cargas:
+    """Lecturas en curso de una sesión"""
+
+    def __init__(self):
+        # Generación de la lectura más nueva y del último mensaje agregado
+        self.ultima = 0
+        self.cambio = 0
+        self.en_curso = 0
+
+
+class HistoryCache:
+    """Últimos `capacidad` mensajes por sesión, con desalojo LRU de las sesiones inactivas.
+
+    Una sesión solo está en caché si su buffer es completo: se creó vacía
+    (sesión nueva) o se cargó desde la base de datos. Los mensajes nuevos se
+    agregan con `agregar`, el mismo punto por donde se guardan en chat_history.
+    Cada carga recibe un número de generación: solo se guarda si es la más
+    nueva de la sesión y no llegó ningún mensaje después de que empezó; si no,
+    se descarta y la próxima lectura vuelve a la base de datos.
+
+    Con varios workers, cada uno ve solo lo que escribió; conviene afinidad de
+    sesión en el balanceador. `ttl` acota cuánto puede quedar desactualizado
+    un buffer si otro worker escribió en la misma sesión.
+    """
+
+    def __init__(
+        self,
+        capacidad: int = HISTORIAL_CACHE_MENSAJES,
+        max_sesiones: int = HISTORIAL_CACHE_SESIONES,
+        ttl: float = HISTORIAL_CACHE_TTL
+    ):
+        self.capacidad = capacidad
+        self.max_sesiones = max_sesiones
+        self.ttl = ttl
+        # session_id -> (último uso, mensajes del más antiguo al más reciente)
+        self._sesiones: OrderedDict = OrderedDict()
+        # Sesiones con lecturas de la base de datos en curso
+        self._cargas: Dict[str, _Cargas] = {}
+        self._generacion = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.desalojos = 0
+
+    def _guardar(self, session_id: str, mensajes: deque):
+        self._sesiones[session_id] = (time.monotonic(), mensajes)
+        self._sesiones.move_to_end(session_id)
+        while len(self._sesiones) > self.max_sesiones:
+            self._sesiones.popitem(last=False)
+            self.desalojos += 1
+
+    def crear(self, session_id: str):
+        """Registra una sesión nueva, que por definición no tiene historial"""
+        with self._lock:
+            self._guardar(session_id, deque(maxlen=self.capacidad))
+
+    def leer(self, session_id: str, limit: int) -> Optional[List[Any]]:
+        """Los últimos `limit` mensajes, del más reciente al más antiguo, o None si no está en caché"""
+        if limit > self.capacidad:
+            return None
+        with self._lock:
+            entrada = self._sesiones.get(session_id)
+            if entrada is None or time.monotonic() - entrada[0] > self.ttl:
+                if entrada is not None:
+                    del self._sesiones[session_id]
+                    self.desalojos += 1
+                self.misses += 1
+                return None
+            self._sesiones[session_id] = (time.monotonic(), entrada[1])
+            self._sesiones.move_to_end(session_id)
+            self.hits += 1
+            return list(reversed(entrada[1]))[:limit]
+
+    def agregar(self, session_id: str, mensaje: Any):
+        with self._lock:
+            cargas = self._cargas.get(session_id)
+            if cargas is not None:
+                cargas.cambio = self._generacion
+            entrada = self._sesiones.get(session_id)
+            if entrada is not None:
+                entrada[1].append(mensaje)
+
+    def iniciar_carga(self, session_id: str) -> int:
+        """Registra una lectura de la base de datos y devuelve su generación"""
+        with self._lock:
+            self._generacion += 1
+            cargas = self._cargas.setdefault(session_id, _Cargas())
+            cargas.ultima = self._generacion
+            cargas.en_curso += 1
+            return self._generacion
+
+    def _terminar_carga(self, session_id: str) -> Optional[_Cargas]:
+        cargas = self._cargas.get(session_id)
+        if cargas is not None:
+            cargas.en_curso -= 1
+            if not cargas.en_curso:
+                del self._cargas[session_id]
+        return cargas
+
+    def completar_carga(self, session_id: str, generacion: int, mensajes_recientes_primero: List[Any]):
+        """Guarda lo leído si es la lectura más nueva y no llegaron mensajes desde que empezó"""
+        with self._lock:
+            cargas = self._terminar_carga(session_id)
+            if cargas is None or generacion != cargas.ultima or cargas.cambio >= generacion:
+                return
+            self._guardar(session_id, deque(reversed(mensajes_recientes_primero), maxlen=self.capacidad))
+
+    def cancelar_carga(self, session_id: str):
+        with self._lock:
+            self._terminar_carga(session_id)
+
+    def estadisticas(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "sesiones": len(self._sesiones),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+                "desalojos": self.desalojos
+            }
@@ -0,0 +1,282 @@
+"""Particiones por rango de fecha de chat_history: creación anticipada, archivo y retención."""
+import os
+import re
+import gzip
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import List, NamedTuple, Optional
+
+import psycopg2
+from psycopg2 import sql
+
+from db_config import db_pool
+
+logger = logging.getLogger(__name__)
+
+# "mes" o "semana"
+HISTORIAL_PARTICION = os.getenv("HISTORIAL_PARTICION", "mes")
+# Particiones que se crean por adelantado además de la del período actual
+HISTORIAL_PARTICIONES_ADELANTE = int(os.getenv("HISTORIAL_PARTICIONES_ADELANTE", "3"))
+# Las particiones que terminaron hace más de estos días se compactan en chat_history_archivo y se borran
+HISTORIAL_ARCHIVAR_DIAS = float(os.getenv("HISTORIAL_ARCHIVAR_DIAS", "90"))
+# Las sesiones archivadas cuyo último mensaje es más viejo que esto se eliminan (0 las conserva)
+HISTORIAL_RETENCION_DIAS = float(os.getenv("HISTORIAL_RETENCION_DIAS", "730"))
+# Si se indica, cada partición se exporta además como CSV comprimido antes de borrarla
+HISTORIAL_ARCHIVO_DIRECTORIO = os.getenv("HISTORIAL_ARCHIVO_DIRECTORIO", "")
+HISTORIAL_MANTENIMIENTO_INTERVALO = float(os.getenv("HISTORIAL_MANTENIMIENTO_INTERVALO", "3600"))
+
+TABLA = "chat_history"
+TABLA_ARCHIVO = "chat_history_archivo"
+TABLA_RESUMEN = "chat_resumen"
+PARTICION_DEFAULT = "chat_history_default"
+# Clave del advisory lock: un solo proceso hace el mantenimiento a la vez
+BLOQUEO_MANTENIMIENTO = 4817301
+
+_LIMITES = re.compile(r"FROM \((?:MINVALUE|'([^']+)')\) TO \('([^']+)'\)")
+
+
+class Particion(NamedTuple):
+    nombre: str
+    desde: Optional[datetime]
+    hasta: datetime
+
+
+def inicio_periodo(fecha: datetime, periodo: str = HISTORIAL_PARTICION) -> datetime:
+    """Primer instante del mes o de la semana (lunes) que contiene la fecha"""
+    dia = fecha.replace(hour=0, minute=0, second=0, microsecond=0)
+    if periodo == "semana":
+        return dia - timedelta(days=dia.weekday())
+    return dia.replace(day=1)
+
+
+def siguiente_periodo(inicio: datetime, periodo: str = HISTORIAL_PARTICION) -> datetime:
+    if periodo == "semana":
+        return inicio + timedelta(days=7)
+    return (inicio.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def nombre_particion(inicio: datetime) -> str:
+    return f"{TABLA}_p{inicio:%Y%m%d}"
+
+
+def esta_particionada(cursor) -> bool:
+    cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", (TABLA,))
+    fila = cursor.fetchone()
+    return bool(fila) and fila["relkind"] == "p"
+
+
+def particiones(cursor) -> List[Particion]:
+    """Particiones con rango de chat_history ordenadas por fecha (sin la default)"""
+    cursor.execute(
+        """
+        SELECT c.relname AS nombre, pg_get_expr(c.relpartbound, c.oid) AS limites
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass(%s)
+        """,
+        (TABLA,)
+    )
+    resultado = []
+    for fila in cursor.fetchall():
+        limites = _LIMITES.search(fila["limites"])
+        if not limites:
+            continue
+        desde, hasta = limites.groups()
+        resultado.append(Particion(
+            fila["nombre"],
+            datetime.fromisoformat(desde) if desde else None,
+            datetime.fromisoformat(hasta)
+        ))
+    return sorted(resultado, key=lambda p: p.hasta)
+
+
+def crear_particion(cursor, inicio: datetime, fin: datetime):
+    cursor.execute(
+        sql.SQL("CREATE TABLE IF NOT EXISTS {} PARTITION OF {} FOR VALUES FROM (%s) TO (%s)").format(
+            sql.Identifier(nombre_particion(inicio)), sql.Identifier(TABLA)
+        ),
+        (inicio, fin)
+    )
+
+
+class HistoryPartitions:
+    """Mantenimiento periódico de las particiones de chat_history.
+
+    Crea las particiones del período actual y de los siguientes antes de que
+    hagan falta (así nada cae en la default), compacta las que ya son viejas
+    en una fila por sesión de chat_history_archivo (opcionalmente las exporta
+    a CSV) y luego las borra, y elimina del archivo las sesiones fuera de la
+    retención. Cada paso va en su propia transacción (si falla el DROP, el
+    INSERT en el archivo se deshace y la partición se vuelve a archivar
+    completa en el próximo ciclo) y un advisory lock de sesión evita que dos
+    workers lo hagan a la vez.
+    """
+
+    def __init__(
+        self,
+        periodo: str = HISTORIAL_PARTICION,
+        adelante: int = HISTORIAL_PARTICIONES_ADELANTE,
+        archivar_dias: float = HISTORIAL_ARCHIVAR_DIAS,
+        retencion_dias: float = HISTORIAL_RETENCION_DIAS,
+        directorio: str = HISTORIAL_ARCHIVO_DIRECTORIO,
+        intervalo: float = HISTORIAL_MANTENIMIENTO_INTERVALO
+    ):
+        if periodo not in ("mes", "semana"):
+            raise ValueError(f"HISTORIAL_PARTICION debe ser 'mes' o 'semana', no '{periodo}'")
+        self.periodo = periodo
+        self.adelante = adelante
+        self.archivar_dias = archivar_dias
+        self.retencion_dias = retencion_dias
+        self.directorio = directorio
+        self.intervalo = intervalo
+        self.ultima_ejecucion: Optional[datetime] = None
+        self.creadas = 0
+        self.archivadas = 0
+        self.errores = 0
+        self.en_default = 0
+
+    def crear_siguientes(self, cursor, ahora: datetime) -> List[str]:
+        """Crea las particiones que faltan desde la última existente hasta `adelante` períodos después de hoy"""
+        existentes = particiones(cursor)
+        inicio = existentes[-1].hasta if existentes else inicio_periodo(ahora, self.periodo)
+        limite = inicio_periodo(ahora, self.periodo)
+        for _ in range(self.adelante + 1):
+            limite = siguiente_periodo(limite, self.periodo)
+        creadas = []
+        while inicio < limite:
+            fin = siguiente_periodo(inicio, self.periodo)
+            crear_particion(cursor, inicio, fin)
+            creadas.append(nombre_particion(inicio))
+            inicio = fin
+        return creadas
+
+    def archivar(self, cursor, particion: Particion):
+        """Compacta la partición en una fila por sesión del archivo y la borra"""
+        tabla = sql.Identifier(particion.nombre)
+        if self.directorio:
+            os.makedirs(self.directorio, exist_ok=True)
+            ruta = os.path.join(self.directorio, f"{particion.nombre}.csv.gz")
+            with gzip.open(ruta, "wb") as f:
+                cursor.copy_expert(
+                    sql.SQL("COPY {} TO STDOUT WITH (FORMAT csv, HEADER)").format(tabla).as_string(cursor), f
+                )
+        cursor.execute(
+            sql.SQL("""
+                INSERT INTO {archivo} AS a (session_id, inicio, fin, cantidad, mensajes)
+                SELECT
+                    session_id, min(timestamp), max(timestamp), count(*),
+                    jsonb_agg(
+                        jsonb_build_object(
+                            'role', role, 'content', content,
+                            'carrera_referencia', carrera_referencia, 'timestamp', timestamp
+                        ) ORDER BY timestamp, id
+                    )
+                FROM {tabla}
+                GROUP BY session_id
+                ON CONFLICT (session_id) DO UPDATE SET
+                    inicio = LEAST(a.inicio, EXCLUDED.inicio),
+                    fin = GREATEST(a.fin, EXCLUDED.fin),
+                    cantidad = a.cantidad + EXCLUDED.cantidad,
+                    mensajes = CASE WHEN EXCLUDED.inicio >= a.fin
+                        THEN a.mensajes || EXCLUDED.mensajes
+                        ELSE EXCLUDED.mensajes || a.mensajes END
+            """).format(archivo=sql.Identifier(TABLA_ARCHIVO), tabla=tabla)
+        )
+        sesiones = cursor.rowcount
+        cursor.execute(sql.SQL("DROP TABLE {}").format(tabla))
+        logger.info(f"Partición {particion.nombre} archivada ({sesiones} sesiones) y eliminada")
+
+    def aplicar_retencion(self, cursor, ahora: datetime) -> int:
+        if self.retencion_dias <= 0:
+            return 0
+        limite = ahora - timedelta(days=self.retencion_dias)
+        cursor.execute(
+            sql.SQL("DELETE FROM {} WHERE fin < %s").format(sql.Identifier(TABLA_ARCHIVO)), (limite,)
+        )
+        eliminadas = cursor.rowcount
+        # Los resúmenes de las sesiones (history_summary.py) siguen la misma retención
+        cursor.execute("SELECT to_regclass(%s) IS NOT NULL AS existe", (TABLA_RESUMEN,))
+        if cursor.fetchone()["existe"]:
+            cursor.execute(
+                sql.SQL("DELETE FROM {} WHERE actualizado < %s").format(sql.Identifier(TABLA_RESUMEN)), (limite,)
+            )
+        return eliminadas
+
+    def mantener(self, ahora: Optional[datetime] = None) -> dict:
+        """Un ciclo completo de mantenimiento; no hace nada si chat_history no está particionada"""
+        ahora = ahora or datetime.now()
+        resumen = {"creadas": [], "archivadas": [], "sesiones_eliminadas": 0, "omitido": None}
+        with db_pool.conexion() as conn:
+            conn.autocommit = True
+            try:
+                with conn.cursor() as cursor:
+                    if not esta_particionada(cursor):
+                        resumen["omitido"] = "chat_history no está particionada (ejecute migrations.py)"
+                        return resumen
+                    cursor.execute("SELECT pg_try_advisory_lock(%s) AS obtenido", (BLOQUEO_MANTENIMIENTO,))
+                    if not cursor.fetchone()["obtenido"]:
+                        resumen["omitido"] = "otro proceso está haciendo el mantenimiento"
+                        return resumen
+                    try:
+                        # El lock es de la sesión; los pasos necesitan transacciones de verdad
+                        conn.autocommit = False
+                        self._ciclo(conn, cursor, ahora, resumen)
+                    finally:
+                        conn.rollback()
+                        conn.autocommit = True
+                        cursor.execute("SELECT pg_advisory_unlock(%s)", (BLOQUEO_MANTENIMIENTO,))
+            finally:
+                conn.autocommit = False
+        self.ultima_ejecucion = ahora
+        return resumen
+
+    def _ciclo(self, conn, cursor, ahora: datetime, resumen: dict):
+        with conn:
+            resumen["creadas"] = self.crear_siguientes(cursor, ahora)
+        self.creadas += len(resumen["creadas"])
+
+        corte = ahora - timedelta(days=self.archivar_dias)
+        for particion in particiones(cursor):
+            if particion.hasta > corte:
+                break
+            try:
+                with conn:
+                    self.archivar(cursor, particion)
+            except (OSError, psycopg2.Error) as e:
+                self.errores += 1
+                logger.error(f"No se pudo archivar la partición {particion.nombre}: {str(e)}")
+                break
+            resumen["archivadas"].append(particion.nombre)
+            self.archivadas += 1
+
+        with conn:
+            resumen["sesiones_eliminadas"] = self.aplicar_retencion(cursor, ahora)
+            cursor.execute("SELECT to_regclass(%s) IS NOT NULL AS existe", (PARTICION_DEFAULT,))
+            if cursor.fetchone()["existe"]:
+                cursor.execute(sql.SQL("SELECT count(*) AS filas FROM {}").format(sql.Identifier(PARTICION_DEFAULT)))
+                self.en_default = cursor.fetchone()["filas"]
+                if self.en_default:
+                    logger.warning(f"{self.en_default} mensajes en {PARTICION_DEFAULT}: faltan particiones para esas fechas")
+
+    async def vigilar(self):
+        """Ejecuta el mantenimiento cada `intervalo` segundos"""
+        while True:
+            try:
+                resumen = await asyncio.to_thread(self.mantener)
+                if resumen["creadas"] or resumen["archivadas"] or resumen["sesiones_eliminadas"]:
+                    logger.info(f"Mantenimiento de chat_history: {resumen}")
+            except Exception as e:
+                self.errores += 1
+                logger.error(f"Error en el mantenimiento de chat_history: {str(e)}")
+            await asyncio.sleep(self.intervalo)
+
+    def estadisticas(self) -> dict:
+        return {
+            "periodo": self.periodo,
+            "ultima_ejecucion": self.ultima_ejecucion.isoformat() if self.ultima_ejecucion else None,
+            "creadas": self.creadas,
+            "archivadas": self.archivadas,
+            "errores": self.errores,
+            "en_default": self.en_default
+        }
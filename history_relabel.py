@@ -0,0 +1,278 @@
+"""Vuelve a calcular carrera_referencia de chat_history con el detector actual.
+
+Cuando cambian las variaciones o los sinónimos, las etiquetas guardadas
+quedan viejas. El trabajo recorre chat_history por sesión con un cursor del
+lado del servidor, clasifica los mensajes de los usuarios en un pool de
+procesos (cada uno abre el snapshot del catálogo con mmap y usa
+classify_many) y escribe solo las etiquetas que cambian, con un UPDATE por
+lote. Los mensajes del asistente toman la etiqueta del mensaje del usuario al
+que responden, como hace la API.
+
+El avance se guarda en chat_relabel en la misma transacción que las
+correcciones de cada lote, así que un trabajo interrumpido se retoma desde la
+última sesión completa. El trabajo se identifica por la versión del snapshot
+del catálogo: con otras variaciones o sinónimos empieza de cero.
+
+Uso:
+    python history_relabel.py                       # ejecuta o retoma el trabajo
+    python history_relabel.py --procesos 8 --lote 20000
+    python history_relabel.py --simular             # cuenta las correcciones sin escribir
+    python history_relabel.py --reiniciar           # empieza de cero aunque haya avance guardado
+"""
+import os
+import time
+import logging
+import argparse
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Deque, List, Optional, Tuple
+
+from psycopg2.extras import execute_values
+
+from catalogo_snapshot import CatalogoCompartido, Snapshot
+from db_config import get_db_connection
+from detector_carreras import LISTA_CARRERAS, DetectorCarreras
+from history_partitions import esta_particionada
+
+logger = logging.getLogger(__name__)
+
+RELABEL_LOTE = int(os.getenv("RELABEL_LOTE", "10000"))
+RELABEL_PROCESOS = int(os.getenv("RELABEL_PROCESOS", str(os.cpu_count() or 1)))
+# Lotes leídos por adelantado mientras el pool clasifica los anteriores
+RELABEL_ADELANTO = 2
+# Cada cuántos segundos se informa el avance
+RELABEL_INFORME = 5.0
+
+TABLA_AVANCE = "chat_relabel"
+
+# Detector de cada proceso del pool
+_detector: Optional[DetectorCarreras] = None
+
+
+def _iniciar_proceso(ruta: str):
+    global _detector
+    _detector = Snapshot.abrir(ruta).detector
+
+
+def _clasificar(textos: List[str]) -> List[Optional[str]]:
+    """Etiqueta que guardaría la API para cada mensaje (el listado de carreras no se etiqueta)"""
+    return [d.carrera if d.carrera != LISTA_CARRERAS else None for d in _detector.classify_many(textos)]
+
+
+class Lote:
+    """Sesiones completas leídas del cursor y las clasificaciones pendientes de sus mensajes"""
+
+    def __init__(self, filas: List[dict], textos: List[str], futuros: List[Future]):
+        self.filas = filas
+        # Textos distintos de los mensajes de los usuarios, repartidos en orden entre los futuros
+        self.textos = textos
+        self.futuros = futuros
+
+    def correcciones(self) -> List[Tuple]:
+        """(id, timestamp, etiqueta nueva) de las filas cuya etiqueta cambia"""
+        resultados = [etiqueta for futuro in self.futuros for etiqueta in futuro.result()]
+        etiquetas = dict(zip(self.textos, resultados))
+
+        cambios = []
+        sesion, actual = None, None
+        # Las filas de cada sesión vienen de la más nueva a la más vieja
+        for fila in reversed(self.filas):
+            if fila["session_id"] != sesion:
+                sesion, actual = fila["session_id"], None
+            if fila["role"] == "user":
+                actual = etiquetas[fila["content"] or ""]
+            if actual != fila["carrera_referencia"]:
+                cambios.append((fila["id"], fila["timestamp"], actual))
+        return cambios
+
+
+class HistoryRelabel:
+    """Recorre chat_history en lotes y corrige carrera_referencia"""
+
+    def __init__(
+        self,
+        catalogo: CatalogoCompartido,
+        procesos: int = RELABEL_PROCESOS,
+        lote: int = RELABEL_LOTE,
+        simular: bool = False
+    ):
+        self.catalogo = catalogo
+        self.trabajo = catalogo.actual.version
+        self.procesos = max(procesos, 1)
+        self.lote = lote
+        self.simular = simular
+        self.filas = 0
+        self.corregidas = 0
+        self.ultima_sesion: Optional[str] = None
+        self._inicio = time.monotonic()
+        self._filas_iniciales = 0
+        self._ultimo_informe = 0.0
+        self._estimadas = 0
+
+    def _avance(self, cursor) -> Optional[dict]:
+        cursor.execute("SELECT to_regclass(%s) IS NOT NULL AS existe", (TABLA_AVANCE,))
+        if not cursor.fetchone()["existe"]:
+            raise RuntimeError(f"No existe la tabla {TABLA_AVANCE} (ejecute migrations.py)")
+        cursor.execute(
+            f"SELECT ultima_sesion, filas, corregidas, terminado FROM {TABLA_AVANCE} WHERE trabajo = %s",
+            (self.trabajo,)
+        )
+        return cursor.fetchone()
+
+    def _guardar_avance(self, cursor, terminado: bool = False):
+        cursor.execute(
+            f"""
+            INSERT INTO {TABLA_AVANCE} (trabajo, ultima_sesion, filas, corregidas, terminado, actualizado)
+            VALUES (%s, %s, %s, %s, CASE WHEN %s THEN now() END, now())
+            ON CONFLICT (trabajo) DO UPDATE SET
+                ultima_sesion = EXCLUDED.ultima_sesion,
+                filas = EXCLUDED.filas,
+                corregidas = EXCLUDED.corregidas,
+                terminado = EXCLUDED.terminado,
+                actualizado = now()
+            """,
+            (self.trabajo, self.ultima_sesion, self.filas, self.corregidas, terminado)
+        )
+
+    def _estimar(self, cursor) -> int:
+        """Filas de chat_history según las estadísticas (para el porcentaje de avance)"""
+        cursor.execute("""
+            SELECT coalesce(sum(greatest(c.reltuples, 0)), 0)::bigint AS filas
+            FROM pg_class c
+            WHERE c.relkind = 'r'
+              AND (c.oid = to_regclass('chat_history')
+                   OR c.oid IN (SELECT inhrelid FROM pg_inherits WHERE inhparent = to_regclass('chat_history')))
+        """)
+        return cursor.fetchone()["filas"]
+
+    def _informar(self, forzar: bool = False):
+        ahora = time.monotonic()
+        if not forzar and ahora - self._ultimo_informe < RELABEL_INFORME:
+            return
+        self._ultimo_informe = ahora
+        transcurrido = max(ahora - self._inicio, 1e-9)
+        velocidad = (self.filas - self._filas_iniciales) / transcurrido
+        porcentaje = f" ({min(self.filas / self._estimadas, 1) * 100:.1f}%)" if self._estimadas else ""
+        logger.info(
+            f"{self.filas} filas{porcentaje}, {self.corregidas} corregidas, "
+            f"{velocidad:.0f} filas/s, última sesión {self.ultima_sesion}"
+        )
+
+    def _enviar(self, pool: ProcessPoolExecutor, filas: List[dict]) -> Lote:
+        # Los mensajes repetidos ("hola", "gracias") se clasifican una vez por lote
+        textos = list(dict.fromkeys(fila["content"] or "" for fila in filas if fila["role"] == "user"))
+        parte = max(-(-len(textos) // self.procesos), 1)
+        return Lote(filas, textos, [pool.submit(_clasificar, textos[i:i + parte]) for i in range(0, len(textos), parte)])
+
+    def _escribir(self, conn, cursor, lote: Lote, particionada: bool):
+        cambios = lote.correcciones()
+        self.filas += len(lote.filas)
+        self.corregidas += len(cambios)
+        self.ultima_sesion = lote.filas[-1]["session_id"]
+        if self.simular:
+            return
+        with conn:
+            if cambios:
+                # Con la tabla particionada, el timestamp permite ir directo a la partición de cada fila
+                condicion = "h.id = v.id AND h.timestamp = v.timestamp" if particionada else "h.id = v.id"
+                execute_values(
+                    cursor,
+                    f"""
+                    UPDATE chat_history AS h SET carrera_referencia = v.carrera
+                    FROM (VALUES %s) AS v(id, timestamp, carrera)
+                    WHERE {condicion}
+                    """,
+                    cambios,
+                    template="(%s, %s::timestamp, %s::text)",
+                    page_size=1000
+                )
+            self._guardar_avance(cursor)
+
+    def ejecutar(self, reiniciar: bool = False) -> dict:
+        escritura = get_db_connection()
+        lectura = get_db_connection()
+        try:
+            with escritura, escritura.cursor() as cursor:
+                avance = self._avance(cursor)
+                particionada = esta_particionada(cursor)
+                self._estimadas = self._estimar(cursor)
+            if avance and not reiniciar:
+                if avance["terminado"]:
+                    logger.info(f"El trabajo {self.trabajo} ya terminó ({avance['corregidas']} corregidas)")
+                    return {"trabajo": self.trabajo, "filas": avance["filas"], "corregidas": avance["corregidas"]}
+                self.ultima_sesion = avance["ultima_sesion"]
+                self.filas = self._filas_iniciales = avance["filas"]
+                self.corregidas = avance["corregidas"]
+                logger.info(f"Se retoma el trabajo {self.trabajo} después de la sesión {self.ultima_sesion}")
+
+            # Transacción de solo lectura que dura todo el recorrido; las escrituras van por la otra conexión
+            lectura.set_session(readonly=True)
+            with lectura.cursor(name="relabel") as origen, ProcessPoolExecutor(
+                self.procesos, initializer=_iniciar_proceso, initargs=(self.catalogo.ruta,)
+            ) as pool:
+                origen.itersize = self.lote
+                origen.execute(
+                    """
+                    SELECT id, session_id, role, content, carrera_referencia, timestamp
+                    FROM chat_history
+                    WHERE session_id > %s
+                    ORDER BY session_id, timestamp DESC, id DESC
+                    """,
+                    (self.ultima_sesion or "",)
+                )
+                pendientes: Deque[Lote] = deque()
+                resto: List[dict] = []
+                with escritura.cursor() as cursor:
+                    while True:
+                        filas = origen.fetchmany(self.lote)
+                        if filas:
+                            filas = resto + filas
+                            # La última sesión puede seguir en el próximo lote
+                            ultima = filas[-1]["session_id"]
+                            corte = len(filas)
+                            while corte > 0 and filas[corte - 1]["session_id"] == ultima:
+                                corte -= 1
+                            if corte == 0:
+                                resto = filas
+                                continue
+                            filas, resto = filas[:corte], filas[corte:]
+                        else:
+                            filas, resto = resto, []
+                        if filas:
+                            pendientes.append(self._enviar(pool, filas))
+                        while pendientes and (len(pendientes) > RELABEL_ADELANTO or not filas):
+                            self._escribir(escritura, cursor, pendientes.popleft(), particionada)
+                            self._informar()
+                        if not filas and not pendientes:
+                            break
+                    if not self.simular:
+                        with escritura:
+                            self._guardar_avance(cursor, terminado=True)
+            lectura.rollback()
+        finally:
+            lectura.close()
+            escritura.close()
+        self._informar(forzar=True)
+        return {"trabajo": self.trabajo, "filas": self.filas, "corregidas": self.corregidas}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Vuelve a etiquetar carrera_referencia de chat_history")
+    parser.add_argument("--procesos", type=int, default=RELABEL_PROCESOS)
+    parser.add_argument("--lote", type=int, default=RELABEL_LOTE, help="filas leídas por lote")
+    parser.add_argument("--simular", action="store_true", help="cuenta las correcciones sin escribir")
+    parser.add_argument("--reiniciar", action="store_true", help="ignora el avance guardado")
+    args = parser.parse_args()
+
+    # Compila el snapshot si data/ cambió; los procesos del pool lo abren con mmap
+    catalogo = CatalogoCompartido(intervalo=0)
+    inicio = time.perf_counter()
+    resultado = HistoryRelabel(catalogo, args.procesos, args.lote, args.simular).ejecutar(args.reiniciar)
+    duracion = time.perf_counter() - inicio
+    print(f"Trabajo {resultado['trabajo']}: {resultado['filas']} filas, {resultado['corregidas']} "
+          f"{'a corregir' if args.simular else 'corregidas'} en {duracion:.1f} s")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,284 @@
+"""Resumen incremental de cada conversación, para que el prompt no crezca con el historial."""
+import os
+import time
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, NamedTuple, Optional, Set, Tuple
+
+from psycopg2.extras import Json
+
+from db_config import db_pool
+from llm_client import LLMError
+from metrics import registro
+from prompt_builder import recortar
+
+logger = logging.getLogger(__name__)
+
+RESUMEN_ACTIVO = os.getenv("RESUMEN_ACTIVO", "1") == "1"
+# Tamaño máximo del resumen y de cada mensaje que se le pasa a Gemini para actualizarlo
+RESUMEN_MAX_TOKENS = int(os.getenv("RESUMEN_MAX_TOKENS", "250"))
+RESUMEN_MAX_TOKENS_MENSAJE = int(os.getenv("RESUMEN_MAX_TOKENS_MENSAJE", "300"))
+RESUMEN_TRABAJADORES = int(os.getenv("RESUMEN_TRABAJADORES", "2"))
+# Intercambios sin resumir que se conservan por sesión mientras Gemini no está disponible
+RESUMEN_MAX_ATRASO = int(os.getenv("RESUMEN_MAX_ATRASO", "4"))
+RESUMEN_CACHE_SESIONES = int(os.getenv("RESUMEN_CACHE_SESIONES", "10000"))
+RESUMEN_CACHE_TTL = float(os.getenv("RESUMEN_CACHE_TTL", "1800"))
+
+TABLA_RESUMEN = "chat_resumen"
+
+RESUMEN_ACTUALIZACIONES = registro.contador(
+    "chatbot_resumen_actualizaciones_total", "Actualizaciones del resumen de las sesiones por resultado", ("resultado",)
+)
+
+PROMPT_RESUMEN = """Actualiza el resumen de una conversación entre un futuro estudiante y Sara, la asesora virtual de la Universidad Bolivariana del Ecuador.
+Conserva lo que sirve para seguir atendiéndolo: carreras que le interesan, datos que dio, preguntas ya respondidas y dudas pendientes. Omite saludos y cortesías.
+Escribe en español, en tercera persona y en no más de {palabras} palabras.
+
+Resumen actual:
+{resumen}
+
+Mensajes nuevos:
+{mensajes}
+
+Resumen actualizado:"""
+
+Intercambio = Tuple[Tuple[str, str], ...]
+
+
+class Resumen(NamedTuple):
+    texto: str
+    # Último intercambio ((rol, contenido), ...); se incorpora al resumen cuando termina el siguiente
+    pendiente: Intercambio
+    intercambios: int
+
+    def recientes(self, turnos: List) -> List:
+        """Mensajes previos que van completos junto al resumen (del más reciente al más antiguo).
+
+        Normalmente es el último intercambio; si el resumen todavía no
+        registró ese intercambio (la actualización está en curso), van los
+        dos últimos para no dejar un hueco.
+        """
+        pendiente = next((contenido for rol, contenido in self.pendiente if rol == "user"), None)
+        ultimo = next((msg.content for msg in turnos if msg.role == "user"), None)
+        return turnos[:2] if pendiente is not None and pendiente == ultimo else turnos[:4]
+
+
+SIN_RESUMEN = Resumen("", (), 0)
+
+
+class HistorySummaries:
+    """Resumen por sesión que se actualiza en segundo plano después de cada intercambio.
+
+    El prompt lleva el resumen y el último intercambio, así que su tamaño no
+    depende del largo de la conversación. Cada intercambio queda pendiente
+    hasta que termina el siguiente; entonces se incorpora al resumen con una
+    llamada corta a Gemini a través del gateway. Si hay peticiones de usuarios
+    esperando en el gateway o Gemini no está disponible, la actualización se
+    posterga hasta el próximo intercambio de la sesión.
+
+    Las actualizaciones de una misma sesión se hacen de a una. El estado se
+    guarda en chat_resumen y se cachea en memoria; con varios workers vale lo
+    mismo que para HistoryCache (conviene afinidad de sesión).
+    """
+
+    def __init__(
+        self,
+        activo: bool = RESUMEN_ACTIVO,
+        max_tokens: int = RESUMEN_MAX_TOKENS,
+        max_tokens_mensaje: int = RESUMEN_MAX_TOKENS_MENSAJE,
+        trabajadores: int = RESUMEN_TRABAJADORES,
+        max_atraso: int = RESUMEN_MAX_ATRASO,
+        max_sesiones: int = RESUMEN_CACHE_SESIONES,
+        ttl: float = RESUMEN_CACHE_TTL
+    ):
+        self.activo = activo
+        self.max_tokens = max_tokens
+        self.max_tokens_mensaje = max_tokens_mensaje
+        self.trabajadores = trabajadores
+        self.max_atraso = max_atraso
+        self.max_sesiones = max_sesiones
+        self.ttl = ttl
+        # None hasta verificar que existe la tabla
+        self.disponible: Optional[bool] = None
+        self._generar: Optional[Callable[[str], Awaitable[str]]] = None
+        self._ocupado: Callable[[], bool] = lambda: False
+        self._cola: Optional[asyncio.Queue] = None
+        self._tareas: List[asyncio.Task] = []
+        # Intercambios terminados que todavía no pasaron por un trabajador
+        self._nuevos: Dict[str, List[Intercambio]] = {}
+        self._en_cola: Set[str] = set()
+        self._en_proceso: Set[str] = set()
+        self._cache: "OrderedDict[str, Tuple[float, Resumen]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def habilitado(self) -> bool:
+        return self.activo and bool(self.disponible)
+
+    def verificar(self, cursor) -> bool:
+        """Comprueba que exista chat_resumen; sin ella el prompt sigue usando el historial reciente"""
+        cursor.execute("SELECT to_regclass(%s) IS NOT NULL AS existe", (TABLA_RESUMEN,))
+        self.disponible = cursor.fetchone()["existe"]
+        if self.activo and not self.disponible:
+            logger.warning(f"No existe la tabla {TABLA_RESUMEN} (ejecute migrations.py); no se resumen las conversaciones")
+        return self.disponible
+
+    def iniciar(self, generar: Callable[[str], Awaitable[str]], ocupado: Optional[Callable[[], bool]] = None):
+        self._generar = generar
+        self._ocupado = ocupado or (lambda: False)
+        self._cola = asyncio.Queue()
+        self._tareas = [
+            asyncio.create_task(self._trabajar(), name=f"history-summary-{i}") for i in range(self.trabajadores)
+        ]
+
+    async def detener(self):
+        for tarea in self._tareas:
+            tarea.cancel()
+        await asyncio.gather(*self._tareas, return_exceptions=True)
+        self._tareas = []
+        with self._lock:
+            sin_resumir = sum(len(i) for i in self._nuevos.values())
+        if sin_resumir:
+            logger.warning(f"Cierre con {sin_resumir} intercambios sin incorporar a los resúmenes")
+
+    def _recordar(self, session_id: str, resumen: Resumen):
+        with self._lock:
+            self._cache[session_id] = (time.monotonic(), resumen)
+            self._cache.move_to_end(session_id)
+            while len(self._cache) > self.max_sesiones:
+                self._cache.popitem(last=False)
+
+    def crear(self, session_id: str):
+        """Registra una sesión nueva, que todavía no tiene resumen"""
+        if self.habilitado:
+            self._recordar(session_id, SIN_RESUMEN)
+
+    def en_cache(self, session_id: str) -> Optional[Resumen]:
+        with self._lock:
+            entrada = self._cache.get(session_id)
+            if entrada is None:
+                return None
+            if time.monotonic() - entrada[0] > self.ttl:
+                del self._cache[session_id]
+                return None
+            self._cache.move_to_end(session_id)
+            return entrada[1]
+
+    def leer(self, cursor, session_id: str) -> Resumen:
+        """Resumen de la sesión desde la caché o desde chat_resumen"""
+        resumen = self.en_cache(session_id)
+        if resumen is not None:
+            return resumen
+        cursor.execute(
+            f"SELECT resumen, pendiente, intercambios FROM {TABLA_RESUMEN} WHERE session_id = %s", (session_id,)
+        )
+        fila = cursor.fetchone()
+        resumen = SIN_RESUMEN if fila is None else Resumen(
+            fila["resumen"], tuple(tuple(mensaje) for mensaje in fila["pendiente"] or ()), fila["intercambios"]
+        )
+        self._recordar(session_id, resumen)
+        return resumen
+
+    def programar(self, session_id: str, mensaje: str, respuesta: str):
+        """Anota un intercambio terminado; no espera a que se actualice el resumen"""
+        if not self.habilitado or self._cola is None:
+            return
+        with self._lock:
+            nuevos = self._nuevos.setdefault(session_id, [])
+            nuevos.append((("user", mensaje), ("assistant", respuesta)))
+            if len(nuevos) > self.max_atraso:
+                del nuevos[:-self.max_atraso]
+                RESUMEN_ACTUALIZACIONES.inc(resultado="descartada")
+            if session_id in self._en_cola or session_id in self._en_proceso:
+                return
+            self._en_cola.add(session_id)
+        self._cola.put_nowait(session_id)
+
+    async def _trabajar(self):
+        while True:
+            session_id = await self._cola.get()
+            with self._lock:
+                self._en_cola.discard(session_id)
+                self._en_proceso.add(session_id)
+                intercambios = self._nuevos.pop(session_id, [])
+            reprogramar = True
+            try:
+                if intercambios:
+                    await self._actualizar(session_id, intercambios)
+            except Exception as e:
+                if isinstance(e, LLMError):
+                    RESUMEN_ACTUALIZACIONES.inc(resultado="postergada")
+                else:
+                    RESUMEN_ACTUALIZACIONES.inc(resultado="error")
+                    logger.error(f"Error al actualizar el resumen de la sesión {session_id}: {str(e)}")
+                # Se reintenta con el próximo intercambio de la sesión, no en un bucle
+                reprogramar = False
+                with self._lock:
+                    pendientes = intercambios + self._nuevos.get(session_id, [])
+                    self._nuevos[session_id] = pendientes[-self.max_atraso:]
+            finally:
+                with self._lock:
+                    self._en_proceso.discard(session_id)
+                    if reprogramar and self._nuevos.get(session_id) and session_id not in self._en_cola:
+                        self._en_cola.add(session_id)
+                        self._cola.put_nowait(session_id)
+
+    def _leer_db(self, session_id: str) -> Resumen:
+        with db_pool.conexion() as conn:
+            with conn.cursor() as cursor:
+                return self.leer(cursor, session_id)
+
+    def _guardar(self, session_id: str, resumen: Resumen):
+        with db_pool.conexion() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    f"""
+                    INSERT INTO {TABLA_RESUMEN} (session_id, resumen, pendiente, intercambios, actualizado)
+                    VALUES (%s, %s, %s, %s, now())
+                    ON CONFLICT (session_id) DO UPDATE SET
+                        resumen = EXCLUDED.resumen,
+                        pendiente = EXCLUDED.pendiente,
+                        intercambios = EXCLUDED.intercambios,
+                        actualizado = now()
+                    """,
+                    (session_id, resumen.texto, Json(resumen.pendiente), resumen.intercambios)
+                )
+            conn.commit()
+
+    async def _actualizar(self, session_id: str, intercambios: List[Intercambio]):
+        actual = await asyncio.to_thread(self._leer_db, session_id)
+        por_resumir = ([actual.pendiente] if actual.pendiente else []) + intercambios[:-1]
+        texto = actual.texto
+        if por_resumir:
+            if self._ocupado():
+                # Las peticiones de los usuarios tienen prioridad en el gateway
+                raise LLMError("Gateway ocupado; el resumen se posterga")
+            texto = await self._resumir(actual.texto, por_resumir)
+        nuevo = Resumen(texto, intercambios[-1], actual.intercambios + len(por_resumir))
+        await asyncio.to_thread(self._guardar, session_id, nuevo)
+        self._recordar(session_id, nuevo)
+        RESUMEN_ACTUALIZACIONES.inc(resultado="ok" if por_resumir else "sin_cambios")
+
+    async def _resumir(self, resumen: str, intercambios: List[Intercambio]) -> str:
+        mensajes = "\n".join(
+            f"{'Usuario' if rol == 'user' else 'Sara'}: {recortar(contenido, self.max_tokens_mensaje)}"
+            for intercambio in intercambios
+            for rol, contenido in intercambio
+        )
+        prompt = PROMPT_RESUMEN.format(
+            palabras=self.max_tokens * 2 // 3,
+            resumen=resumen or "(todavía no hay resumen)",
+            mensajes=mensajes
+        )
+        return recortar((await self._generar(prompt)).strip(), self.max_tokens)
+
+    def estadisticas(self) -> dict:
+        with self._lock:
+            return {
+                "habilitado": self.habilitado,
+                "sesiones_en_cache": len(self._cache),
+                "sesiones_pendientes": len(self._nuevos),
+                "en_proceso": len(self._en_proceso)
+            }
@@ -0,0 +1,199 @@
+"""Escritura diferida y por lotes de los mensajes de chat_history."""
+import os
+import asyncio
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+from db_config import db_pool
+
+logger = logging.getLogger(__name__)
+
+HISTORIAL_LOTE_MAX = int(os.getenv("HISTORIAL_LOTE_MAX", "200"))
+HISTORIAL_LOTE_INTERVALO = float(os.getenv("HISTORIAL_LOTE_INTERVALO", "0.2"))
+HISTORIAL_MAX_PENDIENTES = int(os.getenv("HISTORIAL_MAX_PENDIENTES", "10000"))
+HISTORIAL_TIMEOUT_CIERRE = float(os.getenv("HISTORIAL_TIMEOUT_CIERRE", "15"))
+# Reintentos de un lote cuando falla la conexión; después el lote se descarta para no detener la cola
+HISTORIAL_REINTENTOS = int(os.getenv("HISTORIAL_REINTENTOS", "6"))
+
+# Errores que pueden desaparecer al reintentar; cualquier otro es un problema de los datos del lote
+ERRORES_TRANSITORIOS = (psycopg2.OperationalError, psycopg2.InterfaceError, ConnectionError)
+
+
+class MensajePendiente(NamedTuple):
+    session_id: str
+    role: str
+    content: str
+    carrera_referencia: Optional[str]
+    timestamp: datetime
+
+
+class HistoryWriter:
+    """Cola en memoria que inserta los mensajes en bloque con un INSERT multi-fila.
+
+    Se escribe cuando el lote llega a `max_lote` mensajes o cuando pasan
+    `intervalo` segundos desde el primer mensaje del lote. La cola es acotada:
+    si la base de datos no da abasto, `encolar` espera (backpressure) en vez de
+    acumular memoria. Los mensajes aún no escritos se pueden consultar por
+    sesión con `pendientes`, para que el historial de una sesión siempre vea
+    sus propios mensajes. El timestamp se fija al encolar, así el orden no
+    depende de cuándo se escribe el lote.
+
+    Si falla la conexión, el lote se reintenta hasta `reintentos` veces. Si la
+    base rechaza los datos (un NUL en el texto, una restricción), el lote se
+    divide en mitades hasta aislar los mensajes inválidos, que se registran y
+    se descartan; el resto se escribe y la cola sigue avanzando.
+    """
+
+    def __init__(
+        self,
+        max_lote: int = HISTORIAL_LOTE_MAX,
+        intervalo: float = HISTORIAL_LOTE_INTERVALO,
+        max_pendientes: int = HISTORIAL_MAX_PENDIENTES,
+        reintentos: int = HISTORIAL_REINTENTOS
+    ):
+        self.max_lote = max_lote
+        self.intervalo = intervalo
+        self.max_pendientes = max_pendientes
+        self.reintentos = reintentos
+        self._cola: Optional[asyncio.Queue] = None
+        self._tarea: Optional[asyncio.Task] = None
+        self._pendientes: Dict[str, List[MensajePendiente]] = {}
+        self._lock = threading.Lock()
+        self.encolados = 0
+        self.escritos = 0
+        self.lotes = 0
+        self.errores = 0
+        self.descartados = 0
+
+    @property
+    def activo(self) -> bool:
+        return self._tarea is not None and not self._tarea.done()
+
+    def iniciar(self):
+        self._cola = asyncio.Queue(maxsize=self.max_pendientes)
+        self._tarea = asyncio.create_task(self._bucle(), name="history-writer")
+
+    async def encolar(self, session_id: str, role: str, content: str, carrera_referencia: Optional[str] = None):
+        mensaje = MensajePendiente(session_id, role, content, carrera_referencia, datetime.now())
+        with self._lock:
+            self._pendientes.setdefault(session_id, []).append(mensaje)
+        await self._cola.put(mensaje)
+        self.encolados += 1
+
+    def pendientes(self, session_id: str) -> List[MensajePendiente]:
+        """Mensajes de la sesión que todavía no están en la base de datos"""
+        with self._lock:
+            return list(self._pendientes.get(session_id, ()))
+
+    async def _bucle(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            lote = [await self._cola.get()]
+            limite = loop.time() + self.intervalo
+            while len(lote) < self.max_lote:
+                restante = limite - loop.time()
+                if restante <= 0:
+                    break
+                try:
+                    lote.append(await asyncio.wait_for(self._cola.get(), restante))
+                except asyncio.TimeoutError:
+                    break
+
+            await self._escribir(lote)
+            for _ in lote:
+                self._cola.task_done()
+
+    async def _insertar_con_reintentos(self, lote: List[MensajePendiente]):
+        espera = 0.5
+        for intento in range(self.reintentos + 1):
+            try:
+                await asyncio.to_thread(self._insertar, lote)
+                return
+            except ERRORES_TRANSITORIOS as e:
+                self.errores += 1
+                if intento == self.reintentos:
+                    raise
+                logger.error(f"Error al escribir {len(lote)} mensajes de chat_history, se reintenta: {str(e)}")
+                await asyncio.sleep(espera)
+                espera = min(espera * 2, 30)
+
+    async def _escribir_partes(self, lote: List[MensajePendiente]):
+        try:
+            await self._insertar_con_reintentos(lote)
+        except ERRORES_TRANSITORIOS as e:
+            self.descartados += len(lote)
+            logger.error(
+                f"Se descartan {len(lote)} mensajes de chat_history tras {self.reintentos + 1} intentos: {str(e)}"
+            )
+            return
+        except Exception as e:
+            self.errores += 1
+            if len(lote) == 1:
+                self.descartados += 1
+                logger.error(f"Mensaje de chat_history descartado (sesión {lote[0].session_id}): {str(e)}")
+                return
+            mitad = len(lote) // 2
+            await self._escribir_partes(lote[:mitad])
+            await self._escribir_partes(lote[mitad:])
+            return
+        self.escritos += len(lote)
+
+    async def _escribir(self, lote: List[MensajePendiente]):
+        await self._escribir_partes(lote)
+        self.lotes += 1
+        with self._lock:
+            for mensaje in lote:
+                de_sesion = self._pendientes.get(mensaje.session_id)
+                if de_sesion:
+                    de_sesion.remove(mensaje)
+                    if not de_sesion:
+                        del self._pendientes[mensaje.session_id]
+
+    @staticmethod
+    def _insertar(lote: List[MensajePendiente]):
+        with db_pool.conexion() as conn:
+            with conn.cursor() as cursor:
+                execute_values(
+                    cursor,
+                    """
+                    INSERT INTO chat_history
+                        (session_id, role, content, carrera_referencia, timestamp)
+                    VALUES %s
+                    """,
+                    lote,
+                    page_size=len(lote)
+                )
+            conn.commit()
+
+    async def detener(self, timeout: float = HISTORIAL_TIMEOUT_CIERRE):
+        """Escribe lo que quede en la cola y detiene la tarea"""
+        if not self.activo:
+            return
+        try:
+            await asyncio.wait_for(self._cola.join(), timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                perdidos = sum(len(m) for m in self._pendientes.values())
+            logger.error(f"Cierre sin completar la escritura del historial: {perdidos} mensajes sin guardar")
+        self._tarea.cancel()
+        try:
+            await self._tarea
+        except asyncio.CancelledError:
+            pass
+
+    def estadisticas(self) -> dict:
+        with self._lock:
+            pendientes = sum(len(m) for m in self._pendientes.values())
+        return {
+            "encolados": self.encolados,
+            "escritos": self.escritos,
+            "lotes": self.lotes,
+            "errores": self.errores,
+            "descartados": self.descartados,
+            "pendientes": pendientes
+        }
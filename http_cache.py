@@ -0,0 +1,84 @@
+"""Utilidades de caché HTTP: validadores (ETag / Last-Modified) y peticiones Range."""
+from datetime import datetime, timezone
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Optional, Tuple
+
+from fastapi import Request
+
+
+class RangoNoSatisfacible(Exception):
+    """El rango pedido queda fuera del tamaño del recurso"""
+
+
+def fecha_http(fecha: datetime) -> str:
+    """Formatea una fecha para Last-Modified (las fechas sin zona se asumen en UTC)"""
+    if fecha.tzinfo is None:
+        fecha = fecha.replace(tzinfo=timezone.utc)
+    return formatdate(fecha.timestamp(), usegmt=True)
+
+
+def etag_coincide(if_none_match: Optional[str], etag: str) -> bool:
+    """Comparación débil de If-None-Match contra el ETag actual"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    actual = etag.removeprefix("W/")
+    return any(
+        candidato.strip().removeprefix("W/") == actual
+        for candidato in if_none_match.split(",")
+    )
+
+
+def no_modificado(request: Request, etag: str, ultima_modificacion: Optional[datetime] = None) -> bool:
+    """Indica si se puede responder 304 según If-None-Match o, si no viene, If-Modified-Since"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return etag_coincide(if_none_match, etag)
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and ultima_modificacion:
+        try:
+            desde = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if ultima_modificacion.tzinfo is None:
+            ultima_modificacion = ultima_modificacion.replace(tzinfo=timezone.utc)
+        return int(ultima_modificacion.timestamp()) <= int(desde.timestamp())
+    return False
+
+
+def parsear_rango(request: Request, tamano: int, etag: str) -> Optional[Tuple[int, int]]:
+    """Devuelve (inicio, fin) inclusivos del header Range, o None para enviar todo el recurso.
+
+    Solo se atiende un rango por petición; con varios rangos o un If-Range que no
+    coincide se responde el recurso completo, como permite el RFC 9110.
+    """
+    rango = request.headers.get("range")
+    if not rango or not rango.startswith("bytes="):
+        return None
+
+    if_range = request.headers.get("if-range")
+    if if_range and if_range.strip() != etag:
+        return None
+
+    especificacion = rango[len("bytes="):].strip()
+    if "," in especificacion:
+        return None
+
+    inicio_txt, _, fin_txt = especificacion.partition("-")
+    try:
+        if not inicio_txt:
+            sufijo = int(fin_txt)
+            if sufijo <= 0:
+                raise RangoNoSatisfacible()
+            inicio, fin = max(tamano - sufijo, 0), tamano - 1
+        else:
+            inicio = int(inicio_txt)
+            fin = int(fin_txt) if fin_txt else tamano - 1
+    except ValueError:
+        return None
+
+    if inicio >= tamano or fin < inicio:
+        raise RangoNoSatisfacible()
+    return inicio, min(fin, tamano - 1)
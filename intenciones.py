@@ -0,0 +1,165 @@
+"""Router de intenciones: responde preguntas factuales del catálogo con plantillas, sin Gemini."""
+import os
+import re
+import json
+import logging
+from typing import Dict, List, Optional
+
+from detector_carreras import normalizar
+
+logger = logging.getLogger(__name__)
+
+# Archivo JSON opcional que reemplaza o amplía las intenciones por defecto:
+# {"intenciones": {"costo": {"patrones": [...], "plantilla": "..."}}, "abiertas": [...]}
+INTENCIONES_ARCHIVO = os.getenv("INTENCIONES_ARCHIVO", "")
+INTENCIONES_ACTIVAS = os.getenv("INTENCIONES_ACTIVAS", "1") == "1"
+
+INTENCIONES_POR_DEFECTO: Dict[str, dict] = {
+    "costo": {
+        "patrones": [
+            "cuanto cuesta", "cuanto vale", "costo", "costos", "precio", "precios", "valor",
+            "mensualidad", "cuota", "cuotas", "matricula", "inscripcion", "arancel", "pagar", "pago"
+        ],
+        "plantilla": (
+            "💰 Estos son los costos de **{nombre}**:\n\n"
+            "- Inscripción: ${inscripción}\n"
+            "- PRE: ${pre}\n"
+            "- Matrícula: ${matrícula}\n"
+            "- Cuotas mensuales: ${cuotas_mensuales}\n\n"
+            "¿Te gustaría conocer también la modalidad o los horarios? Estoy aquí para ayudarte 😊"
+        )
+    },
+    "duracion": {
+        "patrones": ["cuanto dura", "duracion", "cuantos semestres", "semestres", "cuantos anos", "cuanto tiempo"],
+        "plantilla": (
+            "🎓 La carrera de **{nombre}** tiene una duración de **{semestre} semestres**.\n\n"
+            "¿Quieres que te cuente sobre los costos o la modalidad?"
+        )
+    },
+    "modalidad": {
+        "patrones": [
+            "modalidad", "presencial", "virtual", "en linea", "online", "a distancia", "hibrida", "semipresencial"
+        ],
+        "plantilla": (
+            "🏫 La carrera de **{nombre}** se ofrece en modalidad **{modalidad}**.\n\n"
+            "¿Te gustaría conocer los horarios disponibles?"
+        )
+    },
+    "horario": {
+        "patrones": [
+            "horario", "horarios", "a que hora", "que hora", "jornada", "nocturno", "matutino", "vespertino",
+            "fin de semana", "fines de semana"
+        ],
+        "plantilla": (
+            "🕒 Estos son los horarios de **{nombre}**:\n\n{horarios_texto}\n\n"
+            "¿Deseas más información sobre costos o el proceso de inscripción?"
+        )
+    },
+}
+
+# Si aparece alguna de estas expresiones la pregunta se considera abierta y va a Gemini
+PATRONES_ABIERTOS_POR_DEFECTO: List[str] = [
+    "por que", "como es", "que tal", "recomiend", "vale la pena", "diferencia", "compar", "mejor",
+    "campo laboral", "trabajo", "explica", "cuentame", "que se estudia", "materias", "perfil", "beca"
+]
+
+
+def _compilar(patrones: List[str]) -> re.Pattern:
+    alternativas = "|".join(re.escape(normalizar(p)) for p in sorted(patrones, key=len, reverse=True))
+    return re.compile(rf"\b(?:{alternativas})")
+
+
+def formatear_horarios(horarios: Optional[dict]) -> str:
+    """Una línea por turno; los turnos con varios bloques los separan con punto y coma"""
+    if not horarios:
+        return ""
+    return "\n".join(
+        f"- {turno}: " + "; ".join(f"{bloque.get('dias', '')} de {bloque.get('horario', '')}" for bloque in bloques)
+        for turno, bloques in horarios.items()
+    )
+
+
+class RouterIntenciones:
+    """Clasifica preguntas factuales (costo, duración, modalidad, horario) y las responde con plantillas.
+
+    Solo se responde sin Gemini cuando el mensaje tiene al menos una intención
+    factual, ninguna expresión abierta y todos los campos de las plantillas
+    están disponibles en los datos de la carrera.
+    """
+
+    def __init__(
+        self,
+        intenciones: Optional[Dict[str, dict]] = None,
+        patrones_abiertos: Optional[List[str]] = None
+    ):
+        self.intenciones = intenciones or INTENCIONES_POR_DEFECTO
+        self._regex = {nombre: _compilar(config["patrones"]) for nombre, config in self.intenciones.items()}
+        self._regex_abierta = _compilar(patrones_abiertos or PATRONES_ABIERTOS_POR_DEFECTO)
+
+    @classmethod
+    def desde_configuracion(cls, archivo: str = INTENCIONES_ARCHIVO) -> "RouterIntenciones":
+        """Intenciones por defecto combinadas con las del archivo JSON, si existe"""
+        intenciones = {nombre: dict(config) for nombre, config in INTENCIONES_POR_DEFECTO.items()}
+        abiertas = list(PATRONES_ABIERTOS_POR_DEFECTO)
+        if archivo:
+            try:
+                with open(archivo, encoding="utf-8") as f:
+                    config = json.load(f)
+                for nombre, valores in config.get("intenciones", {}).items():
+                    intenciones.setdefault(nombre, {}).update(valores)
+                abiertas = config.get("abiertas", abiertas)
+            except (OSError, ValueError) as e:
+                logger.error(f"No se pudo leer la configuración de intenciones {archivo}: {str(e)}")
+        return cls(intenciones, abiertas)
+
+    def clasificar(self, texto: str) -> List[str]:
+        """Intenciones factuales del mensaje, o lista vacía si es una pregunta abierta"""
+        normalizado = normalizar(texto)
+        if self._regex_abierta.search(normalizado):
+            return []
+        return [nombre for nombre, regex in self._regex.items() if regex.search(normalizado)]
+
+    def responder(self, texto: str, db_data: Optional[dict]) -> Optional[str]:
+        """Respuesta por plantilla o None si la pregunta debe ir a Gemini"""
+        if not db_data:
+            return None
+        intenciones = self.clasificar(texto)
+        if not intenciones:
+            return None
+
+        campos = self._campos(db_data)
+        partes = []
+        for nombre in intenciones:
+            parte = self._renderizar(nombre, campos)
+            if parte is None:
+                return None
+            partes.append(parte)
+        return "\n\n".join(partes)
+
+    def resumen(self, db_data: Optional[dict]) -> Optional[str]:
+        """Todas las plantillas que se pueden completar con los datos de la carrera, o None si ninguna"""
+        if not db_data:
+            return None
+        campos = self._campos(db_data)
+        partes = [
+            parte for parte in (self._renderizar(nombre, campos) for nombre in self.intenciones)
+            if parte is not None
+        ]
+        return "\n\n".join(partes) if partes else None
+
+    @staticmethod
+    def _campos(db_data: dict) -> dict:
+        # Los campos nulos quedan fuera para que format_map falle y la plantilla se descarte
+        campos = {k: v for k, v in db_data.items() if v is not None}
+        campos["horarios_texto"] = formatear_horarios(db_data.get("horarios"))
+        return campos
+
+    def _renderizar(self, nombre: str, campos: dict) -> Optional[str]:
+        try:
+            parte = self.intenciones[nombre]["plantilla"].format_map(campos)
+        except (KeyError, ValueError, IndexError) as e:
+            logger.debug(f"Plantilla '{nombre}' sin datos suficientes: {str(e)}")
+            return None
+        if nombre == "horario" and not campos["horarios_texto"]:
+            return None
+        return parte
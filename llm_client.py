@@ -0,0 +1,376 @@
+"""Cliente asíncrono para la API de Gemini con pool de conexiones persistente."""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import AsyncIterator, Dict, Optional, Tuple
+
+import httpx
+
+from metrics import registro
+
+logger = logging.getLogger(__name__)
+
+GEMINI_API_KEY = os.getenv("GEMINI_API_KEY", "tu_api_key_de_gemini")
+GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com")
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.0-flash")
+
+# Caché de contexto de Gemini para el prefijo fijo del prompt
+GEMINI_CACHE_PREFIJO = os.getenv("GEMINI_CACHE_PREFIJO", "0") == "1"
+GEMINI_CACHE_TTL = int(os.getenv("GEMINI_CACHE_TTL", "3600"))
+# Tras un fallo al crear la caché se envía el prefijo completo durante este tiempo
+GEMINI_CACHE_REINTENTO = float(os.getenv("GEMINI_CACHE_REINTENTO", "300"))
+
+GENERATION_CONFIG = {
+    "temperature": 0.7,
+    "topP": 0.9,
+    "maxOutputTokens": 1024
+}
+
+
+GEMINI_LLAMADAS = registro.contador(
+    "chatbot_gemini_llamadas_total", "Llamadas a Gemini por modo y resultado", ("modo", "resultado")
+)
+GEMINI_DURACION = registro.histograma(
+    "chatbot_gemini_duracion_segundos", "Duración de las llamadas a Gemini", ("modo",)
+)
+GEMINI_ESPERA = registro.histograma(
+    "chatbot_gemini_espera_segundos", "Espera por un lugar en el límite de llamadas concurrentes"
+)
+GEMINI_TOKENS = registro.contador(
+    "chatbot_gemini_tokens_total", "Tokens informados por Gemini en usageMetadata", ("tipo",)
+)
+
+
+# Al iniciar: "conexion" abre la conexión TLS con una consulta del modelo, "generar" además pide
+# una respuesta corta (la primera generación suele ser la más lenta) y "0" no hace nada
+GEMINI_PRECALENTAR = os.getenv("GEMINI_PRECALENTAR", "conexion")
+PROMPT_PRECALENTAR = "Responde solo con la palabra: listo"
+
+
+# Códigos con los que vale la pena reintentar la llamada
+ESTADOS_REINTENTABLES = {408, 429, 500, 502, 503, 504}
+
+
+class LLMError(Exception):
+    """Error al comunicarse con el servicio de IA.
+
+    `reintentable` indica un fallo transitorio del proveedor (límite de
+    tasa, 5xx, timeout o conexión) y `reintentar_en` los segundos pedidos
+    en el header Retry-After, si vino.
+    """
+
+    def __init__(
+        self,
+        mensaje: str,
+        estado: Optional[int] = None,
+        reintentable: bool = False,
+        reintentar_en: Optional[float] = None
+    ):
+        super().__init__(mensaje)
+        self.estado = estado
+        self.reintentable = reintentable
+        self.reintentar_en = reintentar_en
+
+
+def parsear_retry_after(valor: Optional[str]) -> Optional[float]:
+    """Segundos de espera de un header Retry-After (número de segundos o fecha HTTP)"""
+    if not valor:
+        return None
+    try:
+        return max(float(valor), 0.0)
+    except ValueError:
+        pass
+    try:
+        fecha = parsedate_to_datetime(valor)
+    except (TypeError, ValueError):
+        return None
+    if fecha.tzinfo is None:
+        fecha = fecha.replace(tzinfo=timezone.utc)
+    return max((fecha - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+def error_desde_http(error: httpx.HTTPError) -> LLMError:
+    if isinstance(error, httpx.HTTPStatusError):
+        estado = error.response.status_code
+        return LLMError(
+            str(error),
+            estado=estado,
+            reintentable=estado in ESTADOS_REINTENTABLES,
+            reintentar_en=parsear_retry_after(error.response.headers.get("retry-after"))
+        )
+    return LLMError(str(error), reintentable=isinstance(error, httpx.TransportError))
+
+
+def clasificar_error(error: httpx.HTTPError) -> str:
+    """Etiqueta corta del error para las métricas"""
+    if isinstance(error, httpx.TimeoutException):
+        return "timeout"
+    if isinstance(error, httpx.HTTPStatusError):
+        return f"http_{error.response.status_code}"
+    return "conexion"
+
+
+def registrar_uso(uso: Optional[dict]):
+    if not uso:
+        return
+    GEMINI_TOKENS.inc(uso.get("promptTokenCount", 0), tipo="entrada")
+    GEMINI_TOKENS.inc(uso.get("candidatesTokenCount", 0), tipo="salida")
+    if uso.get("cachedContentTokenCount"):
+        GEMINI_TOKENS.inc(uso["cachedContentTokenCount"], tipo="cacheados")
+
+
+class GeminiClient:
+    """Cliente de Gemini con conexiones keep-alive y límite de llamadas concurrentes.
+
+    Una sola instancia se comparte en todo el proceso: el pool de httpx mantiene
+    las conexiones TLS abiertas entre peticiones y el semáforo limita cuántas
+    llamadas a Gemini hay en vuelo al mismo tiempo.
+
+    Con `cache_prefijo` el prefijo fijo del prompt se sube una vez como
+    cachedContent y cada llamada envía solo la parte variable. Si la caché no
+    se puede crear (por ejemplo, porque el prefijo no llega al mínimo de
+    tokens del modelo) o expiró en el servidor, se envía el prompt completo.
+    """
+
+    def __init__(
+        self,
+        api_key: str = GEMINI_API_KEY,
+        base_url: str = GEMINI_BASE_URL,
+        model: str = GEMINI_MODEL,
+        max_concurrencia: int = int(os.getenv("GEMINI_MAX_CONCURRENCIA", "32")),
+        max_conexiones_keepalive: int = int(os.getenv("GEMINI_MAX_KEEPALIVE", "16")),
+        timeout: float = float(os.getenv("GEMINI_TIMEOUT", "30")),
+        connect_timeout: float = float(os.getenv("GEMINI_CONNECT_TIMEOUT", "5")),
+        cache_prefijo: bool = GEMINI_CACHE_PREFIJO,
+        cache_ttl: int = GEMINI_CACHE_TTL,
+    ):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.timeout = timeout
+        self.cache_prefijo = cache_prefijo
+        self.cache_ttl = cache_ttl
+        # huella del prefijo -> (nombre del cachedContent, expira_en según el reloj del loop)
+        self._contenidos_cacheados: Dict[str, Tuple[str, float]] = {}
+        self._lock_cache = asyncio.Lock()
+        self._cache_deshabilitada_hasta = 0.0
+        self._semaforo = asyncio.Semaphore(max_concurrencia)
+        self._client = httpx.AsyncClient(
+            base_url=self.base_url,
+            headers={"Content-Type": "application/json"},
+            limits=httpx.Limits(
+                max_connections=max_concurrencia,
+                max_keepalive_connections=max_conexiones_keepalive
+            ),
+            timeout=httpx.Timeout(timeout, connect=connect_timeout),
+        )
+
+    def _url(self, metodo: str) -> str:
+        return f"/v1beta/models/{self.model}:{metodo}"
+
+    @staticmethod
+    def construir_payload(prompt: str, cached_content: Optional[str] = None) -> dict:
+        payload = {
+            "contents": [{
+                "role": "user",
+                "parts": [{"text": prompt}]
+            }],
+            "generationConfig": GENERATION_CONFIG
+        }
+        if cached_content:
+            payload["cachedContent"] = cached_content
+        return payload
+
+    async def _contenido_cacheado(self, prefijo: str) -> Optional[str]:
+        """Nombre del cachedContent con el prefijo, creándolo si hace falta"""
+        loop = asyncio.get_running_loop()
+        huella = hashlib.sha256(prefijo.encode("utf-8")).hexdigest()
+        # Se renueva un poco antes de que expire para no usar una caché a punto de vencer
+        margen = min(60, self.cache_ttl / 10)
+
+        entrada = self._contenidos_cacheados.get(huella)
+        if entrada and entrada[1] - margen > loop.time():
+            return entrada[0]
+
+        async with self._lock_cache:
+            entrada = self._contenidos_cacheados.get(huella)
+            if entrada and entrada[1] - margen > loop.time():
+                return entrada[0]
+            if self._cache_deshabilitada_hasta > loop.time():
+                return None
+            try:
+                response = await self._client.post(
+                    "/v1beta/cachedContents",
+                    params={"key": self.api_key},
+                    json={
+                        "model": f"models/{self.model}",
+                        "contents": [{"role": "user", "parts": [{"text": prefijo}]}],
+                        "ttl": f"{self.cache_ttl}s"
+                    }
+                )
+                response.raise_for_status()
+                nombre = response.json()["name"]
+            except (httpx.HTTPError, KeyError, ValueError) as e:
+                logger.warning(f"No se pudo crear la caché de contexto de Gemini, se envía el prompt completo: {str(e)}")
+                self._cache_deshabilitada_hasta = loop.time() + GEMINI_CACHE_REINTENTO
+                return None
+
+            self._contenidos_cacheados[huella] = (nombre, loop.time() + self.cache_ttl)
+            logger.info(f"Caché de contexto de Gemini creada: {nombre}")
+            return nombre
+
+    def _descartar_cacheado(self, nombre: str):
+        for huella, (actual, _) in list(self._contenidos_cacheados.items()):
+            if actual == nombre:
+                del self._contenidos_cacheados[huella]
+
+    async def _preparar(self, prompt: str, prefijo: Optional[str]) -> Tuple[str, Optional[str]]:
+        """Texto a enviar y cachedContent a usar, si lo hay"""
+        if not prefijo:
+            return prompt, None
+        if self.cache_prefijo:
+            nombre = await self._contenido_cacheado(prefijo)
+            if nombre:
+                return prompt, nombre
+        return prefijo + prompt, None
+
+    @staticmethod
+    def extraer_texto(data: dict) -> str:
+        """Extrae el texto de la primera candidata de una respuesta de Gemini"""
+        try:
+            return data["candidates"][0]["content"]["parts"][0]["text"]
+        except (KeyError, IndexError, TypeError) as e:
+            raise LLMError(f"Respuesta de Gemini sin contenido: {str(e)}") from e
+
+    async def generar(self, prompt: str, timeout: Optional[float] = None, prefijo: Optional[str] = None) -> str:
+        """Envía el prompt (precedido del prefijo) a Gemini y devuelve el texto generado"""
+        inicio = time.perf_counter()
+        resultado = "ok"
+        try:
+            texto, cached_content = await self._preparar(prompt, prefijo)
+            espera = time.perf_counter()
+            async with self._semaforo:
+                GEMINI_ESPERA.observar(time.perf_counter() - espera)
+                response = await self._client.post(
+                    self._url("generateContent"),
+                    params={"key": self.api_key},
+                    json=self.construir_payload(texto, cached_content),
+                    timeout=timeout if timeout is not None else self.timeout
+                )
+                if cached_content and response.status_code in (400, 403, 404):
+                    # La caché expiró o fue borrada en el servidor: se reintenta con el prompt completo
+                    self._descartar_cacheado(cached_content)
+                    response = await self._client.post(
+                        self._url("generateContent"),
+                        params={"key": self.api_key},
+                        json=self.construir_payload(prefijo + prompt),
+                        timeout=timeout if timeout is not None else self.timeout
+                    )
+                response.raise_for_status()
+            data = response.json()
+            registrar_uso(data.get("usageMetadata"))
+            return self.extraer_texto(data)
+        except httpx.HTTPError as e:
+            resultado = clasificar_error(e)
+            raise error_desde_http(e) from e
+        except LLMError:
+            resultado = "respuesta_invalida"
+            raise
+        except ValueError as e:
+            resultado = "respuesta_invalida"
+            raise LLMError(f"Respuesta de Gemini inválida: {str(e)}") from e
+        finally:
+            GEMINI_LLAMADAS.inc(modo="generar", resultado=resultado)
+            GEMINI_DURACION.observar(time.perf_counter() - inicio, modo="generar")
+
+    async def generar_stream(
+        self,
+        prompt: str,
+        timeout: Optional[float] = None,
+        prefijo: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        """Envía el prompt (precedido del prefijo) a Gemini y va entregando el texto a medida que llega"""
+        inicio = time.perf_counter()
+        resultado = "ok"
+        uso = {}
+        try:
+            texto, cached_content = await self._preparar(prompt, prefijo)
+            espera = time.perf_counter()
+            async with self._semaforo:
+                GEMINI_ESPERA.observar(time.perf_counter() - espera)
+                async with self._client.stream(
+                    "POST",
+                    self._url("streamGenerateContent"),
+                    params={"key": self.api_key, "alt": "sse"},
+                    json=self.construir_payload(texto, cached_content),
+                    timeout=timeout if timeout is not None else self.timeout
+                ) as response:
+                    if cached_content and response.status_code in (400, 403, 404):
+                        # Todavía no se envió nada al cliente: se puede reintentar con el prompt completo
+                        self._descartar_cacheado(cached_content)
+                    else:
+                        response.raise_for_status()
+                        async for fragmento in self._leer_eventos(response, uso):
+                            yield fragmento
+                        return
+
+                async with self._client.stream(
+                    "POST",
+                    self._url("streamGenerateContent"),
+                    params={"key": self.api_key, "alt": "sse"},
+                    json=self.construir_payload(prefijo + prompt),
+                    timeout=timeout if timeout is not None else self.timeout
+                ) as response:
+                    response.raise_for_status()
+                    async for fragmento in self._leer_eventos(response, uso):
+                        yield fragmento
+        except httpx.HTTPError as e:
+            resultado = clasificar_error(e)
+            raise error_desde_http(e) from e
+        except LLMError:
+            resultado = "respuesta_invalida"
+            raise
+        except (GeneratorExit, asyncio.CancelledError):
+            resultado = "cancelada"
+            raise
+        finally:
+            registrar_uso(uso.get("usageMetadata"))
+            GEMINI_LLAMADAS.inc(modo="stream", resultado=resultado)
+            GEMINI_DURACION.observar(time.perf_counter() - inicio, modo="stream")
+
+    @staticmethod
+    async def _leer_eventos(response: httpx.Response, uso: dict) -> AsyncIterator[str]:
+        """Texto de cada evento SSE; deja en `uso` el último usageMetadata recibido"""
+        async for linea in response.aiter_lines():
+            if not linea.startswith("data:"):
+                continue
+            try:
+                data = json.loads(linea[len("data:"):])
+            except ValueError as e:
+                raise LLMError(f"Evento SSE inválido de Gemini: {str(e)}") from e
+            if "usageMetadata" in data:
+                uso["usageMetadata"] = data["usageMetadata"]
+            parts = (data.get("candidates") or [{}])[0].get("content", {}).get("parts", [])
+            texto = "".join(part.get("text", "") for part in parts)
+            if texto:
+                yield texto
+
+    async def precalentar(self, modo: str = GEMINI_PRECALENTAR):
+        """Deja abierta una conexión con Gemini antes de la primera petición de un usuario"""
+        if modo == "0":
+            return
+        try:
+            # Cualquier respuesta sirve: lo que interesa es el handshake TLS que queda en el pool
+            await self._client.get(f"/v1beta/models/{self.model}", params={"key": self.api_key})
+        except httpx.HTTPError as e:
+            raise error_desde_http(e) from e
+        if modo == "generar":
+            await self.generar(PROMPT_PRECALENTAR)
+
+    async def cerrar(self):
+        await self._client.aclose()
@@ -0,0 +1,263 @@
+"""Control de admisión, reintentos y circuit breaker delante del cliente de Gemini."""
+import os
+import time
+import random
+import asyncio
+import logging
+from typing import AsyncIterator, Optional
+
+from llm_client import GeminiClient, LLMError
+from metrics import registro
+
+logger = logging.getLogger(__name__)
+
+LLM_MAX_CONCURRENCIA = int(os.getenv("LLM_MAX_CONCURRENCIA", os.getenv("GEMINI_MAX_CONCURRENCIA", "32")))
+# Peticiones que pueden esperar un lugar; más allá se rechazan de inmediato
+LLM_MAX_COLA = int(os.getenv("LLM_MAX_COLA", "200"))
+# Tiempo máximo en la cola y tiempo total (cola + intentos + esperas) de una llamada
+LLM_ESPERA_MAX = float(os.getenv("LLM_ESPERA_MAX", "5"))
+LLM_DEADLINE = float(os.getenv("LLM_DEADLINE", "20"))
+LLM_REINTENTOS = int(os.getenv("LLM_REINTENTOS", "2"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "8"))
+# Fallos seguidos que abren el circuito y segundos que permanece abierto
+LLM_CIRCUITO_FALLOS = int(os.getenv("LLM_CIRCUITO_FALLOS", "5"))
+LLM_CIRCUITO_ENFRIAMIENTO = float(os.getenv("LLM_CIRCUITO_ENFRIAMIENTO", "30"))
+
+LLM_RECHAZOS = registro.contador(
+    "chatbot_llm_rechazos_total", "Llamadas a Gemini no realizadas por el gateway", ("motivo",)
+)
+LLM_REINTENTOS_TOTAL = registro.contador(
+    "chatbot_llm_reintentos_total", "Reintentos de llamadas a Gemini", ("motivo",)
+)
+LLM_ESPERA_COLA = registro.histograma(
+    "chatbot_llm_espera_cola_segundos", "Espera en la cola del gateway antes de llamar a Gemini"
+)
+
+
+class LLMNoDisponible(LLMError):
+    """El gateway no llamó a Gemini (circuito abierto, cola llena o sin tiempo); conviene una respuesta alternativa"""
+
+    def __init__(self, mensaje: str, motivo: str):
+        super().__init__(mensaje)
+        self.motivo = motivo
+
+
+class CircuitBreaker:
+    """Circuito cerrado / abierto / semiabierto según los fallos seguidos del proveedor.
+
+    Con `umbral` fallos seguidos se abre y rechaza llamadas durante
+    `enfriamiento` segundos. Luego deja pasar una sola llamada de prueba:
+    si funciona se cierra, si falla se vuelve a abrir.
+    """
+
+    CERRADO, ABIERTO, SEMIABIERTO = "cerrado", "abierto", "semiabierto"
+
+    def __init__(self, umbral: int = LLM_CIRCUITO_FALLOS, enfriamiento: float = LLM_CIRCUITO_ENFRIAMIENTO):
+        self.umbral = umbral
+        self.enfriamiento = enfriamiento
+        self.estado = self.CERRADO
+        self.fallos = 0
+        self._abierto_desde = 0.0
+        self._prueba_en_curso = False
+        self.aperturas = 0
+
+    def permitir(self) -> bool:
+        if self.estado == self.CERRADO:
+            return True
+        if self.estado == self.ABIERTO:
+            if time.monotonic() - self._abierto_desde < self.enfriamiento:
+                return False
+            self.estado = self.SEMIABIERTO
+            self._prueba_en_curso = False
+        if self._prueba_en_curso:
+            return False
+        self._prueba_en_curso = True
+        return True
+
+    def exito(self):
+        if self.estado != self.CERRADO:
+            logger.info("Circuito de Gemini cerrado: el proveedor responde de nuevo")
+        self.estado = self.CERRADO
+        self.fallos = 0
+        self._prueba_en_curso = False
+
+    def fallo(self):
+        self.fallos += 1
+        self._prueba_en_curso = False
+        if self.estado == self.SEMIABIERTO or self.fallos >= self.umbral:
+            if self.estado != self.ABIERTO:
+                self.aperturas += 1
+                logger.error(f"Circuito de Gemini abierto tras {self.fallos} fallos seguidos")
+            self.estado = self.ABIERTO
+            self._abierto_desde = time.monotonic()
+
+    def liberar(self):
+        """La llamada de prueba terminó sin un resultado que cuente (por ejemplo, se canceló)"""
+        self._prueba_en_curso = False
+
+
+class LLMGateway:
+    """Puerta de entrada a Gemini para las peticiones de los usuarios.
+
+    Limita las llamadas en vuelo y cuántas esperan, con un tiempo máximo de
+    espera; reintenta los fallos transitorios con backoff exponencial y
+    jitter completo, respetando Retry-After; y corta rápido con el circuit
+    breaker cuando el proveedor está caído. Cuando no llama a Gemini lanza
+    LLMNoDisponible para que la API responda con el contenido del catálogo.
+    Todo ocurre dentro de un plazo total por llamada.
+    """
+
+    def __init__(
+        self,
+        cliente: GeminiClient,
+        max_concurrencia: int = LLM_MAX_CONCURRENCIA,
+        max_cola: int = LLM_MAX_COLA,
+        espera_max: float = LLM_ESPERA_MAX,
+        deadline: float = LLM_DEADLINE,
+        reintentos: int = LLM_REINTENTOS,
+        backoff_base: float = LLM_BACKOFF_BASE,
+        backoff_max: float = LLM_BACKOFF_MAX,
+        circuito: Optional[CircuitBreaker] = None
+    ):
+        self.cliente = cliente
+        self.max_concurrencia = max_concurrencia
+        self.max_cola = max_cola
+        self.espera_max = espera_max
+        self.deadline = deadline
+        self.reintentos = reintentos
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.circuito = circuito or CircuitBreaker()
+        self._semaforo = asyncio.Semaphore(max_concurrencia)
+        self.en_cola = 0
+        self.en_vuelo = 0
+
+    def _espera_reintento(self, intento: int, error: LLMError) -> float:
+        espera = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** intento))
+        if error.reintentar_en is not None:
+            # Retry-After es un mínimo; el jitter evita que todos vuelvan a la vez
+            espera = error.reintentar_en + random.uniform(0, self.backoff_base)
+        return espera
+
+    async def _admitir(self, limite: float):
+        if not self.circuito.permitir():
+            LLM_RECHAZOS.inc(motivo="circuito_abierto")
+            raise LLMNoDisponible("Circuito de Gemini abierto", "circuito_abierto")
+        if not self._semaforo.locked():
+            # Hay lugar libre: acquire no cede el control y la llamada no pasa por la cola
+            await self._semaforo.acquire()
+            self.en_vuelo += 1
+            return
+        if self.en_cola >= self.max_cola:
+            self.circuito.liberar()
+            LLM_RECHAZOS.inc(motivo="cola_llena")
+            raise LLMNoDisponible("Cola de llamadas a Gemini llena", "cola_llena")
+
+        inicio = time.monotonic()
+        self.en_cola += 1
+        try:
+            await asyncio.wait_for(self._semaforo.acquire(), min(self.espera_max, limite - inicio))
+        except asyncio.TimeoutError:
+            self.circuito.liberar()
+            LLM_RECHAZOS.inc(motivo="espera_agotada")
+            raise LLMNoDisponible("Tiempo de espera agotado en la cola de Gemini", "espera_agotada")
+        finally:
+            self.en_cola -= 1
+            LLM_ESPERA_COLA.observar(time.monotonic() - inicio)
+        self.en_vuelo += 1
+
+    def _liberar(self):
+        self.en_vuelo -= 1
+        self._semaforo.release()
+
+    async def _esperar_reintento(self, intento: int, error: LLMError, limite: float) -> bool:
+        """Espera antes del siguiente intento; False si no queda tiempo o no tiene sentido reintentar"""
+        if not error.reintentable or intento >= self.reintentos:
+            return False
+        espera = self._espera_reintento(intento, error)
+        if time.monotonic() + espera >= limite:
+            return False
+        LLM_REINTENTOS_TOTAL.inc(motivo=f"http_{error.estado}" if error.estado else "transporte")
+        logger.warning(f"Reintento {intento + 1} de Gemini en {espera:.2f} s: {str(error)}")
+        await asyncio.sleep(espera)
+        return True
+
+    def _registrar_fallo(self, error: LLMError):
+        # Solo los fallos del proveedor abren el circuito; un 400 es un problema de la petición
+        if error.reintentable:
+            self.circuito.fallo()
+        else:
+            self.circuito.liberar()
+
+    async def generar(self, prompt: str, prefijo: Optional[str] = None) -> str:
+        limite = time.monotonic() + self.deadline
+        await self._admitir(limite)
+        try:
+            intento = 0
+            while True:
+                try:
+                    texto = await self.cliente.generar(
+                        prompt,
+                        timeout=min(self.cliente.timeout, max(limite - time.monotonic(), 0.1)),
+                        prefijo=prefijo
+                    )
+                except LLMError as e:
+                    if await self._esperar_reintento(intento, e, limite):
+                        intento += 1
+                        continue
+                    self._registrar_fallo(e)
+                    raise
+                except asyncio.CancelledError:
+                    self.circuito.liberar()
+                    raise
+                self.circuito.exito()
+                return texto
+        finally:
+            self._liberar()
+
+    async def generar_stream(self, prompt: str, prefijo: Optional[str] = None) -> AsyncIterator[str]:
+        """Como `generar`, pero solo se reintenta mientras no se haya entregado ningún fragmento"""
+        limite = time.monotonic() + self.deadline
+        await self._admitir(limite)
+        try:
+            intento = 0
+            while True:
+                entregado = False
+                try:
+                    async for fragmento in self.cliente.generar_stream(
+                        prompt,
+                        timeout=min(self.cliente.timeout, max(limite - time.monotonic(), 0.1)),
+                        prefijo=prefijo
+                    ):
+                        if not entregado:
+                            entregado = True
+                            self.circuito.exito()
+                        yield fragmento
+                except LLMError as e:
+                    if not entregado and await self._esperar_reintento(intento, e, limite):
+                        intento += 1
+                        continue
+                    if not entregado:
+                        self._registrar_fallo(e)
+                    raise
+                except (GeneratorExit, asyncio.CancelledError):
+                    if not entregado:
+                        self.circuito.liberar()
+                    raise
+                if not entregado:
+                    self.circuito.exito()
+                return
+        finally:
+            self._liberar()
+
+    def estadisticas(self) -> dict:
+        return {
+            "circuito": self.circuito.estado,
+            "fallos_seguidos": self.circuito.fallos,
+            "aperturas": self.circuito.aperturas,
+            "en_cola": self.en_cola,
+            "en_vuelo": self.en_vuelo,
+            "max_concurrencia": self.max_concurrencia,
+            "max_cola": self.max_cola
+        }
@@ -0,0 +1,155 @@
+"""Métricas en memoria con exposición en formato de texto de Prometheus."""
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Tuple
+
+# Límites superiores (segundos) por defecto de los histogramas de latencia
+BUCKETS_LATENCIA = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+Etiquetas = Tuple[Tuple[str, str], ...]
+
+
+def _etiquetas(nombres: Tuple[str, ...], valores: Dict[str, object]) -> Etiquetas:
+    if set(valores) != set(nombres):
+        raise ValueError(f"Se esperaban las etiquetas {nombres}, se recibió {tuple(valores)}")
+    return tuple((nombre, str(valores[nombre])) for nombre in nombres)
+
+
+def _escapar(valor: str) -> str:
+    return valor.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _formatear(etiquetas: Etiquetas) -> str:
+    if not etiquetas:
+        return ""
+    return "{" + ",".join(f'{nombre}="{_escapar(valor)}"' for nombre, valor in etiquetas) + "}"
+
+
+def _numero(valor: float) -> str:
+    if valor == float("inf"):
+        return "+Inf"
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+class Contador:
+    """Valor que solo crece, por combinación de etiquetas"""
+    tipo = "counter"
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Tuple[str, ...] = ()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = etiquetas
+        self._valores: Dict[Etiquetas, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, valor: float = 1, **etiquetas):
+        clave = _etiquetas(self.etiquetas, etiquetas)
+        with self._lock:
+            self._valores[clave] = self._valores.get(clave, 0) + valor
+
+    def lineas(self) -> List[str]:
+        with self._lock:
+            return [f"{self.nombre}{_formatear(clave)} {_numero(valor)}" for clave, valor in self._valores.items()]
+
+
+class Histograma:
+    """Distribución de valores en buckets acumulados, por combinación de etiquetas"""
+    tipo = "histogram"
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Tuple[str, ...] = (), buckets=BUCKETS_LATENCIA):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = etiquetas
+        self.buckets = tuple(sorted(buckets))
+        # etiquetas -> (conteo por bucket sin acumular, suma, total)
+        self._series: Dict[Etiquetas, List] = {}
+        self._lock = threading.Lock()
+
+    def observar(self, valor: float, **etiquetas):
+        clave = _etiquetas(self.etiquetas, etiquetas)
+        indice = bisect_left(self.buckets, valor)
+        with self._lock:
+            serie = self._series.get(clave)
+            if serie is None:
+                serie = self._series[clave] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            serie[0][indice] += 1
+            serie[1] += valor
+            serie[2] += 1
+
+    @contextmanager
+    def medir(self, **etiquetas):
+        """Observa la duración del bloque, también si termina con una excepción"""
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observar(time.perf_counter() - inicio, **etiquetas)
+
+    def lineas(self) -> List[str]:
+        salida = []
+        with self._lock:
+            series = [(clave, list(serie[0]), serie[1], serie[2]) for clave, serie in self._series.items()]
+        for clave, conteos, suma, total in series:
+            acumulado = 0
+            for limite, conteo in zip((*self.buckets, float("inf")), conteos):
+                acumulado += conteo
+                salida.append(f"{self.nombre}_bucket{_formatear(clave + (('le', _numero(limite)),))} {acumulado}")
+            salida.append(f"{self.nombre}_sum{_formatear(clave)} {_numero(suma)}")
+            salida.append(f"{self.nombre}_count{_formatear(clave)} {total}")
+        return salida
+
+
+# Un recolector devuelve (nombre, tipo, ayuda, [(etiquetas, valor)]) al momento de exponer
+Recolector = Callable[[], Iterable[Tuple[str, str, str, List[Tuple[Dict[str, object], float]]]]]
+
+
+class Registro:
+    """Conjunto de métricas del proceso y recolectores de valores calculados al exponer"""
+
+    def __init__(self):
+        self._metricas: Dict[str, object] = {}
+        self._recolectores: List[Recolector] = []
+        self._lock = threading.Lock()
+
+    def contador(self, nombre: str, ayuda: str, etiquetas: Tuple[str, ...] = ()) -> Contador:
+        return self._registrar(Contador(nombre, ayuda, etiquetas))
+
+    def histograma(self, nombre: str, ayuda: str, etiquetas: Tuple[str, ...] = (), buckets=BUCKETS_LATENCIA) -> Histograma:
+        return self._registrar(Histograma(nombre, ayuda, etiquetas, buckets))
+
+    def _registrar(self, metrica):
+        with self._lock:
+            if metrica.nombre in self._metricas:
+                raise ValueError(f"Métrica duplicada: {metrica.nombre}")
+            self._metricas[metrica.nombre] = metrica
+        return metrica
+
+    def recolector(self, funcion: Recolector) -> Recolector:
+        """Registra una función que calcula métricas (gauges) en cada exposición"""
+        with self._lock:
+            self._recolectores.append(funcion)
+        return funcion
+
+    def exponer(self) -> str:
+        lineas = []
+        with self._lock:
+            metricas = list(self._metricas.values())
+            recolectores = list(self._recolectores)
+        for metrica in metricas:
+            lineas.append(f"# HELP {metrica.nombre} {metrica.ayuda}")
+            lineas.append(f"# TYPE {metrica.nombre} {metrica.tipo}")
+            lineas.extend(metrica.lineas())
+        for recolector in recolectores:
+            for nombre, tipo, ayuda, muestras in recolector():
+                lineas.append(f"# HELP {nombre} {ayuda}")
+                lineas.append(f"# TYPE {nombre} {tipo}")
+                lineas.extend(
+                    f"{nombre}{_formatear(tuple((k, str(v)) for k, v in etiquetas.items()))} {_numero(valor)}"
+                    for etiquetas, valor in muestras
+                )
+        return "\n".join(lineas) + "\n"
+
+
+registro = Registro()
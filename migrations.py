@@ -0,0 +1,205 @@
+"""Migraciones del esquema de base de datos, aplicadas en orden y una sola vez.
+
+Cada migración corre en su propia transacción y queda registrada en
+schema_migraciones; un advisory lock evita que dos procesos migren a la vez.
+
+Uso:
+    python migrations.py            # aplica las pendientes
+    python migrations.py --estado   # lista aplicadas y pendientes
+
+La API también las aplica al iniciar si DB_MIGRAR_AL_INICIAR=1. En una base
+con mucho historial conviene ejecutarlas fuera de horario: la creación de
+índices y la conversión de chat_history bloquean escrituras mientras duran.
+"""
+import os
+import logging
+import argparse
+from datetime import datetime
+from typing import Callable, List, NamedTuple, Union
+
+from catalogo_cache import SQL_TRIGGERS
+from db_config import get_db_connection
+from history_partitions import (
+    HISTORIAL_PARTICION, HISTORIAL_PARTICIONES_ADELANTE, PARTICION_DEFAULT, TABLA, TABLA_ARCHIVO,
+    crear_particion, inicio_periodo, siguiente_periodo
+)
+
+logger = logging.getLogger(__name__)
+
+DB_MIGRAR_AL_INICIAR = os.getenv("DB_MIGRAR_AL_INICIAR", "0") == "1"
+BLOQUEO_MIGRACIONES = 4817300
+
+
+class Migracion(NamedTuple):
+    version: int
+    nombre: str
+    paso: Union[str, Callable]
+
+
+def particionar_chat_history(cursor):
+    """Convierte chat_history en una tabla particionada por rango de timestamp.
+
+    La tabla existente no se copia: se renombra y se adjunta como la partición
+    chat_history_legado, que cubre todo hasta el final del período actual; las
+    siguientes se crean vacías. El mantenimiento la archiva cuando envejece
+    como cualquier otra partición.
+    """
+    cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", (TABLA,))
+    fila = cursor.fetchone()
+    if fila and fila["relkind"] == "p":
+        return
+
+    cursor.execute("SELECT max(timestamp) AS ultimo FROM chat_history")
+    ultimo = cursor.fetchone()["ultimo"]
+    ahora = datetime.now()
+    limite = siguiente_periodo(inicio_periodo(max(ultimo or ahora, ahora), HISTORIAL_PARTICION), HISTORIAL_PARTICION)
+    cursor.execute("SELECT pg_get_serial_sequence('chat_history', 'id') AS secuencia")
+    secuencia = cursor.fetchone()["secuencia"]
+
+    cursor.execute("""
+        UPDATE chat_history SET timestamp = '-infinity' WHERE timestamp IS NULL;
+        ALTER TABLE chat_history ALTER COLUMN timestamp SET NOT NULL;
+        ALTER TABLE chat_history RENAME TO chat_history_legado;
+        ALTER INDEX IF EXISTS chat_history_pkey RENAME TO chat_history_legado_pkey;
+        ALTER INDEX IF EXISTS chat_history_sesion_fecha RENAME TO chat_history_legado_sesion_fecha;
+
+        CREATE TABLE chat_history (LIKE chat_history_legado INCLUDING DEFAULTS)
+            PARTITION BY RANGE (timestamp);
+        ALTER TABLE chat_history ADD PRIMARY KEY (id, timestamp);
+        CREATE INDEX chat_history_sesion_fecha ON chat_history (session_id, timestamp DESC);
+    """)
+    if secuencia:
+        # Si la secuencia siguiera perteneciendo a la partición, se borraría al archivarla
+        cursor.execute(f"ALTER SEQUENCE {secuencia} OWNED BY chat_history.id")
+    # La clave primaria de una partición tiene que ser la de la tabla padre (id, timestamp)
+    cursor.execute(
+        "SELECT conname FROM pg_constraint WHERE conrelid = 'chat_history_legado'::regclass AND contype = 'p'"
+    )
+    for fila in cursor.fetchall():
+        cursor.execute(f'ALTER TABLE chat_history_legado DROP CONSTRAINT "{fila["conname"]}"')
+    cursor.execute(
+        "ALTER TABLE chat_history ATTACH PARTITION chat_history_legado FOR VALUES FROM (MINVALUE) TO (%s)",
+        (limite,)
+    )
+
+    inicio = limite
+    for _ in range(HISTORIAL_PARTICIONES_ADELANTE):
+        fin = siguiente_periodo(inicio, HISTORIAL_PARTICION)
+        crear_particion(cursor, inicio, fin)
+        inicio = fin
+    cursor.execute(f"CREATE TABLE IF NOT EXISTS {PARTICION_DEFAULT} PARTITION OF chat_history DEFAULT")
+    logger.info(f"chat_history particionada; los mensajes hasta {limite:%Y-%m-%d} quedan en chat_history_legado")
+
+
+MIGRACIONES: List[Migracion] = [
+    Migracion(1, "indices_consultas", """
+        CREATE INDEX IF NOT EXISTS chat_history_sesion_fecha ON chat_history (session_id, timestamp DESC);
+        CREATE INDEX IF NOT EXISTS documentos_carrera_fecha ON documentos (id_carrera, fecha_upload DESC);
+        CREATE INDEX IF NOT EXISTS perfil_profesional_carrera ON perfil_profesional (id_carrera);
+    """),
+    Migracion(2, "triggers_catalogo", SQL_TRIGGERS),
+    # Los PDF ya vienen comprimidos; sin compresión, leer un rango no obliga a descomprimir todo el documento
+    Migracion(3, "documentos_sin_compresion", "ALTER TABLE documentos ALTER COLUMN contenido SET STORAGE EXTERNAL"),
+    Migracion(4, "chat_history_particionada", particionar_chat_history),
+    Migracion(5, "chat_history_archivo", f"""
+        CREATE TABLE IF NOT EXISTS {TABLA_ARCHIVO} (
+            session_id TEXT PRIMARY KEY,
+            inicio TIMESTAMP NOT NULL,
+            fin TIMESTAMP NOT NULL,
+            cantidad INTEGER NOT NULL,
+            mensajes JSONB NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS {TABLA_ARCHIVO}_fin ON {TABLA_ARCHIVO} (fin);
+    """),
+    # Resumen incremental por sesión (history_summary.py); pendiente es el último intercambio sin resumir
+    Migracion(6, "chat_resumen", """
+        CREATE TABLE IF NOT EXISTS chat_resumen (
+            session_id TEXT PRIMARY KEY,
+            resumen TEXT NOT NULL DEFAULT '',
+            pendiente JSONB,
+            intercambios INTEGER NOT NULL DEFAULT 0,
+            actualizado TIMESTAMP NOT NULL DEFAULT now()
+        );
+        CREATE INDEX IF NOT EXISTS chat_resumen_actualizado ON chat_resumen (actualizado);
+    """),
+    # Avance de history_relabel.py por versión del catálogo
+    Migracion(7, "chat_relabel", """
+        CREATE TABLE IF NOT EXISTS chat_relabel (
+            trabajo TEXT PRIMARY KEY,
+            ultima_sesion TEXT,
+            filas BIGINT NOT NULL DEFAULT 0,
+            corregidas BIGINT NOT NULL DEFAULT 0,
+            terminado TIMESTAMP,
+            actualizado TIMESTAMP NOT NULL DEFAULT now()
+        )
+    """),
+]
+
+
+def _preparar(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migraciones (
+            version INTEGER PRIMARY KEY,
+            nombre TEXT NOT NULL,
+            aplicada TIMESTAMP NOT NULL DEFAULT now()
+        )
+    """)
+
+
+def aplicadas(cursor) -> set:
+    cursor.execute("SELECT version FROM schema_migraciones")
+    return {fila["version"] for fila in cursor.fetchall()}
+
+
+def migrar() -> List[str]:
+    """Aplica las migraciones pendientes y devuelve sus nombres"""
+    conn = get_db_connection()
+    nuevas = []
+    try:
+        with conn, conn.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_xact_lock(%s)", (BLOQUEO_MIGRACIONES,))
+            _preparar(cursor)
+        for migracion in MIGRACIONES:
+            with conn, conn.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_xact_lock(%s)", (BLOQUEO_MIGRACIONES,))
+                if migracion.version in aplicadas(cursor):
+                    continue
+                logger.info(f"Aplicando migración {migracion.version}: {migracion.nombre}")
+                if callable(migracion.paso):
+                    migracion.paso(cursor)
+                else:
+                    cursor.execute(migracion.paso)
+                cursor.execute(
+                    "INSERT INTO schema_migraciones (version, nombre) VALUES (%s, %s)",
+                    (migracion.version, migracion.nombre)
+                )
+            nuevas.append(migracion.nombre)
+    finally:
+        conn.close()
+    return nuevas
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migraciones del esquema de la base de datos")
+    parser.add_argument("--estado", action="store_true", help="muestra las migraciones sin aplicar nada")
+    args = parser.parse_args()
+
+    if args.estado:
+        conn = get_db_connection()
+        try:
+            with conn, conn.cursor() as cursor:
+                _preparar(cursor)
+                hechas = aplicadas(cursor)
+        finally:
+            conn.close()
+        for migracion in MIGRACIONES:
+            print(f"{migracion.version:>3} {migracion.nombre:<30} {'aplicada' if migracion.version in hechas else 'pendiente'}")
+        return
+
+    nuevas = migrar()
+    print(f"Migraciones aplicadas: {', '.join(nuevas)}" if nuevas else "El esquema ya está al día")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,221 @@
+"""Construcción de prompts para Gemini con prefijo fijo precalculado y presupuesto de tokens."""
+import os
+import math
+import threading
+from collections import OrderedDict
+from typing import List, NamedTuple, Optional, Tuple
+
+from intenciones import formatear_horarios
+
+PROMPT_MAX_TOKENS = int(os.getenv("PROMPT_MAX_TOKENS", "3000"))
+PROMPT_MAX_TOKENS_PERFIL = int(os.getenv("PROMPT_MAX_TOKENS_PERFIL", "400"))
+PROMPT_MAX_TOKENS_RESUMEN = int(os.getenv("PROMPT_MAX_TOKENS_RESUMEN", "400"))
+PROMPT_MAX_TOKENS_DOCUMENTOS = int(os.getenv("PROMPT_MAX_TOKENS_DOCUMENTOS", "600"))
+# Aproximación para español con el tokenizador de Gemini
+PROMPT_CARACTERES_POR_TOKEN = float(os.getenv("PROMPT_CARACTERES_POR_TOKEN", "4"))
+PROMPT_MAX_BLOQUES = int(os.getenv("PROMPT_MAX_BLOQUES", "256"))
+# Por debajo de esto no vale la pena incluir un mensaje recortado del historial
+MIN_TOKENS_MENSAJE = 20
+FINAL = "\n\nUsuario: {mensaje}\nSara:"
+
+PERSONA_SARA = """
+Eres Sara, la asesora virtual de la Universidad Bolivariana del Ecuador. Tu estilo es profesional, cálido y detallado, brindando respuestas claras, precisas y acogedoras para que los usuarios se sientan escuchados y bien atendidos.
+
+Tu misión:
+
+Guiarlos con información relevante sobre carreras, beneficios y procesos de la universidad.
+
+Destacar las ventajas de estudiar en la UBE:
+
+Excelencia académica con profesores especializados.
+
+Infraestructura moderna y ambientes de aprendizaje óptimos.
+
+Oportunidades de prácticas y vinculación laboral.
+
+Formación integral con valores sociales y compromiso comunitario.
+
+Cuando pregunten por carreras:
+
+Proporciona un listado organizado (por áreas o facultades).
+
+Pregunta amablemente: "¿Te gustaría más detalles sobre alguna carrera en particular? Estoy aquí para ayudarte".
+
+Recuerda:
+
+Usa emojis para dar calidez y dinamismo (pero sin exceso).
+
+Evita presentarte a menos que sea necesario (ya conocen tu nombre y rol).
+
+Siempre agradece y motiva a seguir explorando la UBE.
+Recuerda siempre basate en información de Ecuador.
+Y finalle comentas los veneficios de la UBE.
+"""
+
+
+def estimar_tokens(texto: str) -> int:
+    return math.ceil(len(texto) / PROMPT_CARACTERES_POR_TOKEN)
+
+
+def recortar(texto: str, max_tokens: int) -> str:
+    """Recorta el texto al presupuesto de tokens, sin partir palabras"""
+    if estimar_tokens(texto) <= max_tokens:
+        return texto
+    corte = texto[:max(int(max_tokens * PROMPT_CARACTERES_POR_TOKEN) - 1, 0)]
+    if " " in corte:
+        corte = corte.rsplit(" ", 1)[0]
+    return corte.rstrip() + "…"
+
+
+class PromptConstruido(NamedTuple):
+    prefijo: str
+    contenido: str
+    tokens: int
+
+    @property
+    def texto(self) -> str:
+        return self.prefijo + self.contenido
+
+
+class PromptBuilder:
+    """Arma el prompt como prefijo fijo + historial + datos de la carrera + mensaje.
+
+    El prefijo (la persona de Sara) se calcula una vez y viaja separado del
+    resto para poder usar la caché de contexto de Gemini. El bloque de cada
+    carrera se arma una vez por versión de los datos del catálogo: se guarda
+    por identidad del dict que devuelve la caché del catálogo, así que al
+    invalidarse el catálogo llega un dict nuevo y el bloque se vuelve a armar.
+    El historial se incluye del mensaje más reciente al más antiguo mientras
+    quepa en `max_tokens`; si la conversación tiene resumen, va antes del
+    historial y el historial se limita a los últimos mensajes. Los extractos de
+    los documentos de la carrera van después de sus datos, hasta
+    `max_tokens_documentos`. Un mensaje del usuario que no cabe en lo que
+    queda se recorta, así el prompt nunca pasa de `max_tokens`.
+    """
+
+    def __init__(
+        self,
+        prefijo: str = PERSONA_SARA,
+        max_tokens: int = PROMPT_MAX_TOKENS,
+        max_tokens_perfil: int = PROMPT_MAX_TOKENS_PERFIL,
+        max_tokens_resumen: int = PROMPT_MAX_TOKENS_RESUMEN,
+        max_tokens_documentos: int = PROMPT_MAX_TOKENS_DOCUMENTOS,
+        max_bloques: int = PROMPT_MAX_BLOQUES
+    ):
+        self.prefijo = prefijo
+        self.tokens_prefijo = estimar_tokens(prefijo)
+        self.max_tokens = max_tokens
+        self.max_tokens_perfil = max_tokens_perfil
+        self.max_tokens_resumen = max_tokens_resumen
+        self.max_tokens_documentos = max_tokens_documentos
+        self.max_bloques = max_bloques
+        # id(db_data) -> (db_data, bloque, tokens); se guarda el dict para que el id no se reutilice
+        self._bloques: "OrderedDict[int, Tuple[dict, str, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _armar_bloque(self, db_data: dict) -> str:
+        horarios_info = ""
+        if db_data.get('horarios'):
+            horarios_info = "\n\nHorarios disponibles:\n" + formatear_horarios(db_data['horarios']) + "\n"
+
+        documentos_info = ""
+        if db_data.get('documentos'):
+            doc_names = [doc.nombre for doc in db_data['documentos']]
+            documentos_info = f"\n\nDocumentos disponibles: {', '.join(doc_names)}. Puedes hacer clic para descargarlos."
+
+        perfil = recortar(db_data.get('descripcion') or '', self.max_tokens_perfil)
+        return f"""\n\n\nInformación de la carrera {db_data.get('nombre', '')}:
+- Modalidad: {db_data.get('modalidad', '')}
+- Duración: {db_data.get('semestre', '')} semestres
+- Costos:
+  * Inscripción: ${db_data.get('inscripción', '')}
+  * PRE: ${db_data.get('pre', '')}
+  * Matrícula: ${db_data.get('matrícula', '')}
+  * Cuotas mensuales: ${db_data.get('cuotas_mensuales', '')}
+- Perfil profesional: {perfil}
+{horarios_info}
+{documentos_info}
+"""
+
+    def bloque_carrera(self, db_data: Optional[dict]) -> Tuple[str, int]:
+        """Texto con los datos de la carrera y su tamaño estimado en tokens"""
+        if db_data is None:
+            return "", 0
+        with self._lock:
+            entrada = self._bloques.get(id(db_data))
+            if entrada is not None and entrada[0] is db_data:
+                self._bloques.move_to_end(id(db_data))
+                return entrada[1], entrada[2]
+
+        bloque = self._armar_bloque(db_data)
+        tokens = estimar_tokens(bloque)
+        with self._lock:
+            self._bloques[id(db_data)] = (db_data, bloque, tokens)
+            self._bloques.move_to_end(id(db_data))
+            while len(self._bloques) > self.max_bloques:
+                self._bloques.popitem(last=False)
+        return bloque, tokens
+
+    def _historial(self, chat_history: List, presupuesto: int) -> str:
+        """Historial en orden cronológico con los mensajes más recientes que quepan"""
+        encabezado = "\n\nHistorial reciente de la conversación:\n"
+        presupuesto -= estimar_tokens(encabezado)
+        lineas = []
+        for msg in chat_history:
+            role = "Usuario" if msg.role == "user" else "Sara"
+            linea = f"{role}: {msg.content}\n"
+            tokens = estimar_tokens(linea)
+            if tokens > presupuesto:
+                if presupuesto >= MIN_TOKENS_MENSAJE:
+                    lineas.append(recortar(linea.rstrip("\n"), presupuesto) + "\n")
+                break
+            lineas.append(linea)
+            presupuesto -= tokens
+        if not lineas:
+            return ""
+        return encabezado + "".join(reversed(lineas))
+
+    def _extractos(self, fragmentos: List) -> str:
+        """Fragmentos de los documentos en orden de relevancia mientras quepan en su presupuesto"""
+        encabezado = "\n\nExtractos de los documentos de la carrera:\n"
+        presupuesto = self.max_tokens_documentos - estimar_tokens(encabezado)
+        lineas = []
+        for fragmento in fragmentos:
+            linea = f"- {fragmento.documento}: {fragmento.texto}\n"
+            tokens = estimar_tokens(linea)
+            if tokens > presupuesto:
+                if presupuesto >= MIN_TOKENS_MENSAJE:
+                    lineas.append(recortar(linea.rstrip("\n"), presupuesto) + "\n")
+                break
+            lineas.append(linea)
+            presupuesto -= tokens
+        if not lineas:
+            return ""
+        return encabezado + "".join(lineas)
+
+    def construir(
+        self,
+        user_message: str,
+        db_data: Optional[dict],
+        chat_history: Optional[List] = None,
+        resumen: Optional[str] = None,
+        fragmentos: Optional[List] = None
+    ) -> PromptConstruido:
+        """`chat_history` va del mensaje más reciente al más antiguo y no incluye el mensaje actual"""
+        bloque, tokens_bloque = self.bloque_carrera(db_data)
+        extractos = self._extractos(fragmentos) if fragmentos else ""
+        contexto = ""
+        if resumen:
+            contexto = f"\n\nResumen de la conversación hasta ahora:\n{recortar(resumen, self.max_tokens_resumen)}"
+
+        disponible = (
+            self.max_tokens - self.tokens_prefijo - tokens_bloque
+            - estimar_tokens(contexto) - estimar_tokens(extractos)
+        )
+        max_mensaje = disponible - estimar_tokens(FINAL.format(mensaje=""))
+        final = FINAL.format(mensaje=recortar(user_message, max(max_mensaje, MIN_TOKENS_MENSAJE)))
+        restante = disponible - estimar_tokens(final)
+        historial = self._historial(chat_history, restante) if chat_history else ""
+
+        contenido = f"{contexto}{historial}{bloque}{extractos}{final}"
+        return PromptConstruido(self.prefijo, contenido, self.tokens_prefijo + estimar_tokens(contenido))
@@ -0,0 +1,121 @@
+"""Preparación de las dependencias al iniciar y estado del proceso para /healthz y /readyz."""
+import os
+import time
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Segundos entre intentos de preparar una dependencia obligatoria que falló
+PRECALENTAR_REINTENTO = float(os.getenv("PRECALENTAR_REINTENTO", "5"))
+# Tiempo máximo de la verificación en vivo de cada dependencia en /readyz
+READYZ_TIMEOUT = float(os.getenv("READYZ_TIMEOUT", "1"))
+
+
+class Dependencia:
+    """Algo que el proceso necesita: cómo prepararlo, cómo verificar que sigue respondiendo y si es obligatorio"""
+
+    def __init__(
+        self,
+        nombre: str,
+        preparar: Callable[[], Awaitable],
+        verificar: Optional[Callable[[], Awaitable[bool]]] = None,
+        requerida: bool = True
+    ):
+        self.nombre = nombre
+        self.preparar = preparar
+        self.verificar = verificar
+        self.requerida = requerida
+        self.lista = False
+        self.error: Optional[str] = None
+        self.intentos = 0
+        self.duracion: Optional[float] = None
+
+
+class Readiness:
+    """Prepara las dependencias en segundo plano y dice si el proceso puede recibir tráfico.
+
+    Al iniciar, cada dependencia se prepara una vez y en paralelo (abrir
+    conexiones, recorrer el detector, abrir la conexión TLS con Gemini) para
+    que la primera petición no pague esa inicialización. Las obligatorias que
+    fallan se reintentan hasta que funcionan; las opcionales se informan pero
+    no impiden recibir tráfico. Ya preparadas, /readyz las verifica en vivo.
+    """
+
+    def __init__(self, reintento: float = PRECALENTAR_REINTENTO, timeout: float = READYZ_TIMEOUT):
+        self.reintento = reintento
+        self.timeout = timeout
+        self.dependencias: Dict[str, Dependencia] = {}
+        self.inicio = time.monotonic()
+        self.preparado_en: Optional[float] = None
+
+    def registrar(
+        self,
+        nombre: str,
+        preparar: Callable[[], Awaitable],
+        verificar: Optional[Callable[[], Awaitable[bool]]] = None,
+        requerida: bool = True
+    ):
+        self.dependencias[nombre] = Dependencia(nombre, preparar, verificar, requerida)
+
+    async def _preparar(self, dependencia: Dependencia):
+        while True:
+            dependencia.intentos += 1
+            inicio = time.perf_counter()
+            try:
+                await dependencia.preparar()
+            except Exception as e:
+                dependencia.error = str(e)
+                logger.error(f"No se pudo preparar {dependencia.nombre} (intento {dependencia.intentos}): {str(e)}")
+                if not dependencia.requerida:
+                    return
+                await asyncio.sleep(self.reintento)
+                continue
+            dependencia.duracion = time.perf_counter() - inicio
+            dependencia.lista = True
+            dependencia.error = None
+            logger.info(f"{dependencia.nombre} preparada en {dependencia.duracion * 1000:.0f} ms")
+            return
+
+    async def preparar(self):
+        """Prepara todas las dependencias registradas; termina cuando las obligatorias están listas"""
+        self.inicio = time.monotonic()
+        self.preparado_en = None
+        await asyncio.gather(*(self._preparar(d) for d in self.dependencias.values()))
+        self.preparado_en = time.monotonic() - self.inicio
+        logger.info(f"Dependencias preparadas en {self.preparado_en:.2f} s")
+
+    async def _verificar(self, dependencia: Dependencia) -> dict:
+        lista, error = dependencia.lista, dependencia.error
+        if lista and dependencia.verificar is not None:
+            try:
+                lista = await asyncio.wait_for(dependencia.verificar(), self.timeout)
+                error = None if lista else "la verificación falló"
+            except asyncio.TimeoutError:
+                lista, error = False, f"sin respuesta en {self.timeout} s"
+            except Exception as e:
+                lista, error = False, str(e)
+        return {
+            "lista": lista,
+            "requerida": dependencia.requerida,
+            "error": error,
+            "intentos": dependencia.intentos,
+            "preparacion_ms": round(dependencia.duracion * 1000, 1) if dependencia.duracion is not None else None
+        }
+
+    async def comprobar(self) -> dict:
+        """Estado de cada dependencia; el proceso está listo si lo están todas las obligatorias"""
+        dependencias = list(self.dependencias.values())
+        estados = await asyncio.gather(*(self._verificar(d) for d in dependencias))
+        return {
+            "listo": all(e["lista"] for e in estados if e["requerida"]),
+            "dependencias": {d.nombre: e for d, e in zip(dependencias, estados)}
+        }
+
+    def estadisticas(self) -> dict:
+        """Estado de la última preparación, sin verificar nada (para las métricas)"""
+        return {
+            "preparado_en": self.preparado_en,
+            "dependencias": {nombre: d.lista for nombre, d in self.dependencias.items()}
+        }
@@ -0,0 +1,157 @@
+"""Caché de respuestas de Gemini con LRU, expiración y persistencia opcional en disco."""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, List, Optional, Tuple
+
+from detector_carreras import normalizar
+
+logger = logging.getLogger(__name__)
+
+RESPUESTAS_CACHE_MAX = int(os.getenv("RESPUESTAS_CACHE_MAX", "2048"))
+RESPUESTAS_CACHE_TTL = float(os.getenv("RESPUESTAS_CACHE_TTL", "21600"))
+# Archivo SQLite donde persistir la caché; vacío para mantenerla solo en memoria
+RESPUESTAS_CACHE_ARCHIVO = os.getenv("RESPUESTAS_CACHE_ARCHIVO", "")
+RESPUESTAS_CACHE_CON_HISTORIAL = os.getenv("RESPUESTAS_CACHE_CON_HISTORIAL", "1") == "1"
+
+
+def digest(valor: Any) -> str:
+    """Huella estable de cualquier valor serializable a JSON"""
+    texto = json.dumps(valor, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(texto.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Respuestas de Gemini por pregunta normalizada, carrera y datos del catálogo.
+
+    La clave incluye una huella de los datos de la carrera que van en el prompt,
+    así que cualquier cambio del catálogo produce claves nuevas y las respuestas
+    viejas simplemente dejan de usarse hasta expirar o ser desalojadas.
+    """
+
+    def __init__(
+        self,
+        max_entradas: int = RESPUESTAS_CACHE_MAX,
+        ttl: float = RESPUESTAS_CACHE_TTL,
+        archivo: str = RESPUESTAS_CACHE_ARCHIVO,
+        con_historial: bool = RESPUESTAS_CACHE_CON_HISTORIAL
+    ):
+        self.max_entradas = max_entradas
+        self.ttl = ttl
+        self.con_historial = con_historial
+        # clave -> (expira_en, respuesta, latencia_original)
+        self._entradas: "OrderedDict[str, Tuple[float, str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.desalojos = 0
+        self.expiraciones = 0
+        self.latencia_ahorrada = 0.0
+        self._db: Optional[sqlite3.Connection] = None
+        if archivo:
+            self._abrir_archivo(archivo)
+
+    def clave(
+        self,
+        mensaje: str,
+        carrera: Optional[str],
+        datos_catalogo: Any,
+        historial: Optional[List[Tuple[str, str]]] = None,
+        documentos: Optional[List[str]] = None
+    ) -> str:
+        partes = [normalizar(mensaje), carrera or "", digest(datos_catalogo)]
+        if self.con_historial:
+            partes.append(digest(historial or []))
+        if documentos:
+            # Los extractos dependen del índice de documentos vigente
+            partes.append(digest(documentos))
+        return hashlib.sha256("\x1f".join(partes).encode("utf-8")).hexdigest()
+
+    def obtener(self, clave: str) -> Optional[str]:
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None:
+                self.misses += 1
+                return None
+            if entrada[0] <= time.time():
+                del self._entradas[clave]
+                self.expiraciones += 1
+                self.misses += 1
+                return None
+            self._entradas.move_to_end(clave)
+            self.hits += 1
+            self.latencia_ahorrada += entrada[2]
+            return entrada[1]
+
+    def guardar(self, clave: str, respuesta: str, latencia: float):
+        expira = time.time() + self.ttl
+        desalojadas = []
+        with self._lock:
+            self._entradas[clave] = (expira, respuesta, latencia)
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.max_entradas:
+                vieja, _ = self._entradas.popitem(last=False)
+                desalojadas.append(vieja)
+                self.desalojos += 1
+
+            if self._db is not None:
+                try:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO respuestas (clave, expira, respuesta, latencia) VALUES (?, ?, ?, ?)",
+                        (clave, expira, respuesta, latencia)
+                    )
+                    self._db.executemany("DELETE FROM respuestas WHERE clave = ?", [(c,) for c in desalojadas])
+                    self._db.commit()
+                except sqlite3.Error as e:
+                    logger.error(f"No se pudo persistir la caché de respuestas: {str(e)}")
+
+    def estadisticas(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entradas": len(self._entradas),
+                "max_entradas": self.max_entradas,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+                "desalojos": self.desalojos,
+                "expiraciones": self.expiraciones,
+                "latencia_ahorrada_s": round(self.latencia_ahorrada, 3),
+                "persistente": self._db is not None
+            }
+
+    def _abrir_archivo(self, archivo: str):
+        try:
+            self._db = sqlite3.connect(archivo, check_same_thread=False)
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS respuestas (
+                    clave TEXT PRIMARY KEY,
+                    expira REAL NOT NULL,
+                    respuesta TEXT NOT NULL,
+                    latencia REAL NOT NULL
+                )
+            """)
+            self._db.execute("DELETE FROM respuestas WHERE expira <= ?", (time.time(),))
+            self._db.commit()
+            filas = self._db.execute(
+                "SELECT clave, expira, respuesta, latencia FROM respuestas ORDER BY expira DESC LIMIT ?",
+                (self.max_entradas,)
+            ).fetchall()
+            # Las que expiran antes se cargan primero para que sean las primeras en desalojarse
+            for clave, expira, respuesta, latencia in reversed(filas):
+                self._entradas[clave] = (expira, respuesta, latencia)
+            logger.info(f"Caché de respuestas cargada desde {archivo}: {len(filas)} entradas")
+        except sqlite3.Error as e:
+            logger.error(f"No se pudo abrir la caché de respuestas en {archivo}: {str(e)}")
+            self._db = None
+
+    def cerrar(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
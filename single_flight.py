@@ -0,0 +1,131 @@
+"""Agrupa operaciones idénticas en curso para que compartan una sola ejecución (single-flight)."""
+import asyncio
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, List, Optional
+
+from metrics import registro
+
+SINGLE_FLIGHT_LLAMADAS = registro.contador(
+    "chatbot_single_flight_llamadas_total",
+    "Operaciones por grupo: 'lider' las ejecuta, 'colapsada' reutiliza una en curso",
+    ("operacion", "resultado")
+)
+
+
+class _Difusion:
+    """Fragmentos de un stream en curso, para todos los que lo leen"""
+
+    def __init__(self):
+        self.fragmentos: List[Any] = []
+        self.terminado = False
+        self.error: Optional[BaseException] = None
+        self.lectores = 0
+        self.condicion = asyncio.Condition()
+        self.tarea: Optional[asyncio.Task] = None
+
+
+class SingleFlight:
+    """Ejecuta una sola vez cada clave mientras esté en curso y reparte el resultado.
+
+    `ejecutar` corre la operación en la corrutina del primero que llega (el
+    líder), así que usa su contexto (por ejemplo, su conexión de base de
+    datos); los demás esperan el mismo resultado o la misma excepción. Si el
+    líder se cancela, uno de los que esperaban la vuelve a ejecutar.
+
+    `transmitir` hace lo mismo con streams: una tarea consume la fuente y
+    cada lector recibe todos los fragmentos, también los emitidos antes de
+    unirse. La tarea se cancela cuando no queda ningún lector.
+    """
+
+    def __init__(self, nombre: str):
+        self.nombre = nombre
+        self._en_curso: Dict[Hashable, asyncio.Future] = {}
+        self._streams: Dict[Hashable, _Difusion] = {}
+
+    async def ejecutar(self, clave: Hashable, funcion: Callable[[], Awaitable[Any]]) -> Any:
+        while True:
+            futuro = self._en_curso.get(clave)
+            if futuro is None:
+                break
+            SINGLE_FLIGHT_LLAMADAS.inc(operacion=self.nombre, resultado="colapsada")
+            try:
+                return await asyncio.shield(futuro)
+            except asyncio.CancelledError:
+                # El líder se canceló; si fue este lector, la cancelación sigue su curso
+                if not futuro.cancelled():
+                    raise
+
+        futuro = asyncio.get_running_loop().create_future()
+        self._en_curso[clave] = futuro
+        SINGLE_FLIGHT_LLAMADAS.inc(operacion=self.nombre, resultado="lider")
+        try:
+            resultado = await funcion()
+        except asyncio.CancelledError:
+            futuro.cancel()
+            raise
+        except BaseException as e:
+            futuro.set_exception(e)
+            # Evita el aviso de excepción no recuperada cuando nadie más esperaba
+            futuro.exception()
+            raise
+        else:
+            futuro.set_result(resultado)
+            return resultado
+        finally:
+            del self._en_curso[clave]
+
+    async def transmitir(self, clave: Hashable, funcion: Callable[[], AsyncIterator[Any]]) -> AsyncIterator[Any]:
+        difusion = self._streams.get(clave)
+        if difusion is None:
+            difusion = self._streams[clave] = _Difusion()
+            difusion.tarea = asyncio.create_task(self._producir(clave, difusion, funcion))
+            SINGLE_FLIGHT_LLAMADAS.inc(operacion=self.nombre, resultado="lider")
+        else:
+            SINGLE_FLIGHT_LLAMADAS.inc(operacion=self.nombre, resultado="colapsada")
+
+        difusion.lectores += 1
+        leidos = 0
+        try:
+            while True:
+                async with difusion.condicion:
+                    await difusion.condicion.wait_for(
+                        lambda: leidos < len(difusion.fragmentos) or difusion.terminado
+                    )
+                    nuevos = difusion.fragmentos[leidos:]
+                leidos += len(nuevos)
+                for fragmento in nuevos:
+                    yield fragmento
+                if not nuevos and difusion.terminado:
+                    if difusion.error is not None:
+                        raise difusion.error
+                    return
+        finally:
+            difusion.lectores -= 1
+            if difusion.lectores == 0 and not difusion.terminado:
+                if self._streams.get(clave) is difusion:
+                    del self._streams[clave]
+                difusion.tarea.cancel()
+
+    async def _producir(self, clave: Hashable, difusion: _Difusion, funcion: Callable[[], AsyncIterator[Any]]):
+        fuente = funcion()
+        try:
+            try:
+                async for fragmento in fuente:
+                    async with difusion.condicion:
+                        difusion.fragmentos.append(fragmento)
+                        difusion.condicion.notify_all()
+            finally:
+                await fuente.aclose()
+        except asyncio.CancelledError:
+            difusion.error = asyncio.CancelledError()
+        except Exception as e:
+            difusion.error = e
+        finally:
+            # Los que lleguen desde ahora inician otra ejecución
+            if self._streams.get(clave) is difusion:
+                del self._streams[clave]
+            async with difusion.condicion:
+                difusion.terminado = True
+                difusion.condicion.notify_all()
+
+    def en_curso(self) -> int:
+        return len(self._en_curso) + len(self._streams)
@@ -0,0 +1,5 @@
+import os
+import tempfile
+
+# Los módulos compilan el snapshot del catálogo al importarse; en las pruebas va a un directorio temporal
+os.environ.setdefault("UBE_DIRECTORIO_DATOS", tempfile.mkdtemp(prefix="ube-pruebas-"))
@@ -0,0 +1,58 @@
+import json
+from datetime import datetime
+
+from catalogo_indice import IndiceCatalogo
+
+
+class CursorFalso:
+    """Devuelve las filas según la tabla de la consulta"""
+
+    def __init__(self, carreras, documentos):
+        self.tablas = {"FROM carrera": carreras, "FROM documentos": documentos}
+        self.filas = []
+
+    def execute(self, consulta, parametros=None):
+        self.filas = next(filas for tabla, filas in self.tablas.items() if tabla in consulta)
+
+    def fetchall(self):
+        return self.filas
+
+
+class SnapshotFalso:
+    version = "v1"
+
+    def horarios_de(self, nombre):
+        return {}
+
+
+class CatalogoFalso:
+    actual = SnapshotFalso()
+
+
+class CacheFalsa:
+    version = 1
+
+
+CARRERA = {
+    "id_carrera": 1, "nombre": "Derecho", "modalidad": "Presencial", "semestre": 8,
+    "inscripcion": 50, "pre": 100, "matricula": 200, "cuotas_mensuales": 150, "descripcion": "Abogado"
+}
+
+
+def test_documento_sin_fecha_upload():
+    documentos = [
+        {"id": 1, "id_carrera": 1, "nombre": "Malla", "fecha_upload": datetime(2026, 1, 5), "tamano": 10},
+        {"id": 2, "id_carrera": 1, "nombre": "Sin fecha", "fecha_upload": None, "tamano": 20},
+    ]
+    indice = IndiceCatalogo(CacheFalsa(), CatalogoFalso())
+    indice.construir(CursorFalso([CARRERA], documentos))
+
+    assert indice.vigente()
+    recurso = indice.carrera(1)
+    datos = json.loads(recurso.cuerpo)
+    assert [d["fecha_upload"] for d in datos["documentos"]] == ["2026-01-05T00:00:00", None]
+
+    # El ETag depende solo de los datos
+    otro = IndiceCatalogo(CacheFalsa(), CatalogoFalso())
+    otro.construir(CursorFalso([CARRERA], documentos))
+    assert otro.carrera(1).etag == recurso.etag
@@ -0,0 +1,63 @@
+import os
+import json
+
+import pytest
+
+from catalogo_snapshot import CatalogoCompartido, Snapshot, compilar, fuentes_modulos, version_de
+
+
+@pytest.fixture
+def fuentes():
+    return json.loads(json.dumps(fuentes_modulos()))
+
+
+def test_compila_en_un_directorio_propio(tmp_path, fuentes):
+    ruta = tmp_path / "datos" / "catalogo.snap"
+    catalogo = CatalogoCompartido(str(ruta), intervalo=0)
+    assert catalogo.actual.version == version_de(fuentes)
+    assert os.stat(ruta.parent).st_mode & 0o777 == 0o700
+
+
+def test_rechaza_snapshot_que_otros_pueden_escribir(tmp_path):
+    ruta = tmp_path / "catalogo.snap"
+    compilar(str(ruta))
+    os.chmod(ruta, 0o666)
+    with pytest.raises(ValueError):
+        Snapshot.abrir(str(ruta))
+    # Al iniciar se reemplaza por uno compilado por el proceso
+    catalogo = CatalogoCompartido(str(ruta), intervalo=0)
+    assert os.stat(ruta).st_mode & 0o022 == 0
+    assert catalogo.actual.origen == "data"
+
+
+@pytest.mark.skipif(not hasattr(os, "getuid") or os.getuid() != 0, reason="cambiar el dueño requiere root")
+def test_rechaza_snapshot_de_otro_usuario(tmp_path):
+    ruta = tmp_path / "catalogo.snap"
+    compilar(str(ruta))
+    os.chown(ruta, 65534, 65534)
+    with pytest.raises(ValueError):
+        Snapshot.abrir(str(ruta))
+
+
+def test_snapshot_de_json_se_compila_si_el_json_cambia(tmp_path, fuentes):
+    fuente = tmp_path / "catalogo.json"
+    ruta = tmp_path / "catalogo.snap"
+    fuente.write_text(json.dumps(fuentes), encoding="utf-8")
+    compilar(str(ruta), fuentes, str(fuente))
+
+    fuentes["carreras"].append("Carrera Nueva")
+    fuente.write_text(json.dumps(fuentes), encoding="utf-8")
+    catalogo = CatalogoCompartido(str(ruta), intervalo=0)
+    assert catalogo.actual.origen == str(fuente)
+    assert "Carrera Nueva" in catalogo.carreras
+
+
+def test_snapshot_de_json_sin_json_vuelve_a_data(tmp_path, fuentes):
+    fuente = tmp_path / "catalogo.json"
+    ruta = tmp_path / "catalogo.snap"
+    fuentes["carreras"].append("Carrera Nueva")
+    compilar(str(ruta), fuentes, str(fuente))
+
+    catalogo = CatalogoCompartido(str(ruta), intervalo=0)
+    assert catalogo.actual.origen == "data"
+    assert "Carrera Nueva" not in catalogo.carreras
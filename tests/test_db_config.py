@@ -0,0 +1,52 @@
+import psycopg2
+
+from db_config import DatabasePool
+
+
+class ConexionFalsa:
+    def __init__(self, closed=0, error=None):
+        self.closed = closed
+        self.error = error
+
+    def rollback(self):
+        if self.error:
+            raise self.error
+
+
+class PoolFalso:
+    def __init__(self):
+        self.devueltas = []
+
+    def putconn(self, conn, close=False):
+        self.devueltas.append((conn, close))
+
+
+def _pool_con_una_en_uso():
+    db_pool = DatabasePool(minconn=1, maxconn=1)
+    db_pool._pool = PoolFalso()
+    db_pool._disponibles.acquire()
+    db_pool._en_uso = 1
+    return db_pool
+
+
+def test_liberar_descarta_la_conexion_si_falla_el_rollback():
+    db_pool = _pool_con_una_en_uso()
+    conn = ConexionFalsa(error=psycopg2.InterfaceError("connection already closed"))
+    db_pool.liberar(conn)
+    assert db_pool._pool.devueltas == [(conn, True)]
+    assert db_pool._en_uso == 0
+    assert db_pool._disponibles.acquire(blocking=False)
+
+
+def test_liberar_cierra_la_conexion_cerrada():
+    db_pool = _pool_con_una_en_uso()
+    conn = ConexionFalsa(closed=2)
+    db_pool.liberar(conn)
+    assert db_pool._pool.devueltas == [(conn, True)]
+
+
+def test_liberar_devuelve_la_conexion_sana():
+    db_pool = _pool_con_una_en_uso()
+    conn = ConexionFalsa()
+    db_pool.liberar(conn)
+    assert db_pool._pool.devueltas == [(conn, False)]
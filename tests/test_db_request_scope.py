@@ -0,0 +1,99 @@
+import asyncio
+import threading
+
+import api
+
+
+class CursorFalso:
+    def close(self):
+        pass
+
+
+class ConexionFalsa:
+    def cursor(self):
+        return CursorFalso()
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+class PoolFalso:
+    def __init__(self):
+        self.obtenidas = []
+        self.liberadas = []
+
+    def obtener(self, timeout=None):
+        conn = ConexionFalsa()
+        self.obtenidas.append(conn)
+        return conn
+
+    def liberar(self, conn):
+        self.liberadas.append(conn)
+
+
+def test_la_conexion_vuelve_al_pool_cuando_termina_el_hilo(monkeypatch):
+    pool = PoolFalso()
+    monkeypatch.setattr(api, "db_pool", pool)
+    entro, seguir = threading.Event(), threading.Event()
+
+    def consulta():
+        with api.get_db_cursor():
+            entro.set()
+            seguir.wait(5)
+
+    async def escenario():
+        async with api.db_request_scope():
+            tarea = asyncio.create_task(api.run_db(consulta))
+            await asyncio.to_thread(entro.wait, 5)
+        # El ámbito terminó (como al cancelarse la petición) con la consulta en curso
+        assert pool.liberadas == []
+        seguir.set()
+        await tarea
+
+    asyncio.run(escenario())
+    assert len(pool.obtenidas) == 1
+    assert pool.liberadas == pool.obtenidas
+
+
+def test_consulta_despues_del_ambito_usa_su_propia_conexion(monkeypatch):
+    pool = PoolFalso()
+    monkeypatch.setattr(api, "db_pool", pool)
+    seguir = threading.Event()
+
+    def consulta():
+        seguir.wait(5)
+        with api.get_db_cursor():
+            pass
+
+    async def escenario():
+        async with api.db_request_scope():
+            tarea = asyncio.create_task(api.run_db(consulta))
+            await asyncio.sleep(0)
+        seguir.set()
+        await tarea
+
+    asyncio.run(escenario())
+    assert len(pool.obtenidas) == 1
+    assert pool.liberadas == pool.obtenidas
+
+
+def test_consultas_del_ambito_comparten_la_conexion(monkeypatch):
+    pool = PoolFalso()
+    monkeypatch.setattr(api, "db_pool", pool)
+
+    def consulta():
+        with api.get_db_cursor():
+            pass
+
+    async def escenario():
+        async with api.db_request_scope():
+            await api.run_db(consulta)
+            await api.run_db(consulta)
+            assert pool.liberadas == []
+
+    asyncio.run(escenario())
+    assert len(pool.obtenidas) == 1
+    assert pool.liberadas == pool.obtenidas
@@ -0,0 +1,37 @@
+import pytest
+
+from detector_carreras import IndiceNgramas, DetectorCarreras, correccion_plausible
+
+
+@pytest.fixture(scope="module")
+def detector():
+    return DetectorCarreras()
+
+
+@pytest.mark.parametrize("mensaje, carrera", [
+    ("quiero estudiar odontolojia", "odontología"),
+    ("precio de fisioterpia", "licenciatura en fisioterapia"),
+    ("ingenieria electrca de noche", "ingeniería eléctrica"),
+    ("sicologia", "licenciatura en psicología"),
+])
+def test_corrige_faltas_de_ortografia(detector, mensaje, carrera):
+    assert detector.detectar(mensaje).carrera == carrera
+
+
+def test_ecosistema_no_es_sistemas(detector):
+    # "sistema" está contenida en "ecosistema": no es una falta de ortografía
+    assert detector.detectar("información sobre el ecosistema universitario").carrera is None
+    assert detector.classify_many(["información sobre el ecosistema universitario"])[0].carrera is None
+
+
+def test_correccion_plausible():
+    assert correccion_plausible("odontolojia", "odontologia")
+    assert not correccion_plausible("ecosistema", "sistema")
+    assert not correccion_plausible("sistemas", "sistema")
+    assert not correccion_plausible("medicina", "edicina")
+    assert not correccion_plausible("administracionales", "administracion")
+
+
+def test_indice_no_corrige_palabras_que_contienen_la_del_catalogo():
+    indice = IndiceNgramas(["sistemas", "sistema", "derecho"])
+    assert indice.corregir(["ecosistema", "derecjo"]) == {"derecjo": ("derecho", 0.86)}
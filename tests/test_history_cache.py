@@ -0,0 +1,34 @@
+from history_cache import HistoryCache
+
+
+def test_carga_vieja_no_pisa_una_mas_nueva():
+    cache = HistoryCache(capacidad=5)
+    vieja = cache.iniciar_carga("s1")
+    nueva = cache.iniciar_carga("s1")
+    cache.completar_carga("s1", nueva, ["b", "a"])
+    # La lectura lenta termina después con datos anteriores
+    cache.completar_carga("s1", vieja, ["a"])
+    assert cache.leer("s1", 5) == ["b", "a"]
+
+
+def test_mensaje_durante_la_carga_la_descarta():
+    cache = HistoryCache(capacidad=5)
+    generacion = cache.iniciar_carga("s1")
+    cache.agregar("s1", "c")
+    cache.completar_carga("s1", generacion, ["b", "a"])
+    assert cache.leer("s1", 5) is None
+    # La siguiente carga empieza después del mensaje y se guarda
+    generacion = cache.iniciar_carga("s1")
+    cache.completar_carga("s1", generacion, ["c", "b", "a"])
+    assert cache.leer("s1", 5) == ["c", "b", "a"]
+
+
+def test_carga_cancelada_no_deja_estado():
+    cache = HistoryCache(capacidad=5)
+    cache.iniciar_carga("s1")
+    cache.cancelar_carga("s1")
+    assert cache._cargas == {}
+    generacion = cache.iniciar_carga("s1")
+    cache.completar_carga("s1", generacion, ["a"])
+    assert cache.leer("s1", 5) == ["a"]
+    assert cache._cargas == {}
@@ -0,0 +1,71 @@
+import uuid
+from datetime import datetime
+
+import psycopg2
+import pytest
+
+import history_partitions
+from db_config import db_pool
+from history_partitions import HistoryPartitions, Particion, TABLA_ARCHIVO, crear_particion, esta_particionada
+
+# Un rango lejano que no usa ningún mensaje real
+INICIO = datetime(2200, 1, 1)
+FIN = datetime(2200, 2, 1)
+PARTICION = Particion(history_partitions.nombre_particion(INICIO), INICIO, FIN)
+
+
+@pytest.fixture
+def conn():
+    try:
+        conn = db_pool.obtener(timeout=2)
+    except (ConnectionError, psycopg2.Error) as e:
+        pytest.skip(f"Sin base de datos: {e}")
+    try:
+        with conn, conn.cursor() as cursor:
+            if not esta_particionada(cursor):
+                pytest.skip("chat_history no está particionada")
+        yield conn
+    finally:
+        with conn, conn.cursor() as cursor:
+            cursor.execute(f"DROP VIEW IF EXISTS {PARTICION.nombre}_vista")
+            cursor.execute(f"DROP TABLE IF EXISTS {PARTICION.nombre}")
+        db_pool.liberar(conn)
+
+
+def test_drop_fallido_no_duplica_el_archivo(conn, monkeypatch):
+    session_id = f"test-{uuid.uuid4()}"
+    with conn, conn.cursor() as cursor:
+        crear_particion(cursor, INICIO, FIN)
+        cursor.executemany(
+            "INSERT INTO chat_history (session_id, role, content, timestamp) VALUES (%s, 'user', %s, %s)",
+            [(session_id, f"mensaje {i}", INICIO.replace(day=i + 1)) for i in range(3)]
+        )
+        # La vista hace fallar el DROP TABLE de la partición
+        cursor.execute(f"CREATE VIEW {PARTICION.nombre}_vista AS SELECT * FROM {PARTICION.nombre}")
+
+    # Solo se mantiene la partición de prueba
+    monkeypatch.setattr(history_partitions, "particiones", lambda cursor: [PARTICION])
+    monkeypatch.setattr(HistoryPartitions, "crear_siguientes", lambda self, cursor, ahora: [])
+    mantenimiento = HistoryPartitions(archivar_dias=0, retencion_dias=0, directorio="")
+    ahora = datetime(2200, 3, 1)
+
+    resumen = mantenimiento.mantener(ahora)
+    assert resumen["archivadas"] == []
+    assert mantenimiento.errores == 1
+    with conn, conn.cursor() as cursor:
+        cursor.execute(f"SELECT count(*) AS filas FROM {TABLA_ARCHIVO} WHERE session_id = %s", (session_id,))
+        assert cursor.fetchone()["filas"] == 0
+        cursor.execute(f"DROP VIEW {PARTICION.nombre}_vista")
+
+    resumen = mantenimiento.mantener(ahora)
+    assert resumen["archivadas"] == [PARTICION.nombre]
+    try:
+        with conn, conn.cursor() as cursor:
+            cursor.execute(
+                f"SELECT cantidad, jsonb_array_length(mensajes) AS mensajes FROM {TABLA_ARCHIVO} WHERE session_id = %s",
+                (session_id,)
+            )
+            assert cursor.fetchone() == {"cantidad": 3, "mensajes": 3}
+    finally:
+        with conn, conn.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {TABLA_ARCHIVO} WHERE session_id = %s", (session_id,))
@@ -0,0 +1,67 @@
+import asyncio
+
+import psycopg2
+
+from history_writer import HistoryWriter
+
+
+def _escritor(monkeypatch, insertar):
+    monkeypatch.setattr(HistoryWriter, "_insertar", staticmethod(insertar))
+    return HistoryWriter(max_lote=8, intervalo=0.01, reintentos=2)
+
+
+def test_mensaje_invalido_no_detiene_la_cola(monkeypatch):
+    guardados = []
+
+    def insertar(lote):
+        # Como psycopg2 con un NUL en el texto: falla el lote entero
+        if any("\x00" in m.content for m in lote):
+            raise ValueError("A string literal cannot contain NUL (0x00) characters.")
+        guardados.extend(lote)
+
+    escritor = _escritor(monkeypatch, insertar)
+
+    async def escenario():
+        escritor.iniciar()
+        for i in range(5):
+            await escritor.encolar("s1", "user", f"mensaje {i}")
+        await escritor.encolar("s1", "user", "con \x00 adentro")
+        await escritor._cola.join()
+        # Los lotes siguientes se siguen escribiendo
+        for i in range(3):
+            await escritor.encolar("s2", "user", f"después {i}")
+        await escritor.detener(timeout=5)
+
+    asyncio.run(escenario())
+
+    assert [m.content for m in guardados if m.session_id == "s1"] == [f"mensaje {i}" for i in range(5)]
+    assert [m.content for m in guardados if m.session_id == "s2"] == [f"después {i}" for i in range(3)]
+    estadisticas = escritor.estadisticas()
+    assert estadisticas["descartados"] == 1
+    assert estadisticas["escritos"] == 8
+    assert estadisticas["pendientes"] == 0
+
+
+def test_error_de_conexion_se_reintenta_con_limite(monkeypatch):
+    intentos = []
+
+    def insertar(lote):
+        intentos.append(len(lote))
+        raise psycopg2.OperationalError("server closed the connection unexpectedly")
+
+    escritor = _escritor(monkeypatch, insertar)
+
+    async def sin_espera(_):
+        pass
+
+    async def escenario():
+        escritor.iniciar()
+        monkeypatch.setattr(asyncio, "sleep", sin_espera)
+        await escritor.encolar("s1", "user", "hola")
+        await escritor.detener(timeout=5)
+
+    asyncio.run(escenario())
+
+    assert len(intentos) == 3
+    assert escritor.estadisticas()["descartados"] == 1
+    assert escritor.estadisticas()["pendientes"] == 0
@@ -0,0 +1,26 @@
+from collections import namedtuple
+
+from prompt_builder import PromptBuilder, estimar_tokens
+
+Mensaje = namedtuple("Mensaje", "role content")
+
+DB_DATA = {"nombre": "Derecho", "modalidad": "Presencial", "semestre": 8, "descripcion": "Abogado " * 50}
+
+
+def test_mensaje_largo_se_recorta_al_presupuesto():
+    builder = PromptBuilder(max_tokens=1200)
+    mensaje = "quiero saber " * 2000
+    prompt = builder.construir(mensaje, DB_DATA, [Mensaje("user", "hola"), Mensaje("assistant", "¡Hola!")])
+    assert prompt.tokens <= 1200
+    assert estimar_tokens(prompt.texto) <= 1200
+    assert prompt.contenido.endswith("…\nSara:")
+    # Los datos de la carrera se conservan; lo que no cabe es el mensaje
+    assert "Información de la carrera Derecho" in prompt.contenido
+
+
+def test_mensaje_corto_no_cambia():
+    builder = PromptBuilder(max_tokens=1200)
+    prompt = builder.construir("cuánto cuesta derecho", DB_DATA, [Mensaje("user", "hola")])
+    assert prompt.contenido.endswith("\n\nUsuario: cuánto cuesta derecho\nSara:")
+    assert "Usuario: hola" in prompt.contenido
+    assert prompt.tokens <= 1200
@@ -16,6 +16,7 @@ const Chat = () => {
   ]);
   const [inputText, setInputText] = useState("");
   const [isTyping, setIsTyping] = useState(false);
+  const [sessionId, setSessionId] = useState(null);
   const [showRegistro, setShowRegistro] = useState(false);
   const messagesEndRef = useRef(null);
 
@@ -42,27 +43,70 @@ const Chat = () => {
     setIsTyping(true);
 
     try {
-      const response = await fetch("http://localhost:5000/chat", {
+      const response = await fetch("http://localhost:5000/chat/stream", {
         method: "POST",
         headers: {
           "Content-Type": "application/json",
         },
-        body: JSON.stringify({ message: inputText }),
+        body: JSON.stringify({ message: inputText, session_id: sessionId }),
       });
 
       if (!response.ok) throw new Error(`Error: ${response.status}`);
 
-      const data = await response.json();
-      console.log("Respuesta completa del backend:", data);
-      
-      const newBotMessage = { 
-        text: data.response, 
-        sender: "bot", 
-        timestamp: new Date(),
-        documentos: data.documentos
+      const botTimestamp = new Date();
+      let documentos = null;
+      let botText = "";
+      let botAdded = false;
+
+      const updateBotMessage = () => {
+        const newBotMessage = { 
+          text: botText, 
+          sender: "bot", 
+          timestamp: botTimestamp,
+          documentos
+        };
+        const replaceLast = botAdded;
+        setMessages(prev => replaceLast
+          ? [...prev.slice(0, -1), newBotMessage]
+          : [...prev, newBotMessage]);
+        botAdded = true;
       };
-      
-      setMessages(prev => [...prev, newBotMessage]);
+
+      // La respuesta llega como Server-Sent Events: meta, token..., done
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = "";
+
+      while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        const events = buffer.split("\n\n");
+        buffer = events.pop();
+
+        for (const rawEvent of events) {
+          let eventName = "message";
+          let data = "";
+          for (const line of rawEvent.split("\n")) {
+            if (line.startsWith("event:")) eventName = line.slice(6).trim();
+            else if (line.startsWith("data:")) data += line.slice(5).trim();
+          }
+          if (!data) continue;
+          const payload = JSON.parse(data);
+
+          if (eventName === "meta") {
+            setSessionId(payload.session_id);
+            documentos = payload.documentos;
+          } else if (eventName === "token") {
+            botText += payload.text;
+            setIsTyping(false);
+            updateBotMessage();
+          } else if (eventName === "error") {
+            throw new Error(payload.detail);
+          }
+        }
+      }
 
       // Solo sugerir registro si no hay documentos adjuntos
    